@@ -35,7 +35,7 @@ stock_data = [{
 } for row in cursor.fetchall()]
 # Create a dictionary from stock_data for quick lookup
 stock_dict = {normalize_name(stock['name']): stock['symbol'] for stock in stock_data}
-stock_symbols = [item['symbol'] for item in stock_data]
+stock_symbols = set(item['symbol'] for item in stock_data)
 
 etf_cursor = etf_con.cursor()
 etf_cursor.execute("PRAGMA journal_mode = wal")
@@ -46,15 +46,15 @@ etf_data = [{
 } for row in etf_cursor.fetchall()]
 # Create a dictionary from stock_data for quick lookup
 etf_dict = {normalize_name(etf['name']): etf['symbol'] for etf in etf_data}
-etf_symbols = [item['symbol'] for item in etf_data]
+etf_symbols = set(item['symbol'] for item in etf_data)
 
 
 crypto_cursor = crypto_con.cursor()
 crypto_cursor.execute("PRAGMA journal_mode = wal")
 crypto_cursor.execute("SELECT DISTINCT symbol FROM cryptos")
-crypto_symbols = [row[0] for row in crypto_cursor.fetchall()]
+crypto_symbols = set(row[0] for row in crypto_cursor.fetchall())
 
-total_symbols = stock_symbols + etf_symbols + crypto_symbols
+total_symbols = stock_symbols | etf_symbols | crypto_symbols
 con.close()
 etf_con.close()
 crypto_con.close()
@@ -96,6 +96,24 @@ class InstituteDatabase:
             name TEXT
         )
         """)
+        # One row per (fund, position); indexed both ways for "who holds X" and per-fund lookups
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS institute_holdings (
+            cik TEXT,
+            symbol TEXT,
+            securityName TEXT,
+            type TEXT,
+            sharesNumber INTEGER,
+            marketValue REAL,
+            weight REAL,
+            changeInSharesNumberPercentage REAL,
+            putCallShare TEXT,
+            avgPricePaid REAL
+        )
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_institute_holdings_cik ON institute_holdings (cik)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_institute_holdings_symbol ON institute_holdings (symbol)")
+        self.conn.commit()
 
 
     def get_column_type(self, value):
@@ -168,17 +186,17 @@ class InstituteDatabase:
                         ]
 
                         holdings_data.extend(parsed_data)
-                        portfolio_data['holdings'] = json.dumps(holdings_data)
 
             if not holdings_data:
                 self.cursor.execute("DELETE FROM institutes WHERE cik = ?", (cik,))
+                self.cursor.execute("DELETE FROM institute_holdings WHERE cik = ?", (cik,))
                 self.conn.commit()
                 return
 
             performance_percentages = [item.get("performancePercentage", 0) for item in holdings_data]
 
             #Filter information out that is not needed (yet)!
-            holdings_data = [{"symbol": item["symbol"], "securityName": item["securityName"], 'weight': item['weight'], 'sharesNumber': item['sharesNumber'], 'changeInSharesNumberPercentage': item['changeInSharesNumberPercentage'], 'putCallShare': item['putCallShare'], "marketValue": item["marketValue"], 'avgPricePaid': item['avgPricePaid']} for item in holdings_data]
+            holdings_data = [{"symbol": item["symbol"], "securityName": item["securityName"], 'type': item['type'], 'weight': item['weight'], 'sharesNumber': item['sharesNumber'], 'changeInSharesNumberPercentage': item['changeInSharesNumberPercentage'], 'putCallShare': item['putCallShare'], "marketValue": item["marketValue"], 'avgPricePaid': item['avgPricePaid']} for item in holdings_data]
 
             number_of_stocks = len(holdings_data)
             positive_performance_count = sum(1 for percentage in performance_percentages if percentage > 0)
@@ -203,6 +221,8 @@ class InstituteDatabase:
                 }
                 portfolio_data.update(data_dict)
 
+            self.save_holdings(cik, holdings_data)
+
             self.cursor.execute("PRAGMA table_info(institutes)")
             columns = {column[1]: column[2] for column in self.cursor.fetchall()}
 
@@ -223,6 +243,20 @@ class InstituteDatabase:
             print(f"Failed to fetch portfolio data for cik {cik}: {str(e)}")
 
 
+    def save_holdings(self, cik, holdings_data):
+        # Replace the fund's positions with one bulk insert
+        rows = [
+            (cik, item['symbol'], item['securityName'], item['type'], item['sharesNumber'], item['marketValue'],
+             item['weight'], item['changeInSharesNumberPercentage'], item['putCallShare'], item['avgPricePaid'])
+            for item in holdings_data
+        ]
+        self.cursor.execute("DELETE FROM institute_holdings WHERE cik = ?", (cik,))
+        self.cursor.executemany("""
+        INSERT INTO institute_holdings (cik, symbol, securityName, type, sharesNumber, marketValue, weight, changeInSharesNumberPercentage, putCallShare, avgPricePaid)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+
     async def save_insitute(self, institutes):
 
         institute_data = []
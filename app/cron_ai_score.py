@@ -1,12 +1,10 @@
 import orjson
 import asyncio
 import aiohttp
-import aiofiles
 import sqlite3
 from datetime import datetime
-from ml_models.score_model import ScorePredictor
-import yfinance as yf
-from collections import defaultdict
+from ml_models.score_model import ScorePredictor, save_shard, load_shard, shard_mtime, SHARD_DIR
+from utils.fundamentals_store import load_panel, select_statements, asof_join, statement_path
 import pandas as pd
 from tqdm import tqdm
 import concurrent.futures
@@ -14,12 +12,9 @@ import re
 from itertools import combinations
 from dotenv import load_dotenv
 import os
+import shutil
 from utils.feature_engineering import *
 
-import gc
-#Enable automatic garbage collection
-gc.enable()
-
 load_dotenv()
 api_key = os.getenv('FMP_API_KEY')
 
@@ -56,65 +51,53 @@ async def fetch_historical_price(ticker):
                 raise Exception(f"Error fetching data: {response.status} {response.reason}")
 
 
-async def download_data(ticker, con, start_date, end_date, skip_downloading, save_data):
-
-    file_path = f"ml_models/training_data/ai-score/{ticker}.json"
+statements = [
+    'ratios',
+    'key-metrics',
+    #'cash-flow-statement',
+    #'income-statement',
+    #'balance-sheet-statement',
+    'income-statement-growth',
+    'balance-sheet-statement-growth',
+    'cash-flow-statement-growth',
+]
+
+def get_statement_paths(ticker):
+    return [statement_path(statement, ticker) for statement in statements]
+
+def is_shard_fresh(ticker):
+    # A shard is reused until one of its statement files is rewritten with a new filing
+    built_at = shard_mtime(ticker)
+    if built_at is None:
+        return False
+    try:
+        return all(os.path.getmtime(path) <= built_at for path in get_statement_paths(ticker))
+    except OSError:
+        return False
 
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, 'rb') as file:
-                return pd.DataFrame(orjson.loads(file.read()))
-        except:
-            return pd.DataFrame()
+async def download_data(ticker, con, start_date, end_date, skip_downloading, save_data):
+    """
+    Build the ticker's training shard if it is missing or stale.
+    Returns the ticker when a usable shard exists, otherwise None.
+    """
+    if is_shard_fresh(ticker):
+        return ticker
     elif skip_downloading == False:
 
         try:
-            # Define paths to the statement files
-            statements = [
-                f"json/financial-statements/ratios/quarter/{ticker}.json",
-                f"json/financial-statements/key-metrics/quarter/{ticker}.json",
-                #f"json/financial-statements/cash-flow-statement/quarter/{ticker}.json",
-                #f"json/financial-statements/income-statement/quarter/{ticker}.json",
-                #f"json/financial-statements/balance-sheet-statement/quarter/{ticker}.json",
-                f"json/financial-statements/income-statement-growth/quarter/{ticker}.json",
-                f"json/financial-statements/balance-sheet-statement-growth/quarter/{ticker}.json",
-                f"json/financial-statements/cash-flow-statement-growth/quarter/{ticker}.json",
-                #f"json/financial-statements/owner-earnings/quarter/{ticker}.json",
-            ]
-
-            # Async loading and filtering
-            ignore_keys = ["symbol", "reportedCurrency", "calendarYear", "fillingDate", "acceptedDate", "period", "cik", "link", "finalLink","pbRatio","ptbRatio"]
-            async def load_and_filter_json(path):
-                async with aiofiles.open(path, 'r') as f:
-                    data = orjson.loads(await f.read())
-                return [{k: v for k, v in item.items() if k not in ignore_keys and int(item["date"][:4]) >= 2000} for item in data]
-
-            # Load all files concurrently
-            data = await asyncio.gather(*(load_and_filter_json(s) for s in statements))
-            ratios, key_metrics, income_growth, balance_growth, cashflow_growth = data
+            # Quarterly panel keyed by fiscal date, shared with the fundamental predictor
+            panel = load_panel(ticker)
+            if panel is None:
+                print(f'No statements for {ticker}')
+                return
+            panel = select_statements(panel, statements, ignore_keys=["pbRatio","ptbRatio"])
 
             #Threshold of enough datapoints needed!
-            if len(ratios) < 50:
+            ratio_columns = select_statements(panel, ['ratios']).columns.drop('date')
+            if panel[ratio_columns].notna().any(axis=1).sum() < 50:
                 print(f'Not enough data points for {ticker}')
                 return
 
-
-            # Combine all the data
-            combined_data = defaultdict(dict)
-
-            # Merge the data based on 'date'
-            for entries in zip(ratios,key_metrics, income_growth, balance_growth, cashflow_growth):
-                for entry in entries:
-                    try:
-                        date = entry['date']
-                        for key, value in entry.items():
-                            if key not in combined_data[date]:
-                                combined_data[date][key] = value
-                    except:
-                        pass
-
-            combined_data = list(combined_data.values())
-
             # Download historical stock data using yfinance
             df = await fetch_historical_price(ticker)
             # Get the list of columns in df
@@ -131,43 +114,11 @@ async def download_data(ticker, con, start_date, end_date, skip_downloading, sav
             ta_columns = df_ta_filtered.columns.tolist()
             stats_columns = df_stats_filtered.columns.tolist()
 
-            # Concatenate df with the filtered df_stats and df_ta
-            df = pd.concat([df, df_ta_filtered, df_stats_filtered], axis=1)
-
-            # Set up a dictionary for faster lookup of close prices and columns by date
-            df_dict = df.set_index('date').to_dict(orient='index')
-
-            # Helper function to find closest date within max_attempts
-            def find_closest_date(target_date, max_attempts=10):
-                counter = 0
-                while target_date not in df_dict and counter < max_attempts:
-                    target_date = (pd.to_datetime(target_date) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
-                    counter += 1
-                return target_date if target_date in df_dict else None
-
-            # Match combined data entries with stock data
-            for item in combined_data:
-                target_date = item['date']
-                closest_date = find_closest_date(target_date)
-
-                # Skip if no matching date is found
-                if not closest_date:
-                    continue
-
-                # Fetch data from the dictionary for the closest matching date
-                data = df_dict[closest_date]
-
-                # Add close price to the item
-                item['price'] = round(data['close'], 2)
-
-                # Dynamically add indicator values from ta_columns and stats_columns
-                for column in ta_columns+stats_columns:
-                    item[column] = data.get(column, None)
+            # Close price and indicator values by trading day
+            df = pd.concat([df[['date']], df['close'].round(2).rename('price'), df_ta_filtered, df_stats_filtered], axis=1)
 
-            # Sort the combined data by date
-            combined_data = sorted(combined_data, key=lambda x: x['date'])
-            # Convert combined data to a DataFrame and drop rows with NaN values
-            df_combined = pd.DataFrame(combined_data).dropna()
+            # Closest trading day on or before each fiscal date, at most 10 days back
+            df_combined = asof_join(panel, df, tolerance_days=10).dropna()
             
             fundamental_columns = [
                 'revenue', 'costOfRevenue', 'grossProfit', 'netIncome', 'operatingIncome', 'operatingExpenses',
@@ -212,15 +163,11 @@ async def download_data(ticker, con, start_date, end_date, skip_downloading, sav
             # Create 'Target' column to indicate if the next price is higher than the current one
             df_combined['Target'] = ((df_combined['price'].shift(-1) - df_combined['price']) / df_combined['price'] > 0).astype(int)
 
-            # Copy DataFrame and round float values
-            df_copy = df_combined.copy().map(lambda x: round(x, 2) if isinstance(x, float) else x)
-
-            # Save to a file if there are rows in the DataFrame
-            if not df_copy.empty and save_data == True:
-                with open(file_path, 'wb') as file:
-                    file.write(orjson.dumps(df_copy.to_dict(orient='records')))
-
-            return df_copy
+            # Save the float32 shard if there are rows in the DataFrame
+            if not df_combined.empty and save_data == True:
+                feature_columns = [col for col in df_combined.columns if col not in ['date', 'price', 'Target']]
+                save_shard(ticker, df_combined, feature_columns)
+                return ticker
 
         except Exception as e:
             print(e)
@@ -252,81 +199,54 @@ async def warm_start_training(tickers, con, skip_downloading, save_data):
     end_date = datetime.today().strftime("%Y-%m-%d")
     test_size = 0.2
 
-    dfs = await chunked_gather(tickers, con, start_date, end_date, skip_downloading, save_data, chunk_size=100)
-    
-    train_list = []
-    test_list = []
-
-    for df in dfs:
-        try:
-            # Split the data into training and testing sets
-            split_size = int(len(df) * (1 - test_size))
-            train_data = df.iloc[:split_size]
-            test_data = df.iloc[split_size:]
-
-            # Append train data for combined training
-            train_list.append(train_data)
-            test_list.append(test_data)
-        except:
-            pass
-
-    # Concatenate all train data together
-    df_train = pd.concat(train_list, ignore_index=True)
-    df_test = pd.concat(test_list, ignore_index=True)
-
-    # Shuffle the combined training data
-    df_train = df_train.sample(frac=1, random_state=42).reset_index(drop=True)
-    df_test = df_test.sample(frac=1, random_state=42).reset_index(drop=True)
+    # Only shard tickers are kept in memory; the trainer streams the shards from disk
+    results = await chunked_gather(tickers, con, start_date, end_date, skip_downloading, save_data, chunk_size=100)
+    shard_tickers = [ticker for ticker in results if ticker]
 
-    print('======Warm Start Train Set Datapoints======')
-    print(len(df_train))
-    
     predictor = ScorePredictor()
-    selected_features = [col for col in df_train if col not in ['price', 'date', 'Target']]
-    predictor.warm_start_training(df_train[selected_features], df_train['Target'])
-    predictor.evaluate_model(df_test[selected_features], df_test['Target'])
+    predictor.warm_start_training_from_shards(shard_tickers, test_size)
     return predictor
 
-async def fine_tune_and_evaluate(ticker, con, start_date, end_date, skip_downloading, save_data):
-    try:
-        df = await download_data(ticker, con, start_date, end_date, skip_downloading, save_data)
-        if df is None or len(df) == 0:
-            print(f"No data available for {ticker}")
-            return
-        
-        test_size = 0.2
-        split_size = int(len(df) * (1-test_size))
-        train_data = df.iloc[:split_size]
-        test_data = df.iloc[split_size:]
-        
-        selected_features = [col for col in df.columns if col not in ['date','price','Target']]
-        # Fine-tune the model
-        predictor = ScorePredictor()
-        #predictor.fine_tune_model(train_data[selected_features], train_data['Target'])
-        
-        print(f"Evaluating fine-tuned model for {ticker}")
-        data = predictor.evaluate_model(test_data[selected_features], test_data['Target'])
-        
+async def batch_evaluate(tickers, con, start_date, end_date, skip_downloading, save_data, predictor=None):
+    test_size = 0.2
+    test_sets = {}
+
+    results = await chunked_gather(tickers, con, start_date, end_date, skip_downloading, save_data, chunk_size=100)
+    for ticker in results:
+        if not ticker:
+            continue
+        try:
+            columns, features, target = load_shard(ticker)
+        except Exception as e:
+            print(f"No data available for {ticker}: {e}")
+            continue
+        split_size = int(len(target) * (1-test_size))
+        if split_size == len(target):
+            continue
+        test_sets[ticker] = (pd.DataFrame(np.asarray(features[split_size:]), columns=columns), np.asarray(target[split_size:]))
+
+    # Model and scaler are loaded once; all tickers are scored in one batched predict call
+    predictor = predictor or ScorePredictor()
+    results = predictor.batch_evaluate(test_sets)
+
+    saved = 0
+    for ticker, data in results.items():
         if (data['precision'] >= 50 and data['accuracy'] >= 50 and
         data['accuracy'] < 100 and data['precision'] < 100 and
         data['f1_score'] >= 50 and data['recall_score'] >= 50 and
         data['roc_auc_score'] >= 50):
             await save_json(ticker, data)
-            print(f"Saved results for {ticker}")
-        
-    except Exception as e:
-        print(f"Error processing {ticker}: {e}")
+            saved += 1
 
-    finally:
-        gc.collect()  # Force the garbage collector to release unreferenced memory
+    print(f"Saved results for {saved} of {len(results)} evaluated tickers")
 
 async def run():
     train_mode = True  # Set this to False for fine-tuning and evaluation
     skip_downloading = False
     save_data = True
-    delete_data = True
+    delete_data = False # Shards are rebuilt only when their statement files change
     if delete_data:
-        delete_files_in_directory("ml_models/training_data/ai-score")
+        shutil.rmtree(SHARD_DIR, ignore_errors=True)
 
     con = sqlite3.connect('stocks.db')
     cursor = con.cursor()
@@ -347,8 +267,7 @@ async def run():
         print(f"Total tickers for fine-tuning: {len(stock_symbols)}")
         start_date = datetime(1995, 1, 1).strftime("%Y-%m-%d")
         end_date = datetime.today().strftime("%Y-%m-%d")
-        for ticker in tqdm(stock_symbols):
-            await fine_tune_and_evaluate(ticker, con, start_date, end_date, skip_downloading, save_data)
+        await batch_evaluate(stock_symbols, con, start_date, end_date, skip_downloading, save_data, predictor)
         
     
     con.close()
@@ -1,18 +1,14 @@
-import requests
 from datetime import datetime, timedelta
-import numpy as np
-from scipy.stats import norm
-import time
 import sqlite3
 import ujson
+import orjson
 import os
 from dotenv import load_dotenv
-from tqdm import tqdm 
+from tqdm import tqdm
 import pandas as pd
 from collections import Counter
 import aiohttp
 import asyncio
-import statistics
 
 
 load_dotenv()
@@ -20,44 +16,46 @@ api_key = os.getenv('BENZINGA_API_KEY')
 
 headers = {"accept": "application/json"}
 
-query_template = """
-    SELECT date, close
-    FROM "{ticker}"
-    WHERE date BETWEEN ? AND ?
-"""
 buy_ratings = ['Outperform', 'Overweight', 'Market Outperform', 'Buy', 'Positive', 'Sector Outperform']
 
 sell_ratings = ['Negative', 'Underperform', 'Underweight', 'Reduce', 'Sell']
 
-ticker_price_cache = {} # Dictionary to store cached price data for tickers
+excluded_keys = {'url_news', 'url', 'url_calendar', 'updated', 'time', 'currency'}
 
-# Define a function to remove duplicates based on a key
-def remove_duplicates(data, key):
-    seen = set()
-    new_data = []
-    for item in data:
-        if item[key] not in seen:
-            seen.add(item[key])
-            new_data.append(item)
-    return new_data
-
-def extract_sector(ticker, con):
-    
-    query_template = f"""
-    SELECT 
-        sector
-    FROM 
-        stocks
-    WHERE
-        symbol = ?
-    """
+# Every rating fetched so far, one row per rating id; _analyst is the analyst id it was fetched for
+ratings_path = "json/analyst/ratings.pkl"
+
+start_date = '2015-01-01'
+max_concurrency = 10
+
+
+def write_if_changed(path, data):
+    # Unchanged payloads are left alone so their mtime (and the API caches) stay valid
+    content = orjson.dumps(data)
     try:
-        df = pd.read_sql_query(query_template, con, params=(ticker,))
-        sector = df['sector'].iloc[0]
-    except:
-        sector = None
+        with open(path, 'rb') as file:
+            if file.read() == content:
+                return False
+    except OSError:
+        pass
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+    return True
+
+
+async def fetch_json(session, semaphore, url, params):
+    # Every Benzinga request of the job goes through the same semaphore
+    async with semaphore:
+        try:
+            async with session.get(url, headers=headers, params=params) as response:
+                if response.status != 200:
+                    return None
+                return ujson.loads(await response.text())
+        except Exception:
+            return None
 
-    return sector
 
 def calculate_rating(data):
     overall_average_return = float(data['avgReturn'])
@@ -119,67 +117,59 @@ def calculate_rating(data):
 
         return round(normalized_rating, 2)
 
-def get_top_stocks():
-    with open(f"json/analyst/all-analyst-data.json", 'r') as file:
-        analyst_stats_list = ujson.load(file)
-
-    filtered_data = [item for item in analyst_stats_list if item['analystScore'] >= 4]
-
-    res_list = []
-    # Define the date range for the past 12 months
-    end_date = datetime.now().date()
-    start_date = end_date - timedelta(days=365)
-
-    res_list = []
-    for item in filtered_data:
-        ticker_list = item['ratingsList']
-        # Filter by 'Strong Buy' and ensure the rating is within the last 12 months
-        ticker_list = [{'ticker': i['ticker'], 'adjusted_pt_current': i['adjusted_pt_current'], 'date': i['date']} 
-                       for i in ticker_list 
-                       if i['rating_current'] == 'Strong Buy' 
-                       and start_date <= datetime.strptime(i['date'], '%Y-%m-%d').date() <= end_date]
-        if len(ticker_list) > 0:
-            res_list += ticker_list
-
-    # Create a dictionary to store ticker occurrences and corresponding pt_current values
-    ticker_data = {}
-    for item in res_list:
-        ticker = item['ticker']
-        pt_current_str = item['adjusted_pt_current']
-        if pt_current_str:  # Skip empty strings
-            pt_current = float(pt_current_str)
-            if ticker in ticker_data:
-                ticker_data[ticker]['pt_list'].append(pt_current)
-            else:
-                ticker_data[ticker] = {'pt_list': [pt_current]}
-
-    for ticker, info in ticker_data.items():
+def load_ratings():
+    try:
+        return pd.read_pickle(ratings_path)
+    except Exception:
+        pass
+    # First run: seed the table from the previous full export instead of refetching every analyst
+    try:
+        with open("json/analyst/all-analyst-data.json", 'rb') as file:
+            analyst_list = orjson.loads(file.read())
+        rows = [{**rating, '_analyst': item['analystId']} for item in analyst_list for rating in item.get('ratingsList', [])]
+        return pd.DataFrame(rows)
+    except Exception:
+        return pd.DataFrame(columns=['_analyst', 'id', 'ticker', 'date', 'rating_current', 'adjusted_pt_current'])
+
+
+def save_ratings(ratings):
+    tmp_path = f"{ratings_path}.tmp"
+    ratings.to_pickle(tmp_path)
+    os.replace(tmp_path, ratings_path)
+
+
+def get_top_stocks(ratings, analyst_scores):
+    # Strong buys of 4+ score analysts over the last 12 months, grouped by ticker in one pass
+    end_date = datetime.now().strftime('%Y-%m-%d')
+    start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+
+    top_analysts = [analyst_id for analyst_id, score in analyst_scores.items() if score >= 4]
+    df = ratings[ratings['_analyst'].isin(top_analysts)
+                 & (ratings['rating_current'] == 'Strong Buy')
+                 & (ratings['date'] >= start_date) & (ratings['date'] <= end_date)]
+    df = df[df['adjusted_pt_current'].notna() & (df['adjusted_pt_current'] != '')]
+    # Keep the analyst ranking order so ties on the counter are broken the same way as before
+    df = df.assign(_order=df['_analyst'].map({analyst_id: i for i, analyst_id in enumerate(top_analysts)}))
+    df = df.sort_values('_order', kind='stable')
+    pt = df['adjusted_pt_current'].astype(float).groupby(df['ticker'], sort=False).agg(['median', 'size'])
+
+    result = []
+    for ticker, row in pt.iterrows():
         try:
             with open(f"json/quote/{ticker}.json", 'r') as file:
                 res = ujson.load(file)
-            info['price'] = res.get('price', None)
-            info['name'] = res.get('name', None)
-            info['marketCap'] = res.get('marketCap', None)
         except:
-            info['price'] = None
-            info['name'] = None
-            info['marketCap'] = None
-
-    # Calculate median pt_current for each ticker
-    for ticker, info in ticker_data.items():
-        if info['pt_list']:
-            info['median'] = round(statistics.median(info['pt_list']), 2)
-    
-    # Convert the dictionary back to a list format
-    result = [{'ticker': ticker, 
-               'upside': round((info['median']/info.get('price')-1)*100, 2) if info.get('price') else None, 
-               'priceTarget': info['median'], 
-               'price': info['price'], 
-               'counter': len(info['pt_list']), 
-               'name': info['name'], 
-               'marketCap': info['marketCap']} 
-              for ticker, info in ticker_data.items()]
-    
+            res = {}
+        price = res.get('price', None)
+        median = round(float(row['median']), 2)
+        result.append({'ticker': ticker,
+                       'upside': round((median/price-1)*100, 2) if price else None,
+                       'priceTarget': median,
+                       'price': price,
+                       'counter': int(row['size']),
+                       'name': res.get('name', None),
+                       'marketCap': res.get('marketCap', None)})
+
     result = [item for item in result if item['upside'] is not None and item['upside'] >= 5 and item['upside'] <= 250]  # Filter outliers
 
     result_sorted = sorted(result, key=lambda x: x['counter'] if x['counter'] is not None else float('-inf'), reverse=True)
@@ -187,228 +177,215 @@ def get_top_stocks():
     for rank, item in enumerate(result_sorted):
         item['rank'] = rank + 1
 
-    with open(f"json/analyst/top-stocks.json", 'w') as file:
-        ujson.dump(result_sorted, file)
+    write_if_changed("json/analyst/top-stocks.json", result_sorted)
 
 
-async def get_analyst_ratings(analyst_id, session):
+async def get_analyst_ratings(analyst_id, session, semaphore, date_from):
+    # Returns None when any page failed: a partial history would move the analyst's resume date past the gap
     url = "https://api.benzinga.com/api/v2.1/calendar/ratings"
     res_list = []
-    
+
     for page in range(5):
-        try:
-            querystring = {
-                "token": api_key,
-                "parameters[analyst_id]": analyst_id,
-                "page": str(page),
-                "pagesize": "1000"
-            }
-            async with session.get(url, headers=headers, params=querystring) as response:
-                data = await response.json()
-                ratings = data.get('ratings', [])
-                if not ratings:
-                    break  # Stop fetching if no more ratings
-                res_list += ratings
-        except Exception as e:
-            #print(f"Error fetching page {page} for analyst {analyst_id}: {e}")
-            break
-
-
-    # Date filter: only include items with 'date' >= '2015-01-01'
-    filtered_data = [
-        {key: value for key, value in item.items() if key not in {'url_news', 'url', 'url_calendar', 'updated', 'time', 'currency'}}
+        querystring = {
+            "token": api_key,
+            "parameters[analyst_id]": analyst_id,
+            "parameters[date_from]": date_from,
+            "page": str(page),
+            "pagesize": "1000"
+        }
+        data = await fetch_json(session, semaphore, url, querystring)
+        if data is None:
+            return None
+        ratings = data.get('ratings', [])
+        res_list += ratings
+        if len(ratings) < 1000:
+            break  # Short page: nothing left to fetch
+
+    return [
+        {key: value for key, value in item.items() if key not in excluded_keys}
         for item in res_list
-        if datetime.strptime(item['date'], '%Y-%m-%d') >= datetime(2015, 1, 1)
+        if item['date'] >= start_date
     ]
 
-    return filtered_data
 
-async def get_all_analyst_stats():
+async def get_all_analyst_stats(session, semaphore):
     url = "https://api.benzinga.com/api/v2.1/calendar/ratings/analysts"
-    res_list = []
 
-    async with aiohttp.ClientSession() as session:
-        tasks = [
-            session.get(url, headers=headers, params={"token": api_key, "page": str(page), 'pagesize': "1000"})
-            for page in range(100)
-        ]
-
-        # Gather responses concurrently
-        responses = await asyncio.gather(*tasks)
-        
-        # Process each response
-        for response in responses:
-            if response.status == 200:  # Check for successful response
-                try:
-                    data = ujson.loads(await response.text())['analyst_ratings_analyst']
-                    res_list += data
-                except Exception as e:
-                    pass
+    tasks = [fetch_json(session, semaphore, url, {"token": api_key, "page": str(page), 'pagesize': "1000"}) for page in range(100)]
+    res_list = []
+    for data in await asyncio.gather(*tasks):
+        try:
+            res_list += data['analyst_ratings_analyst']
+        except Exception:
+            pass
 
     # Remove duplicates of analysts and filter based on ratings accuracy
-    res_list = remove_duplicates(res_list, 'id')
-    res_list = [item for item in res_list if item.get('ratings_accuracy', {}).get('total_ratings', 0) != 0]
-
-    # Construct the final result list
-    final_list = [{
-        'analystName': item['name_full'],
-        'companyName': item['firm_name'],
-        'analystId': item['id'],
-        'firmId': item['firm_id'],
-        'avgReturn': item['ratings_accuracy'].get('overall_average_return', 0),
-        'successRate': item['ratings_accuracy'].get('overall_success_rate', 0),
-        'totalRatings': item['ratings_accuracy'].get('total_ratings', 0),
-    } for item in res_list]
+    seen = set()
+    final_list = []
+    for item in res_list:
+        if item['id'] in seen or item.get('ratings_accuracy', {}).get('total_ratings', 0) == 0:
+            continue
+        seen.add(item['id'])
+        final_list.append({
+            'analystName': item['name_full'],
+            'companyName': item['firm_name'],
+            'analystId': item['id'],
+            'firmId': item['firm_id'],
+            'avgReturn': item['ratings_accuracy'].get('overall_average_return', 0),
+            'successRate': item['ratings_accuracy'].get('overall_success_rate', 0),
+            'totalRatings': item['ratings_accuracy'].get('total_ratings', 0),
+        })
 
     return final_list
 
-async def process_analyst(item, con, session, start_date, end_date):
-    # Fetch analyst ratings
-    data = await get_analyst_ratings(item['analystId'], session)
-    item['ratingsList'] = data
-    item['totalRatings'] = len(data)
-    item['lastRating'] = data[0]['date'] if data else None
-    item['numOfStocks'] = len({d['ticker'] for d in data})
 
-    total_return = 0
-    valid_ratings_count = 0
-    success_count = 0  # To track successful ratings for success rate calculation
+async def fetch_new_ratings(analyst_list, ratings):
+    """
+    Known analysts are only asked for ratings since their last stored date.
+    Returns the updated table and the ids of analysts that received ratings not seen before.
+    """
+    last_dates = ratings.groupby('_analyst')['date'].max().to_dict() if not ratings.empty else {}
+    semaphore = asyncio.Semaphore(max_concurrency)
 
-    for stock in data:
+    async with aiohttp.ClientSession() as session:
+        async def fetch(item):
+            analyst_id = item['analystId']
+            data = await get_analyst_ratings(analyst_id, session, semaphore, last_dates.get(analyst_id, start_date))
+            if data is None:
+                # Dropped for this run; the next run asks again from the same date
+                return []
+            return [{**rating, '_analyst': analyst_id} for rating in data]
+
+        rows = []
+        tasks = [fetch(item) for item in analyst_list]
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+            rows += await task
+
+    fetched = pd.DataFrame(rows)
+    if fetched.empty:
+        return ratings, set()
+
+    known_ids = set(ratings['id']) if not ratings.empty else set()
+    changed = set(fetched.loc[~fetched['id'].isin(known_ids), '_analyst'])
+
+    # Fetched rows replace stored ones with the same id; newest first like the API returns them
+    ratings = pd.concat([fetched, ratings], ignore_index=True).drop_duplicates(subset=['id'], keep='first')
+    ratings = ratings.sort_values('date', ascending=False, kind='stable').reset_index(drop=True)
+    return ratings, changed
+
+
+def load_prices(tickers, con, end_date):
+    # Long (ticker, date, close) frame read once per ticker from the local OHLC tables
+    frames = []
+    for ticker in tqdm(tickers):
         try:
-            ticker = stock['ticker']
-            rating_date = stock['date']
-            rating_current = stock['rating_current']
-
-            # Skip neutral or undefined ratings
-            if rating_current not in buy_ratings and rating_current not in sell_ratings:
-                continue
-
-            # Check if the ticker data is already cached
-            if ticker not in ticker_price_cache:
-                # If not cached, query the stock data and cache it
-                query = query_template.format(ticker=ticker)
-                df = pd.read_sql_query(query, con, params=(start_date, end_date))
-                ticker_price_cache[ticker] = df
-            else:
-                # Use cached data
-                df = ticker_price_cache[ticker]
-
-            # Ensure we have data for the rating date
-            rating_date_data = df[df['date'] == rating_date]
-            if rating_date_data.empty:
-                # Try finding the closest date within a few days if exact date is missing
-                for days_offset in range(1, 5):
-                    closest_date = (pd.to_datetime(rating_date) - pd.Timedelta(days=days_offset)).strftime('%Y-%m-%d')
-                    rating_date_data = df[df['date'] == closest_date]
-                    if not rating_date_data.empty:
-                        break
-
-            if rating_date_data.empty:
-                continue  # Skip if no close price data found
-
-            # Get close price on rating date
-            close_price_on_rating = rating_date_data['close'].values[0]
-
-            # Calculate the date 12 months later
-            future_date = (pd.to_datetime(rating_date) + pd.DateOffset(months=12)).strftime('%Y-%m-%d')
-
-            # Try to find the close price 12 months later
-            future_date_data = df[df['date'] == future_date]
-            if future_date_data.empty:
-                # If 12 months price isn't available, use the latest available price
-                future_date_data = df.iloc[-1]  # Use the last available price
-                if future_date_data.empty:
-                    continue  # If no future data, skip this rating
-
-            close_price_in_future = future_date_data['close'] if isinstance(future_date_data, pd.Series) else future_date_data['close'].values[0]
-
-            # Calculate return
-            stock_return = (close_price_in_future - close_price_on_rating) / close_price_on_rating
-            total_return += stock_return
-            valid_ratings_count += 1
-
-            # Determine if the rating was successful
-            if rating_current in buy_ratings:
-                if close_price_in_future > close_price_on_rating:
-                    success_count += 1  # Success for buy ratings
-            elif rating_current in sell_ratings:
-                if close_price_in_future < close_price_on_rating:
-                    success_count += 1  # Success for sell ratings
-        except:
-            pass
+            df = pd.read_sql_query(f'SELECT date, close FROM "{ticker}" WHERE date BETWEEN ? AND ?', con, params=(start_date, end_date))
+        except Exception:
+            continue
+        if not df.empty:
+            df['ticker'] = ticker
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=['ticker', 'date', 'close'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def compute_performance(ratings, prices):
+    """
+    Per analyst average 12 month return and success rate of buy/sell calls, in percent.
+    The entry price is the close on the rating date or up to 4 days before; the exit is the
+    close 12 months later, or the latest close when that date is not in the price table.
+    """
+    rated = ratings.loc[ratings['rating_current'].isin(buy_ratings + sell_ratings), ['_analyst', 'ticker', 'date', 'rating_current']]
+    prices = prices.dropna(subset=['close']).drop_duplicates(subset=['ticker', 'date'])
+    if rated.empty or prices.empty:
+        return pd.DataFrame(columns=['avgReturn', 'successRate'])
 
-    # Calculate average return if there are valid ratings
-    if valid_ratings_count > 0:
-        item['avgReturn'] = round(total_return / valid_ratings_count * 100, 2)  # Percentage format
-    else:
-        item['avgReturn'] = 0
+    rated = rated.assign(ticker=rated['ticker'].astype(str), _date=pd.to_datetime(rated['date'], errors='coerce')).dropna(subset=['_date'])
+    prices = prices.assign(ticker=prices['ticker'].astype(str), _date=pd.to_datetime(prices['date']))
 
-    # Calculate success rate
-    if valid_ratings_count > 0:
-        item['successRate'] = round(success_count / valid_ratings_count * 100, 2)  # Success rate in percentage
-    else:
-        item['successRate'] = 0
+    entry = pd.merge_asof(
+        rated.sort_values('_date'),
+        prices[['ticker', '_date', 'close']].sort_values('_date'),
+        on='_date', by='ticker', direction='backward', tolerance=pd.Timedelta(days=4),
+    ).dropna(subset=['close']).reset_index(drop=True)
 
-    # Populate other stats and score
-    stats_dict = {
-        'avgReturn': item.get('avgReturn', 0),
-        'successRate': item.get('successRate', 0),
-        'totalRatings': item['totalRatings'],
-        'lastRating': item['lastRating'],
-    }
+    entry['_future'] = entry['_date'] + pd.DateOffset(months=12)
+    exit_price = entry.merge(prices[['ticker', '_date', 'close']].rename(columns={'_date': '_future', 'close': 'exit'}), on=['ticker', '_future'], how='left')['exit']
+    latest_close = prices.sort_values('date').groupby('ticker')['close'].last()
+    entry['exit'] = exit_price.fillna(entry['ticker'].map(latest_close))
 
-    item['analystScore'] = calculate_rating(stats_dict)
+    entry['return'] = (entry['exit'] - entry['close']) / entry['close']
+    is_buy = entry['rating_current'].isin(buy_ratings)
+    entry['success'] = (is_buy & (entry['exit'] > entry['close'])) | (~is_buy & (entry['exit'] < entry['close']))
 
-async def get_single_analyst_data(analyst_list, con):
-    start_date = '2015-01-01'
-    end_date = datetime.today().strftime("%Y-%m-%d")
+    grouped = entry.groupby('_analyst')
+    return pd.DataFrame({
+        'avgReturn': (grouped['return'].mean() * 100).round(2),
+        'successRate': (grouped['success'].mean() * 100).round(2),
+    })
+
+
+def main_sectors(ratings, con):
+    # One lookup table instead of a query per rated ticker
+    sector_map = dict(con.execute("SELECT symbol, sector FROM stocks").fetchall())
+    sectors = ratings['ticker'].map(sector_map).astype(object).where(lambda s: s.notna(), None)
+    res = {}
+    for analyst_id, group in sectors.groupby(ratings['_analyst'], sort=False):
+        res[analyst_id] = [sector for sector, _ in Counter(group.tolist()).most_common(3) if sector is not None]
+    return res
+
+
+def ratings_records(group):
+    group = group.drop(columns=['_analyst'])
+    return group.astype(object).where(group.notna(), None).to_dict('records')
 
-    async with aiohttp.ClientSession() as session:
-        tasks = [process_analyst(item, con, session, start_date, end_date) for item in analyst_list]
-        for task in tqdm(asyncio.as_completed(tasks), total=len(analyst_list)):
-            await task
 
 async def run():
     # Step1: Get all analyst id's and stats
     con = sqlite3.connect('stocks.db')
-    analyst_list = await get_all_analyst_stats()
+    async with aiohttp.ClientSession() as session:
+        analyst_list = await get_all_analyst_stats(session, asyncio.Semaphore(max_concurrency))
     print('Number of analysts:', len(analyst_list))
-    
-    #Test Mode
-    #analyst_list = [ item for item in analyst_list if item['analystId'] =='597f5b95c1f5580001ef542a']
 
-    # Step2: Get rating history for each individual analyst and score the analyst
-    await get_single_analyst_data(analyst_list, con)
-    try:
-        print('Start extracting main sectors')
-        for item in tqdm(analyst_list):
-            ticker_list = [entry['ticker'] for entry in item['ratingsList']]
-            sector_list = []
-            for ticker in ticker_list:
-                sector = extract_sector(ticker, con)
-                sector_list.append(sector)
-
-            sector_counts = Counter(sector_list)
-            main_sectors = sector_counts.most_common(3)
-            main_sectors = [item[0] for item in main_sectors if item[0] is not None]
-            item['mainSectors'] = main_sectors
-
-    except Exception as e:
-        print(e)
+    # Step2: Fetch only new ratings per analyst into the columnar ratings table
+    ratings, changed = await fetch_new_ratings(analyst_list, load_ratings())
+    save_ratings(ratings)
+    print('Analysts with new ratings:', len(changed))
+
+    analyst_ids = {item['analystId'] for item in analyst_list}
+    ratings = ratings[ratings['_analyst'].isin(analyst_ids)]
+
+    # Step3: Returns and success rates of every analyst against the local price store
+    prices = load_prices(sorted(set(ratings['ticker'].dropna())), con, datetime.today().strftime("%Y-%m-%d"))
+    performance = compute_performance(ratings, prices)
+    sectors = main_sectors(ratings, con)
+    groups = {analyst_id: group for analyst_id, group in ratings.groupby('_analyst', sort=False)}
+
+    for item in analyst_list:
+        group = groups.get(item['analystId'])
+        total_ratings = len(group) if group is not None else 0
+        item['totalRatings'] = total_ratings
+        item['lastRating'] = group['date'].iloc[0] if total_ratings else None
+        item['numOfStocks'] = int(group['ticker'].nunique()) if total_ratings else 0
+        item['avgReturn'] = float(performance['avgReturn'].get(item['analystId'], 0))
+        item['successRate'] = float(performance['successRate'].get(item['analystId'], 0))
+        item['analystScore'] = calculate_rating(item)
+        item['mainSectors'] = sectors.get(item['analystId'], [])
 
     # Sort analysts by score
     analyst_list = sorted(analyst_list, key=lambda x: (float(x['analystScore']), float(x['avgReturn']), float(x['successRate'])), reverse=True)
     number_of_all_analysts = len(analyst_list)
 
-    # Assign rank and other metrics to analysts
-    for rank, item in enumerate(analyst_list):
+    # Rank, attach the ratings and rewrite the analyst files whose content changed
+    written = 0
+    for rank, item in enumerate(tqdm(analyst_list)):
         item['rank'] = rank + 1
         item['numOfAnalysts'] = number_of_all_analysts
-        item['avgReturn'] = round(float(item['avgReturn']), 2)
-        item['successRate'] = round(float(item['successRate']), 2)
-        with open(f"json/analyst/analyst-db/{item['analystId']}.json", 'w') as file:
-            ujson.dump(item, file)
+        group = groups.get(item['analystId'])
+        item['ratingsList'] = ratings_records(group) if group is not None else []
+        written += write_if_changed(f"json/analyst/analyst-db/{item['analystId']}.json", item)
+    print('Analyst files rewritten:', written)
 
     # Save top 100 analysts
     top_analysts_list = []
@@ -425,15 +402,14 @@ async def run():
             'lastRating': item['lastRating']
         })
 
-    with open(f"json/analyst/top-analysts.json", 'w') as file:
-        ujson.dump(top_analysts_list, file)
+    write_if_changed("json/analyst/top-analysts.json", top_analysts_list)
 
     # Save all analyst data in raw form for the next step
-    with open(f"json/analyst/all-analyst-data.json", 'w') as file:
-        ujson.dump(analyst_list, file)
+    with open(f"json/analyst/all-analyst-data.json", 'wb') as file:
+        file.write(orjson.dumps(analyst_list))
 
     # Save top stocks with strong buys from 5-star analysts
-    get_top_stocks()
+    get_top_stocks(ratings, {item['analystId']: item['analystScore'] for item in analyst_list})
 
     # Close the connection
     con.close()
@@ -441,4 +417,3 @@ async def run():
 
 if __name__ == "__main__":
     asyncio.run(run())
-    
\ No newline at end of file
@@ -1,53 +1,16 @@
-import ujson
 import asyncio
 import aiohttp
 import sqlite3
 from tqdm import tqdm
 from dotenv import load_dotenv
 import os
-import time
+from utils.rate_limit import TokenBucket
+from utils.news_store import SeenIndex, filter_and_deduplicate, merge_news, load_news, write_payload
 
 load_dotenv()
 api_key = os.getenv('FMP_API_KEY')
 
-class RateLimiter:
-    def __init__(self, rate_limit=200, sleep_time=60):
-        self.rate_limit = rate_limit
-        self.sleep_time = sleep_time
-        self.request_count = 0
-        self.lock = asyncio.Lock()
-
-    async def acquire(self):
-        async with self.lock:
-            self.request_count += 1
-            if self.request_count >= self.rate_limit:
-                print(f"Processed {self.rate_limit} requests. Sleeping for {self.sleep_time} seconds...")
-                await asyncio.sleep(self.sleep_time)
-                self.request_count = 0
-
-async def filter_and_deduplicate(data, excluded_domains=None, deduplicate_key='title'):
-    """
-    Filter out items with specified domains in their URL and remove duplicates based on a specified key.
-    """
-    if excluded_domains is None:
-        excluded_domains = ['prnewswire.com', 'globenewswire.com', 'accesswire.com']
-    seen_keys = set()
-    filtered_data = []
-    for item in data:
-        if not any(domain in item['url'] for domain in excluded_domains):
-            key = item.get(deduplicate_key)
-            if key and key not in seen_keys:
-                filtered_data.append(item)
-                seen_keys.add(key)
-    return filtered_data
-
-async def save_json(symbol, data):
-    """
-    Save data as JSON in a batch to reduce disk I/O
-    """
-    async with asyncio.Lock():  # Ensure thread-safe writes
-        with open(f"json/market-news/companies/{symbol}.json", 'w') as file:
-            ujson.dump(data, file)
+news_per_symbol = 200  # Size of each symbol's news ring buffer
 
 async def get_data(session, chunk, rate_limiter):
     """
@@ -72,22 +35,33 @@ def get_symbols(db_name, table_name):
         cursor.execute(f"SELECT DISTINCT symbol FROM {table_name} WHERE symbol NOT LIKE '%.%'")
         return [row[0] for row in cursor.fetchall()]
 
-async def process_chunk(session, chunk, rate_limiter):
+async def process_chunk(session, chunk, rate_limiter, seen_index):
     """
-    Process a chunk of symbols
+    Process a chunk of symbols; returns the number of rewritten news files
     """
     data = await get_data(session, chunk, rate_limiter)
-    tasks = []
-    for symbol in chunk:
+
+    # One pass grouping the response by symbol
+    news_by_symbol = {symbol: [] for symbol in chunk}
+    for item in data:
+        if item.get('symbol') in news_by_symbol:
+            news_by_symbol[item['symbol']].append(item)
+
+    changed = 0
+    for symbol, items in news_by_symbol.items():
         try:
-            filtered_data = [item for item in data if item['symbol'] == symbol]
-            filtered_data = await filter_and_deduplicate(filtered_data)
-            if filtered_data:
-                tasks.append(save_json(symbol, filtered_data))
+            # Duplicates and already ingested articles are dropped before touching the symbol's file
+            new_items = seen_index.new_items(symbol, filter_and_deduplicate(items))
+            if new_items:
+                path = f"json/market-news/companies/{symbol}.json"
+                if write_payload(path, merge_news(load_news(path), new_items, news_per_symbol)):
+                    changed += 1
+                # Recorded only after the file was written, so a failed write is retried next run
+                seen_index.mark_seen(symbol, new_items)
         except Exception as e:
             print(e)
-    if tasks:
-        await asyncio.gather(*tasks)
+    seen_index.commit()
+    return changed
 
 async def main():
     """
@@ -102,15 +76,23 @@ async def main():
     chunk_size = 10  # Adjust based on your needs
     chunks = [total_symbols[i:i + chunk_size] for i in range(0, len(total_symbols), chunk_size)]
     
-    rate_limiter = RateLimiter(rate_limit=200, sleep_time=60)
-    
+    # One bucket for the whole run: at most 200 requests in any minute
+    rate_limiter = TokenBucket.per_minute(200)
+    seen_index = SeenIndex()
+    os.makedirs("json/market-news/companies", exist_ok=True)
+
+    changed = 0
     async with aiohttp.ClientSession() as session:
-        tasks = [process_chunk(session, chunk, rate_limiter) for chunk in chunks]
+        tasks = [process_chunk(session, chunk, rate_limiter, seen_index) for chunk in chunks]
         for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
-            await task
+            changed += await task
+
+    seen_index.prune()
+    seen_index.close()
+    print(f"Rewrote news for {changed} symbols")
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except Exception as e:
-        print(f"An error occurred: {e}")
\ No newline at end of file
+        print(f"An error occurred: {e}")
@@ -6,6 +6,7 @@ import pandas as pd
 import asyncio
 import pytz
 import os
+import heapq
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, date
 import sqlite3
@@ -50,14 +51,9 @@ load_dotenv()
 benzinga_api_key = os.getenv('BENZINGA_API_KEY')
 fmp_api_key = os.getenv('FMP_API_KEY')
 
-query_template = """
-    SELECT 
-        marketCap
-    FROM 
-        stocks 
-    WHERE
-        symbol = ?
-"""
+SECTION_CACHE_PATH = "json/dashboard/sections.json"
+OPTIONS_FLOW_KEYS = ['cost_basis', 'ticker','underlying_type', 'date_expiration', 'put_call', 'volume', 'strike_price']
+OPTIONS_OI_KEYS = ['cost_basis', 'ticker','underlying_type', 'date_expiration', 'put_call', 'open_interest', 'strike_price']
 
 
 async def save_json(data):
@@ -65,6 +61,44 @@ async def save_json(data):
         ujson.dump(data, file)
 
 
+def load_section_cache():
+    try:
+        with open(SECTION_CACHE_PATH, 'r') as file:
+            return ujson.load(file)
+    except:
+        return {}
+
+def save_section_cache(cache):
+    try:
+        with open(SECTION_CACHE_PATH, 'w') as file:
+            ujson.dump(cache, file)
+    except Exception as e:
+        print(e)
+
+def file_signature(path):
+    # mtime + size is enough to tell whether a cron job has rewritten the file since the last run
+    try:
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        return None
+
+def cached_section(cache, name, path, build):
+    """
+    Rebuild a dashboard section only when its input file changed since the last run,
+    otherwise reuse the section stored in the cache.
+    """
+    signature = file_signature(path)
+    entry = cache.get(name)
+    if signature is not None and entry and entry.get('signature') == signature:
+        return entry['data']
+
+    data = build(path)
+    if signature is not None:
+        cache[name] = {'signature': signature, 'data': data}
+    return data
+
+
 def get_sector_path(sector):
     sector_paths = {
         'Financials': "/list/financial-sector",
@@ -152,8 +186,7 @@ async def get_upcoming_earnings(session):
 						revenue_est = float(item['revenue_est']) if item['revenue_est'] != '' else 0
 						revenue_prior = float(item['revenue_prior']) if item['revenue_prior'] != '' else 0
 						if symbol in stock_symbols and revenue_est != 0 and revenue_prior != 0 and eps_prior != 0 and eps_est != 0:
-							df = pd.read_sql_query(query_template, con, params=(symbol,))
-							market_cap = float(df['marketCap'].iloc[0]) if df['marketCap'].iloc[0] != '' else 0
+							market_cap = market_cap_dict.get(symbol, 0)
 							res_list.append({
 								'symbol': symbol,
 								'name': name,
@@ -203,8 +236,7 @@ async def get_recent_earnings(session):
 						revenue_surprise = float(item['revenue_surprise']) if item['revenue_surprise'] != '' else 0
 						revenue = float(item['revenue']) if item['revenue'] != '' else 0
 						if symbol in stock_symbols and revenue != 0 and revenue_prior != 0 and eps_prior != 0 and eps != 0 and revenue_surprise != 0 and eps_surprise != 0:
-							df = pd.read_sql_query(query_template, con, params=(symbol,))
-							market_cap = float(df['marketCap'].iloc[0]) if df['marketCap'].iloc[0] != '' else 0
+							market_cap = market_cap_dict.get(symbol, 0)
 							res_list.append({
 								'symbol': symbol,
 								'name': name,
@@ -249,8 +281,7 @@ async def get_recent_dividends(session):
 						payable_date = item['payable_date'] if item['payable_date'] != '' else 0
 						record_date = item['record_date'] if item['record_date'] != '' else 0
 						if symbol in stock_symbols and dividend != 0 and payable_date != 0 and dividend_prior != 0 and ex_dividend_date != 0 and record_date != 0 and dividend_yield != 0:
-							df = pd.read_sql_query(query_template, con, params=(symbol,))
-							market_cap = float(df['marketCap'].iloc[0]) if df['marketCap'].iloc[0] != '' else 0
+							market_cap = market_cap_dict.get(symbol, 0)
 							res_list.append({
 								'symbol': symbol,
 								'name': name,
@@ -310,73 +341,90 @@ async def get_latest_bezinga_market_news(session):
         print(e)
 
 
-async def run():
-	async with aiohttp.ClientSession() as session:
-		benzinga_news = await get_latest_bezinga_market_news(session)
-		recent_earnings = await get_recent_earnings(session)
-		upcoming_earnings = await get_upcoming_earnings(session)
-		top_sector = await get_top_sector(session)
-		recent_dividends = await get_recent_dividends(session)
+def get_retail_tracker(path):
+	try:
+		with open(path, 'r') as file:
+			return ujson.load(file)[0:5]
+	except:
+		return []
 
-		#Avoid clashing of recent and upcoming earnings
-		upcoming_earnings = [item for item in upcoming_earnings if item['symbol'] not in [earning['symbol'] for earning in recent_earnings]]
+def get_options_flow(path):
+	try:
+		with open(path, 'r') as file:
+			options_flow = ujson.load(file)
 
-		try:
-			with open(f"json/retail-volume/data.json", 'r') as file:
-				retail_tracker = ujson.load(file)[0:5]
-		except:
-			retail_tracker = []
-		try:
-			with open(f"json/options-flow/feed/data.json", 'r') as file:
-				options_flow = ujson.load(file)
-				
-				# Filter the options_flow to include only items with ticker in total_symbol
-				options_flow = [item for item in options_flow if item['ticker'] in stock_symbols]
-				
-				highest_volume = sorted(options_flow, key=lambda x: int(x['volume']), reverse=True)
-				highest_volume = [{key: item[key] for key in ['cost_basis', 'ticker','underlying_type', 'date_expiration', 'put_call', 'volume', 'strike_price']} for item in highest_volume[0:4]]
-
-				highest_premium = sorted(options_flow, key=lambda x: int(x['cost_basis']), reverse=True)
-				highest_premium = [{key: item[key] for key in ['cost_basis', 'ticker','underlying_type', 'date_expiration', 'put_call', 'volume', 'strike_price']} for item in highest_premium[0:4]]
-
-				highest_open_interest = sorted(options_flow, key=lambda x: int(x['open_interest']), reverse=True)
-				highest_open_interest = [{key: item[key] for key in ['cost_basis', 'ticker','underlying_type', 'date_expiration', 'put_call', 'open_interest', 'strike_price']} for item in highest_open_interest[0:4]]
-
-				options_flow = {'premium': highest_premium, 'volume': highest_volume, 'openInterest':highest_open_interest}
-		except Exception as e:
-			print(e)
-			options_flow = {}
-
-
-		market_status = check_market_hours()
-		print(market_status)
-		if market_status == 0:
-			try:
-				with open(f"json/market-movers/data.json", 'r') as file:
-					data = ujson.load(file)
-					market_movers = {'gainers': data['gainers']['1D'][:5], 'losers': data['losers']['1D'][:5]}
-			except:
-				market_movers = {}
-		else:
-			try:
-				with open(f"json/market-movers/pre-post-data.json", 'r') as file:
-					market_movers = ujson.load(file)
-			except:
-				market_movers = {}
-
-		data = {
-		    'marketMovers': market_movers,
-		    'marketStatus': market_status,
-		    'optionsFlow': options_flow,
-		    'marketNews': benzinga_news,
-		    'recentEarnings': recent_earnings,
-		    'upcomingEarnings': upcoming_earnings,
-		    'recentDividends': recent_dividends,
+		# Single pass over the feed; top-4 selections via heapq instead of three full sorts
+		options_flow = [item for item in options_flow if item['ticker'] in stock_symbols]
+
+		highest_volume = heapq.nlargest(4, options_flow, key=lambda x: int(x['volume']))
+		highest_premium = heapq.nlargest(4, options_flow, key=lambda x: int(x['cost_basis']))
+		highest_open_interest = heapq.nlargest(4, options_flow, key=lambda x: int(x['open_interest']))
+
+		return {
+			'premium': [{key: item[key] for key in OPTIONS_FLOW_KEYS} for item in highest_premium],
+			'volume': [{key: item[key] for key in OPTIONS_FLOW_KEYS} for item in highest_volume],
+			'openInterest': [{key: item[key] for key in OPTIONS_OI_KEYS} for item in highest_open_interest],
 		}
+	except Exception as e:
+		print(e)
+		return {}
+
+def get_market_movers(path):
+	try:
+		with open(path, 'r') as file:
+			data = ujson.load(file)
+		return {'gainers': data['gainers']['1D'][:5], 'losers': data['losers']['1D'][:5]}
+	except:
+		return {}
+
+def get_pre_post_market_movers(path):
+	try:
+		with open(path, 'r') as file:
+			return ujson.load(file)
+	except:
+		return {}
 
-		
-		if len(data) > 0:
-			await save_json(data)
+
+async def run():
+	section_cache = load_section_cache()
+
+	async with aiohttp.ClientSession() as session:
+		# Independent network sections run concurrently
+		benzinga_news, recent_earnings, upcoming_earnings, top_sector, recent_dividends = await asyncio.gather(
+			get_latest_bezinga_market_news(session),
+			get_recent_earnings(session),
+			get_upcoming_earnings(session),
+			get_top_sector(session),
+			get_recent_dividends(session),
+		)
+
+	#Avoid clashing of recent and upcoming earnings
+	recent_earning_symbols = {earning['symbol'] for earning in recent_earnings}
+	upcoming_earnings = [item for item in upcoming_earnings if item['symbol'] not in recent_earning_symbols]
+
+	retail_tracker = cached_section(section_cache, 'retailTracker', "json/retail-volume/data.json", get_retail_tracker)
+	options_flow = cached_section(section_cache, 'optionsFlow', "json/options-flow/feed/data.json", get_options_flow)
+
+	market_status = check_market_hours()
+	print(market_status)
+	if market_status == 0:
+		market_movers = cached_section(section_cache, 'marketMovers', "json/market-movers/data.json", get_market_movers)
+	else:
+		market_movers = cached_section(section_cache, 'prePostMarketMovers', "json/market-movers/pre-post-data.json", get_pre_post_market_movers)
+
+	data = {
+	    'marketMovers': market_movers,
+	    'marketStatus': market_status,
+	    'optionsFlow': options_flow,
+	    'marketNews': benzinga_news,
+	    'recentEarnings': recent_earnings,
+	    'upcomingEarnings': upcoming_earnings,
+	    'recentDividends': recent_dividends,
+	}
+
+	if len(data) > 0:
+		await save_json(data)
+		save_section_cache(section_cache)
 
 try:
 
@@ -388,15 +436,25 @@ try:
 	cursor.execute("SELECT DISTINCT symbol FROM stocks")
 	stock_symbols = [row[0] for row in cursor.fetchall()]
 
+	# Preload market caps once instead of one SQL lookup per calendar entry
+	cursor.execute("SELECT symbol, marketCap FROM stocks")
+	market_cap_dict = {}
+	for symbol, market_cap in cursor.fetchall():
+		try:
+			market_cap_dict[symbol] = float(market_cap) if market_cap not in ('', None) else 0
+		except (TypeError, ValueError):
+			market_cap_dict[symbol] = 0
+
 	etf_cursor = etf_con.cursor()
 	etf_cursor.execute("PRAGMA journal_mode = wal")
 	etf_cursor.execute("SELECT DISTINCT symbol FROM etfs")
 	etf_symbols = [row[0] for row in etf_cursor.fetchall()]
 
 	total_symbols = stock_symbols+etf_symbols
+	stock_symbols = set(stock_symbols)
 	asyncio.run(run())
 	con.close()
 	etf_con.close()
 
 except Exception as e:
-    print(e)
\ No newline at end of file
+    print(e)
\ No newline at end of file
@@ -1,10 +1,13 @@
 import os
-import ujson
+import hashlib
+import orjson
 import asyncio
 import aiohttp
 import sqlite3
+from datetime import datetime, timedelta
 from tqdm import tqdm
 from dotenv import load_dotenv
+from utils.rate_limit import TokenBucket
 
 load_dotenv()
 api_key = os.getenv('FMP_API_KEY')
@@ -12,8 +15,21 @@ api_key = os.getenv('FMP_API_KEY')
 # Configurations
 include_current_quarter = False
 max_concurrent_requests = 100  # Limit concurrent requests
+requests_per_minute = 500
+full_refresh_days = 30  # Refetch everything at least this often to pick up restatements
 
-async def fetch_data(session, url, symbol, attempt=0):
+base_url = "https://financialmodelingprep.com/api/v3"
+periods = ['quarter', 'annual']
+financial_data_types = ['key-metrics', 'income-statement', 'balance-sheet-statement', 'cash-flow-statement', 'ratios']
+growth_data_types = ['income-statement-growth', 'balance-sheet-statement-growth', 'cash-flow-statement-growth']
+# Statements served by /stock-income, /stock-balance-sheet, /stock-cash-flow and /stock-ratios
+consolidated_data_types = ['income-statement', 'balance-sheet-statement', 'cash-flow-statement', 'ratios']
+
+state_path = "json/financial-statements/sync-state.json"
+
+
+async def fetch_data(session, url, symbol, limiter):
+    await limiter.acquire()
     try:
         async with session.get(url) as response:
             if response.status == 200:
@@ -26,54 +42,97 @@ async def fetch_data(session, url, symbol, attempt=0):
         print(f"Exception during fetching data for {symbol}: {e}")
         return None
 
-async def save_json(symbol, period, data_type, data):
-    os.makedirs(f"json/financial-statements/{data_type}/{period}/", exist_ok=True)
-    with open(f"json/financial-statements/{data_type}/{period}/{symbol}.json", 'w') as file:
-        ujson.dump(data, file)
-
-async def get_financial_statements(session, symbol, semaphore, request_counter):
-    base_url = "https://financialmodelingprep.com/api/v3"
-    periods = ['quarter', 'annual']
-    financial_data_types = ['key-metrics', 'income-statement', 'balance-sheet-statement', 'cash-flow-statement', 'ratios']
-    growth_data_types = ['income-statement-growth', 'balance-sheet-statement-growth', 'cash-flow-statement-growth']
-    
+def content_hash(data):
+    return hashlib.sha1(orjson.dumps(data, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def write_if_changed(path, content):
+    # Unchanged files keep their mtime, which downstream caches use to detect new filings
+    try:
+        with open(path, 'rb') as file:
+            if file.read() == content:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", 'wb') as file:
+        file.write(content)
+    os.replace(f"{path}.tmp", path)
+    return True
+
+def save_json(symbol, period, data_type, data):
+    return write_if_changed(f"json/financial-statements/{data_type}/{period}/{symbol}.json", orjson.dumps(data))
+
+def load_json(symbol, period, data_type):
+    try:
+        with open(f"json/financial-statements/{data_type}/{period}/{symbol}.json", 'rb') as file:
+            return orjson.loads(file.read())
+    except:
+        return []
+
+def save_consolidated(symbol, fetched):
+    res = {}
+    for data_type in consolidated_data_types:
+        res[data_type] = {period: fetched.get((data_type, period)) or load_json(symbol, period, data_type) for period in periods}
+    write_if_changed(f"json/financial-statements/consolidated/{symbol}.json", orjson.dumps(res))
+
+def load_state():
+    try:
+        with open(state_path, 'rb') as file:
+            return orjson.loads(file.read())
+    except:
+        return {}
+
+def save_state(state):
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    with open(f"{state_path}.tmp", 'wb') as file:
+        file.write(orjson.dumps(state))
+    os.replace(f"{state_path}.tmp", state_path)
+
+async def get_financial_statements(session, symbol, semaphore, limiter, state):
+    """
+    Probe the latest quarterly income statement and only refetch the symbol when it changed.
+    Returns True when the symbol was refetched.
+    """
     async with semaphore:
+        probe_url = f"{base_url}/income-statement/{symbol}?period=quarter&limit=1&apikey={api_key}"
+        probe = await fetch_data(session, probe_url, symbol, limiter)
+        if probe is None:
+            return False
+
+        latest = probe[0] if probe else {}
+        fingerprint = {'latestDate': latest.get('date'), 'hash': content_hash(latest)}
+
+        entry = state.get(symbol)
+        cutoff = (datetime.today() - timedelta(days=full_refresh_days)).strftime('%Y-%m-%d')
+        if entry and entry['latestDate'] == fingerprint['latestDate'] and entry['hash'] == fingerprint['hash'] and entry['synced'] >= cutoff:
+            return False
+
+        fetched = {}
+        failures = 0
         for period in periods:
-            # Fetch regular financial statements
-            for data_type in financial_data_types:
+            # Fetch regular financial statements and their growth data
+            for data_type in financial_data_types + growth_data_types:
                 url = f"{base_url}/{data_type}/{symbol}?period={period}&apikey={api_key}"
-                data = await fetch_data(session, url, symbol)
-                if data:
-                    await save_json(symbol, period, data_type, data)
-                
-                request_counter[0] += 1  # Increment the request counter
-                if request_counter[0] >= 500:
-                    await asyncio.sleep(60)  # Pause for 60 seconds
-                    request_counter[0] = 0  # Reset the request counter after the pause
-            
-            # Fetch financial statement growth data
-            for growth_type in growth_data_types:
-                growth_url = f"{base_url}/{growth_type}/{symbol}?period={period}&apikey={api_key}"
-                growth_data = await fetch_data(session, growth_url, symbol)
-                if growth_data:
-                    await save_json(symbol, period, growth_type, growth_data)
-
-                request_counter[0] += 1  # Increment the request counter
-                if request_counter[0] >= 500:
-                    await asyncio.sleep(60)  # Pause for 60 seconds
-                    request_counter[0] = 0  # Reset the request counter after the pause
+                data = await fetch_data(session, url, symbol, limiter)
+                if data is None:
+                    failures += 1
+                elif data:
+                    save_json(symbol, period, data_type, data)
+                    fetched[(data_type, period)] = data
 
         # Fetch owner earnings data
         owner_earnings_url = f"https://financialmodelingprep.com/api/v4/owner_earnings?symbol={symbol}&apikey={api_key}"
-        owner_earnings_data = await fetch_data(session, owner_earnings_url, symbol)
-        if owner_earnings_data:
-            await save_json(symbol, 'quarter', 'owner-earnings', owner_earnings_data)
+        owner_earnings_data = await fetch_data(session, owner_earnings_url, symbol, limiter)
+        if owner_earnings_data is None:
+            failures += 1
+        elif owner_earnings_data:
+            save_json(symbol, 'quarter', 'owner-earnings', owner_earnings_data)
 
-        request_counter[0] += 1  # Increment the request counter
-        if request_counter[0] >= 500:
-            await asyncio.sleep(60)  # Pause for 60 seconds
-            request_counter[0] = 0  # Reset the request counter after the pause
-    
+        save_consolidated(symbol, fetched)
+        # A failed fetch leaves the entry untouched so the symbol is retried on the next run
+        if failures == 0:
+            state[symbol] = {**fingerprint, 'synced': datetime.today().strftime('%Y-%m-%d')}
+        return True
 
 
 async def run():
@@ -85,15 +144,18 @@ async def run():
     con.close()
 
     semaphore = asyncio.Semaphore(max_concurrent_requests)
-    request_counter = [0]  # Using a list to keep a mutable counter across async tasks
+    limiter = TokenBucket.per_minute(requests_per_minute)
+    state = load_state()
 
     async with aiohttp.ClientSession() as session:
-        tasks = []
-        for symbol in tqdm(symbols):
-            task = asyncio.create_task(get_financial_statements(session, symbol, semaphore, request_counter))
-            tasks.append(task)
-        
-        await asyncio.gather(*tasks)
+        tasks = [asyncio.create_task(get_financial_statements(session, symbol, semaphore, limiter, state)) for symbol in symbols]
+        updated = 0
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+            if await task:
+                updated += 1
+
+    save_state(state)
+    print(f"Refetched {updated} of {len(symbols)} symbols")
 
 if __name__ == "__main__":
     asyncio.run(run())
@@ -1,74 +1,91 @@
 from mixpanel_utils import MixpanelUtils
 import ujson
+import gzip
 import asyncio
 import aiohttp
 from datetime import datetime, timedelta
-from collections import Counter, OrderedDict
+from collections import Counter, OrderedDict, defaultdict
 
 from dotenv import load_dotenv
 import os
 load_dotenv()
 api_key = os.getenv('FMP_API_KEY')
 
+index_list = ['sp500', 'nasdaq', 'dowjones']
+CONSTITUENT_DIR = "json/heatmaps/constituents"
 
 
-async def get_quote_of_stocks(ticker_list):
+async def get_quote_of_stocks(session, ticker_list):
     ticker_str = ','.join(ticker_list)
-    async with aiohttp.ClientSession() as session:
-        url = f"https://financialmodelingprep.com/api/v3/quote/{ticker_str}?apikey={api_key}" 
-        async with session.get(url) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                return []
+    url = f"https://financialmodelingprep.com/api/v3/quote/{ticker_str}?apikey={api_key}" 
+    async with session.get(url) as response:
+        if response.status == 200:
+            return await response.json()
+        else:
+            return []
+
+async def get_constituents(session, index):
+    # Index membership changes rarely, so the constituent list is only refetched once per day
+    today = datetime.today().strftime('%Y-%m-%d')
+    cache_path = f"{CONSTITUENT_DIR}/{index}.json"
+    try:
+        with open(cache_path, 'r') as file:
+            cached = ujson.load(file)
+        if cached['date'] == today and cached['data']:
+            return cached['data']
+    except:
+        pass
+
+    url = f"https://financialmodelingprep.com/api/v3/{index}_constituent?apikey={api_key}"
+    async with session.get(url) as response:
+        data = await response.json()
+
+    res_list = [{'symbol': item['symbol'], 'sector': item['sector']} for item in data]
+
+    os.makedirs(CONSTITUENT_DIR, exist_ok=True)
+    with open(cache_path, 'w') as file:
+        ujson.dump({'date': today, 'data': res_list}, file)
+
+    return res_list
+
+def build_treemap(constituents, quote_dict):
+    # Group the constituents by sector in one pass; quotes are joined by symbol
+    sector_dict = defaultdict(lambda: {'value': 0, 'children': []})
+
+    for item in constituents:
+        quote = quote_dict.get(item['symbol'])
+        if quote is None:
+            continue
+        sector = sector_dict[item['sector']]
+        sector['value'] += quote['marketCap']
+        sector['children'].append({'name': item['symbol'], 'value': quote['marketCap'], 'changesPercentage': round(quote['changesPercentage'],2)})
+
+    return [{'name': name, 'value': round(sector['value'], 2), 'children': sector['children']} for name, sector in sector_dict.items()]
+
+def save_heatmap(index, result_list):
+    data = ujson.dumps(result_list)
+    with open(f"json/heatmaps/{index}.json", 'w') as file:
+        file.write(data)
+    # Precompressed payload served as-is by /heatmaps
+    tmp_path = f"json/heatmaps/{index}.json.gz.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(gzip.compress(data.encode('utf-8')))
+    os.replace(tmp_path, f"json/heatmaps/{index}.json.gz")
+
 
 async def run():
-    index_list = ['sp500', 'nasdaq', 'dowjones']
-    for index in index_list:
-        url = f"https://financialmodelingprep.com/api/v3/{index}_constituent?apikey={api_key}"
-        res_list = []
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                data = await response.json()
-
-        for item in data:
-            res_list.append({'symbol': item['symbol'], 'sector': item['sector']})
-
-        ticker_list = [item['symbol'] for item in res_list]
-        latest_quote = await get_quote_of_stocks(ticker_list)
-        for quote in latest_quote:
-            symbol = quote['symbol']
-            for item in res_list:
-                if item['symbol'] == symbol:
-                    item['changesPercentage'] = round(quote['changesPercentage'],2)
-                    item['marketCap'] = quote['marketCap']
-        
-        # Create a dictionary to store sectors and their corresponding symbols and percentages
-        sector_dict = {}
-
-        for item in res_list:
-            sector = item['sector']
-            symbol = item['symbol']
-            percentage = item['changesPercentage']
-            marketCap = item['marketCap']
-            
-            if sector not in sector_dict:
-                sector_dict[sector] = {'name': sector, 'value': 0, 'children': []}
-            
-            sector_dict[sector]['value'] += marketCap
-            sector_dict[sector]['children'].append({'name': symbol, 'value': marketCap, 'changesPercentage': percentage})
-
-        # Convert the dictionary to a list
-        result_list = list(sector_dict.values())
-
-        # Optionally, if you want to add the 'value' for each sector
-        for sector in result_list:
-            sector['value'] = round(sector['value'], 2)
-        #print(result_list)
-
-        with open(f"json/heatmaps/{index}.json", 'w') as file:
-            ujson.dump(result_list, file)
-
-
-asyncio.run(run())
\ No newline at end of file
+    async with aiohttp.ClientSession() as session:
+        constituents = await asyncio.gather(*[get_constituents(session, index) for index in index_list])
+
+        # One quote pull for the union of all index members
+        ticker_list = sorted({item['symbol'] for res_list in constituents for item in res_list})
+        latest_quote = await get_quote_of_stocks(session, ticker_list)
+
+    quote_dict = {quote['symbol']: quote for quote in latest_quote}
+
+    for index, res_list in zip(index_list, constituents):
+        result_list = build_treemap(res_list, quote_dict)
+        save_heatmap(index, result_list)
+
+
+asyncio.run(run())
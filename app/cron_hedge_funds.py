@@ -2,6 +2,7 @@ import sqlite3
 import os
 import ujson
 import time
+import concurrent.futures
 from collections import Counter
 from tqdm import tqdm
 
@@ -70,29 +71,32 @@ def spy_performance():
     # Generate the range of dates with quarterly frequency
     date_range = pd.date_range(start=start_date, end=end_date, freq='QE')
 
-    # Convert the dates to the desired format (end of quarter dates)
-    end_of_quarters = date_range.strftime('%Y-%m-%d').tolist()
-
-    data = []
-
     df = yf.download('SPY', start='1993-01-01', end=datetime.today(), interval="1d").reset_index()
     df = df.rename(columns={'Adj Close': 'close', 'Date': 'date'})
+    df = df.sort_values('date')
 
-    df['date'] = df['date'].dt.strftime('%Y-%m-%d')
-    for target_date in end_of_quarters:
-        original_date = target_date
-        # Find close price for '2015-03-31' or the closest available date prior to it    
-        while target_date not in df['date'].values:
-            # If the target date doesn't exist, move one day back
-            target_date = (pd.to_datetime(target_date) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    # As-of join: close price on each quarter end or the closest trading day before it
+    positions = df['date'].values.searchsorted(date_range.values, side='right') - 1
+    valid = positions >= 0
+    close_prices = df['close'].values[positions[valid]].ravel()
+
+    data = [
+        {'date': quarter_end.strftime('%Y-%m-%d'), 'price': round(float(close_price), 2)}
+        for quarter_end, close_price in zip(date_range[valid], close_prices)
+    ]
+    return data
 
-        # Get the close price for the found or closest date
-        close_price = round(df[df['date'] == target_date]['close'].values[0],2)
-        data.append({'date': original_date, 'price': close_price})
+
+def init_worker(sector_dict):
+    # Each worker keeps its own read-only connection and the shared symbol -> sector map
+    global cursor, stock_sector_dict
+    con = sqlite3.connect('institute.db')
+    cursor = con.cursor()
+    stock_sector_dict = sector_dict
 
 
-def get_data(cik, stock_sectors):
-    cursor.execute("SELECT cik, name, numberOfStocks, performancePercentage3year, performancePercentage5year, performanceSinceInceptionPercentage, averageHoldingPeriod, turnover, marketValue, winRate, holdings, summary FROM institutes WHERE cik = ?", (cik,))
+def get_data(cik):
+    cursor.execute("SELECT cik, name, numberOfStocks, performancePercentage3year, performancePercentage5year, performanceSinceInceptionPercentage, averageHoldingPeriod, turnover, marketValue, winRate, summary FROM institutes WHERE cik = ?", (cik,))
     cik_data = cursor.fetchall()
     res = [{
         'cik': row[0],
@@ -105,8 +109,7 @@ def get_data(cik, stock_sectors):
         'turnover': row[7],
         'marketValue': row[8],
         'winRate': row[9],
-        'holdings': ujson.loads(row[10]),
-        'summary': ujson.loads(row[11]),
+        'summary': ujson.loads(row[10]),
     } for row in cik_data]
 
     if not res:
@@ -114,18 +117,14 @@ def get_data(cik, stock_sectors):
 
     res = res[0] #latest data
 
-    filtered_holdings = [
-        {key: holding[key] for key in keys_to_keep}
-        for holding in res['holdings']
-    ]
-
-    res['holdings'] = filtered_holdings
+    # Positions come from the normalized holdings table (indexed on cik)
+    cursor.execute(f"SELECT {', '.join(keys_to_keep)} FROM institute_holdings WHERE cik = ?", (cik,))
+    res['holdings'] = [dict(zip(keys_to_keep, row)) for row in cursor.fetchall()]
 
-    # Cross-reference symbols in holdings with stock_sectors to determine sectors
+    # Cross-reference symbols in holdings with the symbol -> sector map
     sector_counts = Counter()
     for holding in res['holdings']:
-        symbol = holding['symbol']
-        sector = next((item['sector'] for item in stock_sectors if item['symbol'] == symbol), None)
+        sector = stock_sector_dict.get(holding['symbol'])
         if sector:
             sector_counts[sector] += 1
 
@@ -144,6 +143,14 @@ def get_data(cik, stock_sectors):
         with open(f"json/hedge-funds/companies/{cik}.json", 'w') as file:
             ujson.dump(res, file)
 
+
+def export_fund(cik):
+    try:
+        get_data(cik)
+    except Exception as e:
+        print(e)
+
+
 if __name__ == '__main__':
     con = sqlite3.connect('institute.db')
     stock_con = sqlite3.connect('stocks.db')
@@ -156,7 +163,7 @@ if __name__ == '__main__':
     try:
         stock_cursor = stock_con.cursor()
         stock_cursor.execute("SELECT DISTINCT symbol, sector FROM stocks")
-        stock_sectors = [{'symbol': row[0], 'sector': row[1]} for row in stock_cursor.fetchall()]
+        stock_sector_dict = {row[0]: row[1] for row in stock_cursor.fetchall()}
     finally:
         # Ensure that the cursor and connection are closed even if an error occurs
         stock_cursor.close()
@@ -164,10 +171,10 @@ if __name__ == '__main__':
 
     all_hedge_funds(con)
     spy_performance()
-    for cik in tqdm(cik_symbols):
-        try:
-            get_data(cik, stock_sectors)
-        except Exception as e:
-            print(e)
+    con.close()
 
-    con.close()
\ No newline at end of file
+    # Every fund is written by its worker as soon as it is done
+    num_processes = os.cpu_count() or 4
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes, initializer=init_worker, initargs=(stock_sector_dict,)) as executor:
+        for _ in tqdm(executor.map(export_fund, cik_symbols, chunksize=64), total=len(cik_symbols)):
+            pass
@@ -1,55 +1,120 @@
-import ujson
+import os
 import asyncio
 import aiohttp
 import sqlite3
-from datetime import datetime,timedelta
-from tqdm import tqdm
+import orjson
+import concurrent.futures
 import pandas as pd
-import time
+from datetime import datetime, timedelta
+from tqdm import tqdm
 
 from dotenv import load_dotenv
-import os
 
-keys_to_keep = {'date','stockpx', 'iv60', 'iv90', '252dclshv','60dorhv'}
+keys_to_keep = ['date', 'stockpx', 'iv60', 'iv90', '252dclshv', '60dorhv']
 
 load_dotenv()
 api_key = os.getenv('NASDAQ_API_KEY')
 
-
-# Get today's date
-today = datetime.today()
-# Calculate the date 12 months ago
-dates = [today - timedelta(days=i) for i in range(365)]
-date_str = ','.join(date.strftime('%Y-%m-%d') for date in dates)
-
-async def save_json(symbol, data):
-    with open(f"json/implied-volatility/companies/{symbol}.json", 'w') as file:
-        ujson.dump(data, file)
-
-
-# Function to filter the list
-def filter_past_six_months(data):
-    filtered_data = []
-    for entry in data:
-        entry_date = datetime.strptime(entry['date'], '%Y-%m-%d')
-        if entry_date >= six_months_ago:
-            filtered_data.append(entry)
-    sorted_data = sorted(filtered_data, key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'))
-    return sorted_data
-
-async def get_data(ticker):
-    #ticker_str = ','.join(ticker_list)
-    
+output_dir = "json/implied-volatility/companies"
+# Long frame (ticker, date, keys_to_keep) of everything fetched so far
+history_path = "json/implied-volatility/history.pkl"
+
+history_days = 365
+window_days = 182
+chunk_size = 100
+max_concurrency = 10
+
+
+def load_history():
+    try:
+        return pd.read_pickle(history_path)
+    except Exception:
+        return pd.DataFrame(columns=['ticker'] + keys_to_keep)
+
+
+def save_history(df):
+    tmp_path = f"{history_path}.tmp"
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, history_path)
+
+
+def save_json(symbol, records):
+    tmp_path = f"{output_dir}/{symbol}.json.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(orjson.dumps(records))
+    os.replace(tmp_path, f"{output_dir}/{symbol}.json")
+
+
+async def get_data(session, semaphore, tickers, start_date):
+    """
+    One datatable request for a batch of tickers, following the cursor across pages.
+    The response is decoded straight into a frame instead of one dict per row.
+    A failed page drops the whole batch, so it is retried from the same start date next run.
+    """
+    frames = []
+    params = {
+        'ticker': ','.join(tickers),
+        'date.gte': start_date,
+        'qopts.columns': ','.join(['ticker'] + keys_to_keep),
+        'api_key': api_key,
+    }
+    url = "https://data.nasdaq.com/api/v3/datatables/ORATS/OPT"
+    async with semaphore:
+        while True:
+            try:
+                async with session.get(url, params=params) as response:
+                    if response.status != 200:
+                        print(f"Error fetching {params['ticker'][:50]}: HTTP {response.status}")
+                        return []
+                    res = await response.json()
+            except Exception as e:
+                print(f"Error fetching {params['ticker'][:50]}: {e}")
+                return []
+            datatable = res['datatable']
+            if datatable['data']:
+                frames.append(pd.DataFrame(datatable['data'], columns=[column['name'] for column in datatable['columns']]))
+            cursor_id = (res.get('meta') or {}).get('next_cursor_id')
+            if not cursor_id:
+                break
+            params['qopts.cursor_id'] = cursor_id
+    return frames
+
+
+def fetch_plan(history, symbols, today):
+    # Each ticker resumes the day after its last stored date; unknown tickers get a full backfill
+    last_dates = history.groupby('ticker')['date'].max().to_dict() if not history.empty else {}
+    backfill = (today - timedelta(days=history_days)).strftime('%Y-%m-%d')
+    plan = {}
+    for symbol in symbols:
+        last_date = last_dates.get(symbol)
+        start_date = (datetime.strptime(last_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d') if last_date else backfill
+        if start_date <= today.strftime('%Y-%m-%d'):
+            plan.setdefault(start_date, []).append(symbol)
+    return [(tickers[i:i + chunk_size], start_date) for start_date, tickers in plan.items() for i in range(0, len(tickers), chunk_size)]
+
+
+async def fetch_new_rows(history, symbols, today):
+    semaphore = asyncio.Semaphore(max_concurrency)
     async with aiohttp.ClientSession() as session:
-        url = url = f"https://data.nasdaq.com/api/v3/datatables/ORATS/OPT?date={date_str}&ticker={ticker}&api_key={api_key}"
-        async with session.get(url) as response:
-            if response.status == 200:
-                res = await response.json()
-                data = res['datatable']['data']
-                columns = res['datatable']['columns']
-                return data, columns
-            else:
-                return [], []
+        tasks = [get_data(session, semaphore, tickers, start_date) for tickers, start_date in fetch_plan(history, symbols, today)]
+        frames = []
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+            frames += await task
+    if not frames:
+        return pd.DataFrame(columns=['ticker'] + keys_to_keep)
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_windows(history, tickers, window_start):
+    # One groupby over the window instead of scanning every row per symbol
+    window = history[history['ticker'].isin(tickers) & (history['date'] >= window_start)]
+    columns = [key for key in keys_to_keep if key in window.columns]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(save_json, symbol, group[columns].to_dict('records'))
+                   for symbol, group in window.sort_values('date').groupby('ticker', sort=False)]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    return len(futures)
 
 
 async def run():
@@ -66,44 +131,32 @@ async def run():
     etf_cursor.execute("SELECT DISTINCT symbol FROM etfs")
     etf_symbols = [row[0] for row in etf_cursor.fetchall()]
 
-
-    
-    total_symbols = stocks_symbols+etf_symbols
-    
-    chunk_size = len(total_symbols) // 70  # Divide the list into N chunks
-    chunks = [total_symbols[i:i + chunk_size] for i in range(0, len(total_symbols), chunk_size)]
-    
-    for ticker in tqdm(total_symbols):
-        data, columns = await get_data(ticker)
-        filtered_data = []
-        for element in tqdm(data):
-            # Assuming the number of columns matches the length of each element in `data`
-            filtered_data.append({columns[i]["name"]: element[i] for i in range(len(columns))})
-
-        filtered_data = [{k: v for k, v in item.items() if k in keys_to_keep} for item in filtered_data]
-
-        try:
-            sorted_data = sorted(filtered_data, key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'))
-            if len(sorted_data) > 0:
-                await save_json(ticker, sorted_data)
-        except Exception as e:
-            print(e)
-
-        '''
-        for symbol in chunk:
-            try:
-                filtered_data = [item for item in transformed_data if symbol == item['ticker']]               
-                sorted_data = sorted(filtered_data, key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'))
-                if len(sorted_data) > 0:
-                    await save_json(symbol, sorted_data)
-            except Exception as e:
-                print(e)
-        '''
-    
     con.close()
     etf_con.close()
 
-try:
-    asyncio.run(run())
-except Exception as e:
-    print(e)
\ No newline at end of file
+    total_symbols = stocks_symbols + etf_symbols
+    today = datetime.today()
+
+    history = load_history()
+    new_rows = await fetch_new_rows(history, total_symbols, today)
+    if new_rows.empty:
+        print("No new implied volatility data")
+        return
+
+    history = pd.concat([history, new_rows], ignore_index=True)
+    history = history.drop_duplicates(subset=['ticker', 'date'], keep='last')
+    history = history[history['date'] >= (today - timedelta(days=history_days)).strftime('%Y-%m-%d')].reset_index(drop=True)
+    save_history(history)
+
+    # Only tickers that received new rows get their six month window rewritten
+    window_start = (today - timedelta(days=window_days)).strftime('%Y-%m-%d')
+    written = write_windows(history, set(new_rows['ticker']), window_start)
+    print(f"Updated implied volatility for {written} symbols")
+
+
+if __name__ == "__main__":
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        asyncio.run(run())
+    except Exception as e:
+        print(e)
@@ -4,6 +4,7 @@ import aiohttp
 import finnhub
 import sqlite3
 from dotenv import load_dotenv
+from utils.news_store import filter_and_deduplicate, write_payload
 import os
 load_dotenv()
 api_key = os.getenv('FMP_API_KEY')
@@ -14,33 +15,6 @@ finnhub_client = finnhub.Client(api_key=finnhub_api_key)
 headers = {"accept": "application/json"}
 
 
-def filter_and_deduplicate(data, excluded_domains=None, deduplicate_key='title'):
-    """
-    Filter out items with specified domains in their URL and remove duplicates based on a specified key.
-    
-    Args:
-    data (list): List of dictionaries containing item data.
-    excluded_domains (list): List of domain strings to exclude. Defaults to ['prnewswire.com', 'globenewswire.com', 'accesswire.com'].
-    deduplicate_key (str): The key to use for deduplication. Defaults to 'title'.
-    
-    Returns:
-    list: Filtered and deduplicated list of items.
-    """
-    if excluded_domains is None:
-        excluded_domains = ['prnewswire.com', 'globenewswire.com', 'accesswire.com']
-    
-    seen_keys = set()
-    filtered_data = []
-    
-    for item in data:
-        if not any(domain in item['url'] for domain in excluded_domains):
-            key = item.get(deduplicate_key)
-            if key and key not in seen_keys:
-                filtered_data.append(item)
-                seen_keys.add(key)
-    
-    return filtered_data
-
 '''
 async def run():
     limit = 200
@@ -95,15 +69,14 @@ async def run():
         #elif "press-releases" in url:
         #    data_name = 'press-releases'
 
-        with open(f"json/market-news/{data_name}.json", 'w') as file:
-            ujson.dump(data, file)
+        # Only rewritten (with its precompressed copy) when the feed changed
+        write_payload(f"json/market-news/{data_name}.json", data)
 
 
 
     general_news = finnhub_client.general_news('general')
     general_news = [item for item in general_news if item["source"] != "" and item["image"] != ""]
-    with open(f"json/market-news/general-news.json", 'w') as file:
-            ujson.dump(general_news, file)
+    write_payload(f"json/market-news/general-news.json", general_news)
 
 try:
     asyncio.run(run())
@@ -8,6 +8,7 @@ import pandas as pd
 
 
 from GetStartEndDate import GetStartEndDate
+from utils.quote_store import load_quote
 
 
 from dotenv import load_dotenv
@@ -61,9 +62,8 @@ async def get_todays_data(ticker):
                 df_1d = df_1d.drop(['volume'], axis=1)
                 df_1d = df_1d.round(2).rename(columns={"date": "time"})
                 try:
-                    with open(f"json/quote/{ticker}.json", 'r') as file:
-                        res = ujson.load(file)
-                        df_1d.loc[df_1d.index[0], 'close'] = res['previousClose']
+                    res = load_quote(ticker)
+                    df_1d.loc[df_1d.index[0], 'close'] = res['previousClose']
                 except:
                     pass
 
@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 from benzinga import financial_data
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 
 load_dotenv()
 api_key = os.getenv('BENZINGA_API_KEY')
@@ -14,23 +15,60 @@ api_key = os.getenv('BENZINGA_API_KEY')
 fin = financial_data.Benzinga(api_key)
 
 
-def calculate_dte(date_expiration):
-    expiration_date = datetime.strptime(date_expiration, "%Y-%m-%d")
-    return (expiration_date - datetime.today()).days
-
-def calculate_avg_dte(data):
-    active_options = [entry for entry in data if calculate_dte(entry['date_expiration']) >= 0]
-    
-    if active_options:
-        total_dte = sum(entry['dte'] for entry in active_options)
-        return int(total_dte / len(active_options))
-    else:
-        return 0
-
-def calculate_put_call_volumes(data):
-    put_volume = sum(int(entry['volume']) for entry in data if entry['put_call'] == 'PUT')
-    call_volume = sum(int(entry['volume']) for entry in data if entry['put_call'] == 'CALL')
-    return put_volume, call_volume
+windows = {'oneDay': 1, 'oneWeek': 7, 'oneMonth': 30, 'threeMonth': 90, 'sixMonth': 180, 'oneYear': 252}
+
+def load_frame(res_list):
+    # Columnar view of the activity records with parsed dates and days to expiration
+    df = pd.DataFrame(res_list, columns=['ticker', 'date', 'date_expiration', 'put_call', 'volume', 'open_interest'])
+    df = df[df['put_call'].isin(['CALL', 'PUT'])].copy()
+    df['ticker'] = df['ticker'].replace({'BRK.A': 'BRK-A', 'BRK.B': 'BRK-B'})
+    df['volume'] = pd.to_numeric(df['volume'], errors='coerce').fillna(0).astype(int)
+    df['open_interest'] = pd.to_numeric(df['open_interest'], errors='coerce').fillna(0).astype(int)
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    df['dte'] = (pd.to_datetime(df['date_expiration'], errors='coerce') - pd.Timestamp(datetime.today())).dt.days
+    return df.dropna(subset=['date', 'dte'])
+
+def company_flow(df):
+    """
+    Daily call/put volume and open interest per ticker for the options page stack bar chart.
+    """
+    daily = df.groupby(['ticker', 'date', 'put_call'])[['volume', 'open_interest']].sum().unstack('put_call', fill_value=0)
+    res = {}
+    for ticker, group in daily.groupby(level='ticker', sort=False):
+        res[ticker] = [
+            {
+                'date': day.strftime('%Y-%m-%d'),
+                'CALL': {'volume': int(row.get(('volume', 'CALL'), 0)), 'open_interest': int(row.get(('open_interest', 'CALL'), 0))},
+                'PUT': {'volume': int(row.get(('volume', 'PUT'), 0)), 'open_interest': int(row.get(('open_interest', 'PUT'), 0))},
+            }
+            for (_, day), row in group.iterrows()
+        ]
+    return res
+
+def bubble_metrics(df, end_date):
+    """
+    Put/call volume and average DTE of active contracts for every window, from reverse cumulative
+    sums over each ticker's daily totals (one row per ticker and date).
+    """
+    df = df.assign(
+        putVolume=df['volume'].where(df['put_call'] == 'PUT', 0),
+        callVolume=df['volume'].where(df['put_call'] == 'CALL', 0),
+        activeDTE=df['dte'].where(df['dte'] >= 0, 0),
+        activeCount=(df['dte'] >= 0).astype(int),
+    )
+    columns = ['putVolume', 'callVolume', 'activeDTE', 'activeCount']
+    daily = df.groupby(['ticker', 'date'])[columns].sum().sort_index(ascending=[True, False]).reset_index()
+    # Running totals from the newest day backwards: row i holds the sum of all days >= its date
+    daily[columns] = daily.groupby('ticker')[columns].cumsum()
+
+    res = {}
+    for time_period, days in windows.items():
+        start_date = pd.Timestamp(end_date - timedelta(days=days))
+        totals = daily[(daily['date'] >= start_date) & (daily['date'] <= pd.Timestamp(end_date))].groupby('ticker')[columns].last()
+        for ticker, row in totals.iterrows():
+            avg_dte = int(row['activeDTE'] / row['activeCount']) if row['activeCount'] else 0
+            res.setdefault(ticker, {})[time_period] = {'putVolume': int(row['putVolume']), 'callVolume': int(row['callVolume']), 'avgDTE': avg_dte}
+    return res
 
 def options_bubble_data(chunk):
     try:
@@ -52,58 +90,22 @@ def options_bubble_data(chunk):
             except:
                 break
 
-        res_filtered = [{key: value for key, value in item.items() if key in ['ticker','date', 'date_expiration', 'put_call', 'volume', 'open_interest']} for item in res_list]
-
-        for option_type in ['CALL', 'PUT']:
-            for item in res_filtered:
-                try:
-                    if item['put_call'].upper() == option_type:
-                        item['dte'] = calculate_dte(item['date_expiration'])
-                        if item['ticker'] in ['BRK.A', 'BRK.B']:
-                            item['ticker'] = f"BRK-{item['ticker'][-1]}"
-                except:
-                    pass
+        df = load_frame(res_list)
+        if df.empty:
+            return
 
         #Save raw data for each ticker for options page stack bar chart
-        for ticker in chunk:
-            try:
-                ticker_filtered_data = [entry for entry in res_filtered if entry['ticker'] == ticker]
-                if len(ticker_filtered_data) != 0:
-                    #sum up calls and puts for each day for the plot
-                    summed_data = {}
-                    for entry in ticker_filtered_data:
-                        volume = int(entry['volume'])
-                        open_interest = int(entry['open_interest'])
-                        put_call = entry['put_call']
-                        
-                        if entry['date'] not in summed_data:
-                            summed_data[entry['date']] = {'CALL': {'volume': 0, 'open_interest': 0}, 'PUT': {'volume': 0, 'open_interest': 0}}
-                        
-                        summed_data[entry['date']][put_call]['volume'] += volume
-                        summed_data[entry['date']][put_call]['open_interest'] += open_interest
-
-                    result_list = [{'date': date, 'CALL': summed_data[date]['CALL'], 'PUT': summed_data[date]['PUT']} for date in summed_data]
-                    #reverse the list
-                    result_list = result_list[::-1]
-                    with open(f"json/options-flow/company/{ticker}.json", 'w') as file:
-                        ujson.dump(result_list, file)
-            except:
-                pass
-
+        flow = company_flow(df)
         #Save bubble data for each ticker for overview page
-        for ticker in chunk:
-
-            bubble_data = {}
-            for time_period, days in {'oneDay': 1, 'oneWeek': 7, 'oneMonth': 30, 'threeMonth': 90, 'sixMonth': 180, 'oneYear': 252}.items():
-                start_date = end_date - timedelta(days=days) #end_date is today
+        bubbles = bubble_metrics(df, end_date)
 
-                filtered_data = [item for item in res_filtered if start_date <= datetime.strptime(item['date'], '%Y-%m-%d').date() <= end_date]
-
-                ticker_filtered_data = [entry for entry in filtered_data if entry['ticker'] == ticker]
-                put_volume, call_volume = calculate_put_call_volumes(ticker_filtered_data)
-                avg_dte = calculate_avg_dte(ticker_filtered_data)
-                bubble_data[time_period] = {'putVolume': put_volume, 'callVolume': call_volume, 'avgDTE': avg_dte}
+        empty = {'putVolume': 0, 'callVolume': 0, 'avgDTE': 0}
+        for ticker in chunk:
+            if ticker in flow:
+                with open(f"json/options-flow/company/{ticker}.json", 'w') as file:
+                    ujson.dump(flow[ticker], file)
 
+            bubble_data = {time_period: bubbles.get(ticker, {}).get(time_period, empty) for time_period in windows}
             if all(all(value == 0 for value in data.values()) for data in bubble_data.values()):
                 bubble_data = {}
                 #don't save the json
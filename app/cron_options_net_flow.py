@@ -3,9 +3,9 @@ from datetime import datetime, timedelta, date
 import ujson
 import os
 import numpy as np
+import pandas as pd
 from dotenv import load_dotenv
 from benzinga import financial_data
-from collections import defaultdict
 from tqdm import tqdm
 
 load_dotenv()
@@ -13,113 +13,79 @@ api_key = os.getenv('BENZINGA_API_KEY')
 
 fin = financial_data.Benzinga(api_key)
 
+chunk_size = 25  # Tickers per options activity request
+interval = '1h'  # Bucket size of the net flow chart
+
 
 def save_json(symbol, data):
     with open(f"json/options-net-flow/companies/{symbol}.json", 'w') as file:
         ujson.dump(data, file)
 
 def calculate_moving_average(data, window_size):
-    data = np.array(data, dtype=float)
-    cumsum = np.cumsum(data)
-    moving_avg = (cumsum[window_size - 1:] - np.concatenate(([0], cumsum[:-window_size]))) / window_size
-    return moving_avg.tolist()
-
-
-def calculate_net_flow(data):
-    date_data = defaultdict(lambda: {'price': [], 'netCall': 0, 'netPut': 0})
-    for item in data:
-        date_str = item['date']
-        time_str = item['time']
-        datetime_str = f"{date_str} {time_str}"
-        
-        # Parse the combined date and time into a datetime object
-        date_time = datetime.strptime(datetime_str, '%Y-%m-%d %H:%M:%S')
-        
+    return pd.Series(data, dtype=float).rolling(window_size).mean().dropna().tolist()
+
+
+def fetch_activity(tickers, start_date_str, end_date_str):
+    res_list = []
+    for page in range(0, 1000):
         try:
-            premium = float(item['cost_basis'])
-            date_data[date_time]['price'].append(round(float(item['underlying_price']), 2))
-            if item['put_call'] == 'CALL':
-                if item['execution_estimate'] == 'AT_ASK':
-                    date_data[date_time]['netCall'] += premium
-                elif item['execution_estimate'] == 'AT_BID':
-                    date_data[date_time]['netCall'] -= premium
-            elif item['put_call'] == 'PUT':
-                if item['execution_estimate'] == 'AT_ASK':
-                    date_data[date_time]['netPut'] -= premium
-                elif item['execution_estimate'] == 'AT_BID':
-                    date_data[date_time]['netPut'] += premium
+            data = fin.options_activity(company_tickers=','.join(tickers), page=page, pagesize=1000, date_from=start_date_str, date_to=end_date_str)
+            data = ujson.loads(fin.output(data))['option_activity']
+            res_list += data
         except:
-            pass
-
-    # Calculate average underlying price and format the results
-    result = []
-    for date_time, values in date_data.items():
-        result.append({
-            'date': date_time.strftime('%Y-%m-%d %H:%M:%S'),
-            'price': sum(values['price']) / len(values['price']) if values['price'] else 0,
-            'netCall': int(values['netCall']),
-            'netPut': int(values['netPut']),
-        })
-
-    sorted_data = sorted(result, key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d %H:%M:%S'))
-
-    # Compute 30-minute interval averages
-    interval_data = defaultdict(lambda: {'price': [], 'netCall': [], 'netPut': []})
-    for item in sorted_data:
-        date_time = datetime.strptime(item['date'], '%Y-%m-%d %H:%M:%S')
-        interval_start = date_time.replace(minute=date_time.minute // 120 * 120, second=0)
-        
-        interval_data[interval_start]['price'].append(item['price'])
-        interval_data[interval_start]['netCall'].append(item['netCall'])
-        interval_data[interval_start]['netPut'].append(item['netPut'])
-
-    # Calculate averages for each 30-minute interval
-    averaged_data = []
-    for interval_start, values in interval_data.items():
-        if values['price']:
-            averaged_data.append({
-                'date': interval_start.strftime('%Y-%m-%d %H:%M:%S'),
-                #'price': sum(values['price']) / len(values['price']) ,
-                'netCall': sum(values['netCall']) if values['netCall'] else 0,
-                'netPut': sum(values['netPut']) if values['netPut'] else 0,
-            })
-
-    # Sort the averaged data by interval start time
-    averaged_data.sort(key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d %H:%M:%S'))
-
-    return averaged_data
-
-def get_data(symbol):
-    try:
-        end_date = date.today()
-        start_date = end_date - timedelta(10)
-
-        end_date_str = end_date.strftime('%Y-%m-%d')
-        start_date_str = start_date.strftime('%Y-%m-%d')
-
-        res_list = []
-        for page in range(0, 1000):
-            try:
-                data = fin.options_activity(company_tickers=symbol, page=page, pagesize=1000, date_from=start_date_str, date_to=end_date_str)
-                data = ujson.loads(fin.output(data))['option_activity']
-                res_list += data
-            except:
-                break
-
-        res_filtered = [{key: value for key, value in item.items() if key in ['ticker','time','date','execution_estimate', 'underlying_price', 'put_call', 'cost_basis']} for item in res_list]
-        
-        #Save raw data for each ticker for options page stack bar chart
-        ticker_filtered_data = [entry for entry in res_filtered if entry['ticker'] == symbol]
-        if len(ticker_filtered_data) > 100:
-            net_flow_data = calculate_net_flow(ticker_filtered_data)
-            if len(net_flow_data) > 0:
-                save_json(symbol, net_flow_data)
-     
-
-    except ValueError as ve:
-        print(ve)
-    except Exception as e:
-        print(e)
+            break
+    return res_list
+
+def load_frame(res_list):
+    """
+    Typed activity frame with the signed call/put premium of every trade.
+    """
+    df = pd.DataFrame(res_list, columns=['ticker', 'time', 'date', 'execution_estimate', 'underlying_price', 'put_call', 'cost_basis'])
+    df['timestamp'] = pd.to_datetime(df['date'] + ' ' + df['time'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    df['premium'] = pd.to_numeric(df['cost_basis'], errors='coerce')
+    df = df.dropna(subset=['timestamp', 'premium'])
+
+    # Bought calls and sold puts are bullish, sold calls and bought puts bearish
+    at_ask = df['execution_estimate'] == 'AT_ASK'
+    at_bid = df['execution_estimate'] == 'AT_BID'
+    sign = np.where(at_ask, 1, np.where(at_bid, -1, 0))
+    df['netCall'] = np.where(df['put_call'] == 'CALL', sign * df['premium'], 0)
+    df['netPut'] = np.where(df['put_call'] == 'PUT', -sign * df['premium'], 0)
+    return df[['ticker', 'timestamp', 'netCall', 'netPut']]
+
+def calculate_net_flow(df):
+    # Net premium per trade timestamp (truncated like before), then summed per interval bucket
+    per_timestamp = df.groupby('timestamp')[['netCall', 'netPut']].sum().apply(np.trunc).astype(int)
+    buckets = per_timestamp.resample(interval).agg(['sum', 'count'])
+    buckets = buckets[buckets[('netCall', 'count')] > 0]
+
+    return [
+        {'date': interval_start.strftime('%Y-%m-%d %H:%M:%S'), 'netCall': int(net_call), 'netPut': int(net_put)}
+        for interval_start, net_call, net_put in zip(buckets.index, buckets[('netCall', 'sum')], buckets[('netPut', 'sum')])
+    ]
+
+def run(total_symbols):
+    end_date = date.today()
+    start_date = end_date - timedelta(10)
+
+    end_date_str = end_date.strftime('%Y-%m-%d')
+    start_date_str = start_date.strftime('%Y-%m-%d')
+
+    # One activity snapshot for the whole universe, fetched in ticker chunks
+    res_list = []
+    for i in tqdm(range(0, len(total_symbols), chunk_size)):
+        res_list += fetch_activity(total_symbols[i:i + chunk_size], start_date_str, end_date_str)
+
+    df = load_frame(res_list)
+    symbols = set(total_symbols)
+    for symbol, group in df.groupby('ticker', sort=False):
+        try:
+            if symbol in symbols and len(group) > 100:
+                net_flow_data = calculate_net_flow(group)
+                if len(net_flow_data) > 0:
+                    save_json(symbol, net_flow_data)
+        except Exception as e:
+            print(e)
 
 try:
     stock_con = sqlite3.connect('stocks.db')
@@ -137,9 +103,7 @@ try:
     
     total_symbols = stock_symbols + etf_symbols
 
-    for symbol in tqdm(total_symbols):
-        get_data(symbol)
+    run(total_symbols)
 
 except Exception as e:
     print(e)
-
@@ -20,6 +20,7 @@ from email.mime.text import MIMEText
 import boto3
 from botocore.exceptions import NoCredentialsError
 from bs4 import BeautifulSoup
+from utils.quote_store import load_quote
 
 from dotenv import load_dotenv
 import os
@@ -114,8 +115,8 @@ async def run():
     if len(result) != 0:
         for item in result:
             symbol = item.symbol
-            with open(f"json/quote/{symbol}.json", 'r') as file:
-                data = ujson.load(file)
+            data = load_quote(symbol)
+            if data is not None:
                 current_price = round(data['price'],2)
                 target_price = round(item.target_price,2)
                 if (item.condition == 'below') and target_price >= current_price:
@@ -1,72 +1,71 @@
 import ujson
-import asyncio
-import aiohttp
+import os
+import signal
 import sqlite3
 from datetime import datetime
 from ml_models.prophet_model import PricePredictor
-import yfinance as yf
 import pandas as pd
 from tqdm import tqdm
 import concurrent.futures
 
+SYMBOL_TIMEOUT = 600 # Seconds allowed for a single Prophet fit
+PROGRESS_DIR = "json/price-analysis/progress"
 
-def convert_symbols(symbol_list):
-    """
-    Converts the symbols in the given list from 'BTCUSD' and 'USDTUSD' format to 'BTC-USD' and 'USDT-USD' format.
-    
-    Args:
-        symbol_list (list): A list of strings representing the symbols to be converted.
-    
-    Returns:
-        list: A new list with the symbols converted to the desired format.
-    """
-    converted_symbols = []
-    for symbol in symbol_list:
-        # Determine the base and quote currencies
-        base_currency = symbol[:-3]
-        quote_currency = symbol[-3:]
-        
-        # Construct the new symbol in the desired format
-        new_symbol = f"{base_currency}-{quote_currency}"
-        converted_symbols.append(new_symbol)
-    
-    return converted_symbols
-
-async def save_json(symbol, data):
+
+def save_json(symbol, data):
     with open(f"json/price-analysis/{symbol}.json", 'w') as file:
         ujson.dump(data, file)
 
-async def download_data(ticker, start_date, end_date):
-    try:
-        df = yf.download(ticker, start=start_date, end=end_date, interval="1d")
-        df = df.reset_index()
-        df = df[['Date', 'Adj Close']]
-        df = df.rename(columns={"Date": "ds", "Adj Close": "y"})
-        if len(df) > 252*2: #At least 2 years of history is necessary
-            q_high= df["y"].quantile(0.99)
-            q_low = df["y"].quantile(0.05)
-            df = df[(df["y"] > q_low)]
-            df = df[(df["y"] < q_high)]
-            #df['y'] = df['y'].rolling(window=10).mean()
-            #df = df.dropna()
-            return df
-    except Exception as e:
-        print(e)
+def get_progress_path():
+    # One progress log per ISO week, so an interrupted weekly run resumes where it stopped
+    year, week, _ = datetime.today().isocalendar()
+    return f"{PROGRESS_DIR}/{year}-W{week:02d}.txt"
 
-async def process_symbol(ticker, start_date, end_date, crypto_symbols):
+def load_progress(path):
     try:
-        df = await download_data(ticker, start_date, end_date)
-        data = PricePredictor().run(df)
-
-        if ticker in crypto_symbols:
-            ticker = ticker.replace('-','') #convert back from BTC-USD to BTCUSD
-        await save_json(ticker, data)
-    
+        with open(path, 'r') as file:
+            return set(line.strip() for line in file if line.strip())
+    except FileNotFoundError:
+        return set()
+
+def load_data(ticker, db_path, start_date, end_date):
+    # Prices come from the local OHLC tables instead of yfinance
+    query = f"""
+        SELECT date, close
+        FROM "{ticker}"
+        WHERE date BETWEEN ? AND ?
+    """
+    with sqlite3.connect(db_path) as con:
+        df = pd.read_sql_query(query, con, params=(start_date, end_date))
+    df = df.rename(columns={"date": "ds", "close": "y"})
+    df['ds'] = pd.to_datetime(df['ds'])
+    df = df.dropna().sort_values('ds').reset_index(drop=True)
+    if len(df) > 252*2: #At least 2 years of history is necessary
+        q_high= df["y"].quantile(0.99)
+        q_low = df["y"].quantile(0.05)
+        df = df[(df["y"] > q_low)]
+        df = df[(df["y"] < q_high)]
+        return df
+
+def handle_timeout(signum, frame):
+    raise TimeoutError("Prophet fit timed out")
+
+def process_symbol(ticker, db_path, start_date, end_date):
+    signal.signal(signal.SIGALRM, handle_timeout)
+    signal.alarm(SYMBOL_TIMEOUT)
+    try:
+        df = load_data(ticker, db_path, start_date, end_date)
+        if df is None:
+            return ticker, None
+        return ticker, PricePredictor().run(df)
     except Exception as e:
-        print(e)
+        print(f"{ticker}: {e}")
+        return ticker, None
+    finally:
+        signal.alarm(0)
 
 
-async def run():
+def run():
     con = sqlite3.connect('stocks.db')
     etf_con = sqlite3.connect('etf.db')
     crypto_con = sqlite3.connect('crypto.db')
@@ -87,27 +86,37 @@ async def run():
     crypto_cursor.execute("PRAGMA journal_mode = wal")
     crypto_cursor.execute("SELECT DISTINCT symbol FROM cryptos")
     crypto_symbols = [row[0] for row in crypto_cursor.fetchall()]
-    crypto_symbols = convert_symbols(crypto_symbols) #Convert BTCUSD to BTC-USD for yfinance
 
     con.close()
     etf_con.close()
     crypto_con.close()
 
-    total_symbols = stock_symbols + etf_symbols + crypto_symbols
-    print(f"Total tickers: {len(total_symbols)}")
+    jobs = [(symbol, 'stocks.db') for symbol in stock_symbols] + \
+           [(symbol, 'etf.db') for symbol in etf_symbols] + \
+           [(symbol, 'crypto.db') for symbol in crypto_symbols]
+    print(f"Total tickers: {len(jobs)}")
     start_date = datetime(2000, 1, 1).strftime("%Y-%m-%d")
     end_date = datetime.today().strftime("%Y-%m-%d")
 
-    chunk_size = len(total_symbols) // 70  # Divide the list into N chunks
-    chunks = [total_symbols[i:i + chunk_size] for i in range(0, len(total_symbols), chunk_size)]
-    for chunk in chunks:
-        tasks = []
-        for ticker in tqdm(chunk):
-            tasks.append(process_symbol(ticker, start_date, end_date, crypto_symbols))
-
-        await asyncio.gather(*tasks)
-
-try:
-    asyncio.run(run())
-except Exception as e:
-    print(e)
+    os.makedirs(PROGRESS_DIR, exist_ok=True)
+    progress_path = get_progress_path()
+    done = load_progress(progress_path)
+    jobs = [(symbol, db_path) for symbol, db_path in jobs if symbol not in done]
+    print(f"Remaining tickers: {len(jobs)}")
+
+    num_processes = os.cpu_count() or 4
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor, open(progress_path, 'a') as progress_file:
+        futures = [executor.submit(process_symbol, symbol, db_path, start_date, end_date) for symbol, db_path in jobs]
+        # Results are saved and checkpointed in the parent as soon as each fit finishes
+        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures)):
+            ticker, data = future.result()
+            if data is not None:
+                save_json(ticker, data)
+            progress_file.write(f"{ticker}\n")
+            progress_file.flush()
+
+if __name__ == "__main__":
+    try:
+        run()
+    except Exception as e:
+        print(e)
@@ -4,6 +4,7 @@ import aiohttp
 import sqlite3
 from datetime import datetime
 import pytz
+from utils.quote_store import QuoteStore, write_quotes, export_json_files, load_json_files, read_json_file
 
 from dotenv import load_dotenv
 import os
@@ -53,36 +54,23 @@ async def get_bid_ask_quote_of_stocks(ticker_list):
             else:
                 return {}
 
-async def save_quote_as_json(symbol, data):
-    with open(f"json/quote/{symbol}.json", 'w') as file:
-        ujson.dump(data, file)
-
-async def save_pre_post_quote_as_json(symbol, data):
+async def save_pre_post_quote_as_json(symbol, data, quotes):
     try:
-        with open(f"json/quote/{symbol}.json", 'r') as file:
-            previous_close = (ujson.load(file))['price']
-            changes_percentage = round((data['price']/previous_close-1)*100,2)
+        previous_close = quotes[symbol]['price']
+        changes_percentage = round((data['price']/previous_close-1)*100,2)
         with open(f"json/pre-post-quote/{symbol}.json", 'w') as file:
             res = {'symbol': symbol, 'price': round(data['price'],2), 'changesPercentage': changes_percentage, 'time': data['timestamp']}
             ujson.dump(res, file)
     except Exception as e:
         pass
 
-async def save_bid_ask_as_json(symbol, data):
+def update_bid_ask(symbol, data, quotes):
     try:
-        # Read previous close price and load existing quote data
-        with open(f"json/quote/{symbol}.json", 'r') as file:
-            quote_data = ujson.load(file)
-
-        # Update quote data with new price, ask, bid, changesPercentage, and timestamp
-        quote_data.update({
+        # Update quote data with new ask and bid
+        quotes[symbol].update({
             'ask': round(data['ask'], 2),  # Add ask price
             'bid': round(data['bid'], 2),   # Add bid price
         })
-
-        # Save the updated quote data back to the same JSON file
-        with open(f"json/quote/{symbol}.json", 'w') as file:
-            ujson.dump(quote_data, file)
     except Exception as e:
         print(f"An error occurred: {e}")  # Print the error for debugging
 
@@ -118,12 +106,19 @@ async def run():
                   current_time_new_york.hour >= 16)
 
 
+    # Start from the previous snapshot so symbols missing from this run keep their last quote
+    quotes = QuoteStore().all() or load_json_files()
+    updated = set()
+    # Raw FMP quotes fetched this run and the bid/ask updates, kept apart from the snapshot rows
+    fetched = {}
+    bid_ask = {}
+
     #Crypto Quotes
     latest_quote = await get_quote_of_stocks(crypto_symbols)
     for item in latest_quote:
-        symbol = item['symbol']
-
-        await save_quote_as_json(symbol, item)
+        quotes[item['symbol']] = item
+        fetched[item['symbol']] = item
+        updated.add(item['symbol'])
 
     # Stock and ETF Quotes
     
@@ -136,21 +131,37 @@ async def run():
         if is_market_closed == False:
             latest_quote = await get_quote_of_stocks(chunk)
             for item in latest_quote:
-                symbol = item['symbol']
-                await save_quote_as_json(symbol, item)
-                #print(f"Saved data for {symbol}.")
+                quotes[item['symbol']] = item
+                fetched[item['symbol']] = item
+                updated.add(item['symbol'])
 
         if is_market_closed == True:
             latest_quote = await get_pre_post_quote_of_stocks(chunk)
             for item in latest_quote:
                 symbol = item['symbol']
-                await save_pre_post_quote_as_json(symbol, item)
+                await save_pre_post_quote_as_json(symbol, item, quotes)
                 #print(f"Saved data for {symbol}.")
         #Always true
         bid_ask_quote = await get_bid_ask_quote_of_stocks(chunk)
         for item in bid_ask_quote:
-            symbol = item['symbol']
-            await save_bid_ask_as_json(symbol, item)
+            update_bid_ask(item['symbol'], item, quotes)
+            bid_ask[item['symbol']] = item
+            updated.add(item['symbol'])
+
+    # One atomic snapshot for all readers, plus the per-symbol JSON files for legacy consumers
+    write_quotes(quotes.values())
+
+    # The JSON files are exported from the fetched quotes (or the previous file for bid/ask-only
+    # updates), never from snapshot rows, which drop fields and truncate text
+    exported = []
+    for symbol in updated:
+        item = fetched.get(symbol) or read_json_file(symbol)
+        if item is None:
+            continue
+        if symbol in bid_ask and symbol not in fetched:
+            update_bid_ask(symbol, bid_ask[symbol], {symbol: item})
+        exported.append(item)
+    export_json_files(exported)
 
 try:
     asyncio.run(run())
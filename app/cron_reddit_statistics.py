@@ -1,14 +1,13 @@
 import json
 import re
-import requests
-import praw
-from datetime import datetime, timedelta
+import orjson
+from datetime import datetime, timedelta, date
 from collections import defaultdict
-import os
-from dotenv import load_dotenv
 import sqlite3
 import nltk
 from nltk.sentiment import SentimentIntensityAnalyzer
+from utils.reddit_log import connect
+from utils.quote_store import load_quote
 
 # Download required NLTK data
 nltk.download('vader_lexicon', quiet=True)
@@ -21,93 +20,104 @@ con = sqlite3.connect('stocks.db')
 cursor = con.cursor()
 cursor.execute("PRAGMA journal_mode = wal")
 cursor.execute("SELECT DISTINCT symbol FROM stocks")
-stock_symbols = [row[0] for row in cursor.fetchall()]
+stock_symbols = set(row[0] for row in cursor.fetchall())
 
 etf_con = sqlite3.connect('etf.db')
 etf_cursor = etf_con.cursor()
 etf_cursor.execute("PRAGMA journal_mode = wal")
 etf_cursor.execute("SELECT DISTINCT symbol FROM etfs")
-etf_symbols = [row[0] for row in etf_cursor.fetchall()]
+etf_symbols = set(row[0] for row in etf_cursor.fetchall())
 
-total_symbols = stock_symbols + etf_symbols
+total_symbols = stock_symbols | etf_symbols
 con.close()
 etf_con.close()
 
-load_dotenv()
-client_key = os.getenv('REDDIT_API_KEY')
-client_secret = os.getenv('REDDIT_API_SECRET')
-user_agent = os.getenv('REDDIT_USER_AGENT')
-
-# Initialize Reddit instance
-reddit = praw.Reddit(
-    client_id=client_key,
-    client_secret=client_secret,
-    user_agent=user_agent
-)
+# Compile regex patterns for finding tickers, PUT, and CALL
+ticker_pattern = re.compile(r'\$([A-Z]+)')
+put_pattern = re.compile(r'\b(PUT|PUTS)\b', re.IGNORECASE)
+call_pattern = re.compile(r'\b(CALL|CALLS)\b', re.IGNORECASE)
 
 # Function to save data
 def save_data(data, filename):
     with open(f'json/reddit-tracker/wallstreetbets/{filename}', 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
-def compute_daily_statistics(file_path):
-    # Load the data from the JSON file
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    # Initialize a defaultdict to store daily statistics
-    daily_stats = defaultdict(lambda: {
-        'post_count': 0, 
-        'total_comments': 0, 
-        'ticker_mentions': defaultdict(lambda: {'total': 0, 'PUT': 0, 'CALL': 0, 'sentiment': []}),
-        'unique_tickers': set()
-    })
-    
-    # Compile regex patterns for finding tickers, PUT, and CALL
-    ticker_pattern = re.compile(r'\$([A-Z]+)')
-    put_pattern = re.compile(r'\b(PUT|PUTS)\b', re.IGNORECASE)
-    call_pattern = re.compile(r'\b(CALL|CALLS)\b', re.IGNORECASE)
-    
-    # Process each post
-    for post in data:
-        # Convert UTC timestamp to datetime object
-        post_date = datetime.utcfromtimestamp(post['created_utc']).date()
-        
-        # Update statistics for this day
-        daily_stats[post_date]['post_count'] += 1
-        daily_stats[post_date]['total_comments'] += post['num_comments']
-        
+def compute_post_features(log_con):
+    """
+    Extract tickers, put/call mentions and sentiment for posts that are new or were edited.
+    """
+    rows = log_con.execute("SELECT id, title, selftext, content_hash FROM posts WHERE feature_hash IS NULL OR feature_hash != content_hash").fetchall()
+
+    updates = []
+    for post_id, title, selftext, digest in rows:
         # Find ticker mentions in title and selftext
-        text_to_search = post['title'] + ' ' + post['selftext']
+        text_to_search = (title or '') + ' ' + (selftext or '')
         tickers = ticker_pattern.findall(text_to_search)
-        
+
         # Check for PUT and CALL mentions
         put_mentions = len(put_pattern.findall(text_to_search))
         call_mentions = len(call_pattern.findall(text_to_search))
-        
+
         # Perform sentiment analysis
-        sentiment_scores = sia.polarity_scores(text_to_search)
-        
-        for ticker in tickers:
-            daily_stats[post_date]['ticker_mentions'][ticker]['total'] += 1
-            daily_stats[post_date]['unique_tickers'].add(ticker)
-            
-            # Add PUT and CALL counts
-            daily_stats[post_date]['ticker_mentions'][ticker]['PUT'] += put_mentions
-            daily_stats[post_date]['ticker_mentions'][ticker]['CALL'] += call_mentions
-            
-            # Add sentiment score
-            daily_stats[post_date]['ticker_mentions'][ticker]['sentiment'].append(sentiment_scores['compound'])
-    
-    # Calculate averages and format the results
+        sentiment = sia.polarity_scores(text_to_search)['compound']
+
+        updates.append((orjson.dumps(tickers).decode('utf-8'), put_mentions, call_mentions, sentiment, digest, post_id))
+
+    log_con.executemany("UPDATE posts SET tickers = ?, put = ?, call = ?, sentiment = ?, feature_hash = ? WHERE id = ?", updates)
+    log_con.commit()
+    return len(updates)
+
+def materialize_daily_stats(log_con):
+    """
+    Rebuild the aggregates of days that have new or changed posts from the cached post features.
+    """
+    # The tracker may write while this runs: only the posts captured here are cleared afterwards
+    dirty_posts = log_con.execute("SELECT id, day, content_hash, num_comments FROM posts WHERE dirty = 1").fetchall()
+    days = sorted({day for _, day, _, _ in dirty_posts})
+
+    for day in days:
+        post_count = 0
+        total_comments = 0
+        mentions = {}
+        # Posts inserted since compute_post_features have no features yet; they stay dirty for the next run
+        rows = log_con.execute("SELECT num_comments, tickers, put, call, sentiment FROM posts WHERE day = ? AND tickers IS NOT NULL ORDER BY created_utc DESC", (day,))
+        for num_comments, tickers, put_mentions, call_mentions, sentiment in rows:
+            post_count += 1
+            total_comments += num_comments
+            for ticker in orjson.loads(tickers):
+                counts = mentions.setdefault(ticker, {'total': 0, 'PUT': 0, 'CALL': 0, 'sentimentSum': 0, 'sentimentCount': 0})
+                counts['total'] += 1
+                counts['PUT'] += put_mentions
+                counts['CALL'] += call_mentions
+                counts['sentimentSum'] += sentiment
+                counts['sentimentCount'] += 1
+
+        log_con.execute("INSERT OR REPLACE INTO daily_stats (day, post_count, total_comments, mentions) VALUES (?, ?, ?, ?)",
+                        (day, post_count, total_comments, orjson.dumps(mentions).decode('utf-8')))
+
+    log_con.executemany("UPDATE posts SET dirty = 0 WHERE id = ? AND content_hash = ? AND num_comments = ? AND feature_hash = content_hash",
+                        [(post_id, digest, num_comments) for post_id, _, digest, num_comments in dirty_posts])
+    log_con.commit()
+    return len(days)
+
+def compute_daily_statistics(log_con):
+    daily_stats = {}
+    for day, post_count, total_comments, mentions in log_con.execute("SELECT day, post_count, total_comments, mentions FROM daily_stats ORDER BY day DESC"):
+        daily_stats[date.fromisoformat(day)] = {
+            'post_count': post_count,
+            'total_comments': total_comments,
+            'ticker_mentions': orjson.loads(mentions),
+        }
+
+    # Format the results
     formatted_stats = []
-    for date, stats in sorted(daily_stats.items(), reverse=True):
+    for day, stats in daily_stats.items():
         formatted_stats.append({
-            'date': date.isoformat(),
+            'date': day.isoformat(),
             'totalPosts': stats['post_count'],
             'totalComments': stats['total_comments'],
             'totalMentions': sum(mentions['total'] for mentions in stats['ticker_mentions'].values()),
-            'companySpread': len(stats['unique_tickers']),
+            'companySpread': len(stats['ticker_mentions']),
             'tickerMentions': [
                 {
                     'symbol': ticker,
@@ -125,15 +135,13 @@ def compute_trending_tickers(daily_stats):
     today = datetime.now().date()
     seven_days_ago = today - timedelta(days=14)
     
-    trending = defaultdict(lambda: {'total': 0, 'PUT': 0, 'CALL': 0, 'sentiment': []})
+    trending = defaultdict(lambda: {'total': 0, 'PUT': 0, 'CALL': 0, 'sentimentSum': 0, 'sentimentCount': 0})
     
-    for date, stats in daily_stats.items():
-        if seven_days_ago <= date <= today:
+    for day, stats in daily_stats.items():
+        if seven_days_ago <= day <= today:
             for ticker, counts in stats['ticker_mentions'].items():
-                trending[ticker]['total'] += counts['total']
-                trending[ticker]['PUT'] += counts['PUT']
-                trending[ticker]['CALL'] += counts['CALL']
-                trending[ticker]['sentiment'].extend(counts['sentiment'])
+                for key in ['total', 'PUT', 'CALL', 'sentimentSum', 'sentimentCount']:
+                    trending[ticker][key] += counts[key]
     
     trending_list = [
         {
@@ -141,7 +149,7 @@ def compute_trending_tickers(daily_stats):
             'count': counts['total'],
             'put': counts['PUT'],
             'call': counts['CALL'],
-            'avgSentiment': round(sum(counts['sentiment']) / len(counts['sentiment']),2) if counts['sentiment'] else 0
+            'avgSentiment': round(counts['sentimentSum'] / counts['sentimentCount'],2) if counts['sentimentCount'] else 0
         }
         for symbol, counts in trending.items() if symbol in total_symbols
     ]
@@ -150,11 +158,10 @@ def compute_trending_tickers(daily_stats):
     for item in trending_list:
         symbol = item['symbol']
         try:
-            with open(f'json/quote/{symbol}.json') as f:
-                data = json.load(f)
-                name = data['name']
-                price = round(data['price'],2)
-                changes_percentage = round(data['changesPercentage'],2)
+            data = load_quote(symbol)
+            name = data['name']
+            price = round(data['price'],2)
+            changes_percentage = round(data['changesPercentage'],2)
         except Exception as e:
             print(e)
             name = None
@@ -177,10 +184,15 @@ def compute_trending_tickers(daily_stats):
     return trending_list
 
 # Usage
-file_path = 'json/reddit-tracker/wallstreetbets/data.json'
-daily_statistics, daily_stats_dict = compute_daily_statistics(file_path)
+log_con = connect()
+print(f"Processed {compute_post_features(log_con)} new or edited posts")
+print(f"Rebuilt statistics for {materialize_daily_stats(log_con)} days")
+
+daily_statistics, daily_stats_dict = compute_daily_statistics(log_con)
 save_data(daily_statistics, 'stats.json')
 
 # Compute and save trending tickers
 trending_tickers = compute_trending_tickers(daily_stats_dict)
-save_data(trending_tickers, 'trending.json')
\ No newline at end of file
+save_data(trending_tickers, 'trending.json')
+
+log_con.close()
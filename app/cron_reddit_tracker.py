@@ -1,32 +1,23 @@
 import praw
-import json
-from datetime import datetime
+import orjson
 import os
 from dotenv import load_dotenv
-import time
+from utils.reddit_log import connect, upsert_posts, import_json, latest_posts, LATEST_POSTS_PATH
 
 load_dotenv()
 client_key = os.getenv('REDDIT_API_KEY')
 client_secret = os.getenv('REDDIT_API_SECRET')
 user_agent = os.getenv('REDDIT_USER_AGENT')
 
-# File path for the JSON data
+# Old full-history file, only read to seed an empty post log
 file_path = 'json/reddit-tracker/wallstreetbets/data.json'
 
-# Ensure the directory exists
-os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-# Function to load existing data
-def load_existing_data():
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
-
-# Function to save data
-def save_data(data):
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+# Function to save the newest posts shown on the reddit tracker page
+def save_latest(con):
+    tmp_path = f"{LATEST_POSTS_PATH}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(latest_posts(con)))
+    os.replace(tmp_path, LATEST_POSTS_PATH)
 
 # Initialize Reddit instance
 reddit = praw.Reddit(
@@ -35,53 +26,33 @@ reddit = praw.Reddit(
     user_agent=user_agent
 )
 
-# Load existing data
-existing_data = load_existing_data()
-
-# Create a dictionary of existing posts for faster lookup and update
-existing_posts = {post['id']: post for post in existing_data}
-
-# Flag to check if any data was added or updated
-data_changed = False
+con = connect()
+if con.execute("SELECT COUNT(*) FROM posts").fetchone()[0] == 0:
+    print(f"Imported {import_json(con, file_path)} posts from {file_path}")
 
 # Get the subreddit
 subreddit = reddit.subreddit("wallstreetbets")
 
-# Iterate through new submissions
+# Only new posts and posts whose text, ratio or comment count changed are written
+posts = []
 for submission in subreddit.new(limit=1000):
-    post_id = submission.id
-    # Check if this post is already in our data
-    if post_id in existing_posts:
-        # Update existing post
-        existing_posts[post_id]['upvote_ratio'] = submission.upvote_ratio
-        existing_posts[post_id]['num_comments'] = submission.num_comments
-        data_changed = True
-    else:
-        # Extract the required fields for new post
-        extracted_post = {
-            "id": post_id,
-            "permalink": submission.permalink,
-            "title": submission.title,
-            "selftext": submission.selftext,
-            "created_utc": int(submission.created_utc),
-            "upvote_ratio": submission.upvote_ratio,
-            "num_comments": submission.num_comments,
-            "link_flair_text": submission.link_flair_text,
-            "author": str(submission.author),
-        }
-        
-        # Add the new post to the existing data
-        existing_posts[post_id] = extracted_post
-        data_changed = True
-
-
-if data_changed:
-    # Convert the dictionary back to a list and sort by created_utc
-    updated_data = list(existing_posts.values())
-    updated_data.sort(key=lambda x: x['created_utc'], reverse=True)
-    
-    # Save the updated data
-    save_data(updated_data)
-    print(f"Data updated and saved to {file_path}")
+    posts.append({
+        "id": submission.id,
+        "permalink": submission.permalink,
+        "title": submission.title,
+        "selftext": submission.selftext,
+        "created_utc": int(submission.created_utc),
+        "upvote_ratio": submission.upvote_ratio,
+        "num_comments": submission.num_comments,
+        "link_flair_text": submission.link_flair_text,
+        "author": str(submission.author),
+    })
+
+changed = upsert_posts(con, posts)
+if changed or not os.path.exists(LATEST_POSTS_PATH):
+    save_latest(con)
+    print(f"{changed} posts added or updated")
 else:
-    print("No new data to add or update.")
\ No newline at end of file
+    print("No new data to add or update.")
+
+con.close()
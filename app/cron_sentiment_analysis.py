@@ -8,6 +8,9 @@ import sqlite3
 import ujson
 import time
 import random
+import hashlib
+import numpy as np
+from collections import defaultdict
 from dotenv import load_dotenv
 import os
 import re 
@@ -21,6 +24,9 @@ load_dotenv()
 api_key = os.getenv('FMP_API_KEY')
 sid = SentimentIntensityAnalyzer()
 
+score_cache_path = "json/sentiment-analysis/score-cache.db"
+windows = {'oneWeek': 10, 'oneMonth': 30, 'threeMonth': 90, 'sixMonth': 180, 'oneYear': 365}
+
 
 def convert_symbols(symbol_list):
     """
@@ -91,33 +97,84 @@ def compute_sentiment_score(sentence):
     scaled_score = (sentiment_score + 1) * 5  # Map from [-1, 1] to [0, 10]
     return scaled_score
 
-def get_sentiment(symbol, res_list, is_crypto=False):
+class ScoreCache:
+    """
+    On-disk memo of sentence scores keyed by content hash, so an article is only scored once across runs.
+    """
+    def __init__(self, path=score_cache_path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.con = sqlite3.connect(path)
+        self.con.execute("CREATE TABLE IF NOT EXISTS scores (hash TEXT PRIMARY KEY, score REAL, last_used TEXT)")
+        self.today = datetime.now().strftime('%Y-%m-%d')
+
+    def scores(self, sentences):
+        sentences = [sentence or '' for sentence in sentences]
+        hashes = [hashlib.sha1(sentence.encode('utf-8')).hexdigest() for sentence in sentences]
+        unique = list(set(hashes))
+
+        known = {}
+        for i in range(0, len(unique), 500):
+            batch = unique[i:i + 500]
+            rows = self.con.execute(f"SELECT hash, score FROM scores WHERE hash IN ({','.join('?' * len(batch))})", batch).fetchall()
+            known.update(rows)
+
+        new_rows = []
+        for key, sentence in zip(hashes, sentences):
+            if key not in known:
+                known[key] = compute_sentiment_score(sentence)
+                new_rows.append((key, known[key], self.today))
+        self.con.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?, ?)", new_rows)
+        self.con.executemany("UPDATE scores SET last_used = ? WHERE hash = ?", [(self.today, key) for key in unique])
+        self.con.commit()
+        return [known[key] for key in hashes]
+
+    def prune(self, max_age_days=400):
+        # Articles older than the longest window are never looked up again
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime('%Y-%m-%d')
+        self.con.execute("DELETE FROM scores WHERE last_used < ?", (cutoff,))
+        self.con.commit()
+
+    def close(self):
+        self.con.close()
+
+def group_by_symbol(res_list):
+    # One pass over the news list; duplicates by publishedDate keep their first occurrence
+    grouped = defaultdict(list)
+    for item in res_list:
+        grouped[item['symbol']].append(item)
+    return {symbol: remove_duplicates(items, 'publishedDate') for symbol, items in grouped.items()}
+
+def get_sentiment(symbol, res_list, score_cache, is_crypto=False):
     if is_crypto == True:
         time_format = '%Y-%m-%dT%H:%M:%S.%fZ'
     else:
         time_format = '%Y-%m-%d %H:%M:%S'
 
     end_date = datetime.now().date()
-    end_date_datetime = datetime.combine(end_date, datetime.min.time())  # Convert end_date to datetime
-    
-    sentiment_scores_by_period = {}
+    oldest_date = end_date - timedelta(days=max(windows.values()))
 
-    for time_period, days in {'oneWeek': 10, 'oneMonth': 30, 'threeMonth': 90, 'sixMonth': 180, 'oneYear': 365}.items():
-        start_date = end_date - timedelta(days=days)
-        title_data = [item['title'] for item in res_list if start_date <= datetime.strptime(item['publishedDate'], time_format).date() <= end_date_datetime.date()]
-        text_data = [item['text'] for item in res_list if start_date <= datetime.strptime(item['publishedDate'], time_format).date() <= end_date_datetime.date()]
-        
+    # Dates are parsed once; only articles inside the longest window are scored
+    articles = []
+    for item in res_list:
+        published_date = datetime.strptime(item['publishedDate'], time_format).date()
+        if oldest_date <= published_date <= end_date:
+            articles.append((published_date, item['title'], item['text']))
+    articles.sort(key=lambda x: x[0], reverse=True)
 
-        sentiment_scores_title = [compute_sentiment_score(sentence) for sentence in title_data]
-        if sentiment_scores_title:  # Handle case when sentiment_scores is empty
-            average_sentiment_title_score = round(sum(sentiment_scores_title) / len(sentiment_scores_title))
-        else:
-            average_sentiment_title_score = 0
+    # Newest first: the first n entries of the running sums cover every window of n articles
+    age = np.array([(end_date - article[0]).days for article in articles])
+    title_sums = np.cumsum(score_cache.scores([article[1] for article in articles]))
+    text_sums = np.cumsum(score_cache.scores([article[2] for article in articles]))
+
+    sentiment_scores_by_period = {}
 
-        sentiment_scores_text = [compute_sentiment_score(sentence) for sentence in text_data]
-        if sentiment_scores_text:  # Handle case when sentiment_scores is empty
-            average_sentiment_text_score = round(sum(sentiment_scores_text) / len(sentiment_scores_text))
+    for time_period, days in windows.items():
+        count = int(np.searchsorted(age, days, side='right'))
+        if count > 0:  # Handle case when the window has no articles
+            average_sentiment_title_score = round(title_sums[count-1] / count)
+            average_sentiment_text_score = round(text_sums[count-1] / count)
         else:
+            average_sentiment_title_score = 0
             average_sentiment_text_score = 0
 
         sentiment_scores_by_period[time_period] = adjust_scaled_score(round((average_sentiment_title_score+average_sentiment_text_score)/2))
@@ -171,11 +228,11 @@ async def run():
             res_list+=data
 
     crypto_symbols = convert_symbols(crypto_symbols)#The News article has the symbol format BTC-USD
+    score_cache = ScoreCache()
 
+    news_by_symbol = group_by_symbol(res_list)
     for symbol in crypto_symbols:
-        filtered_ticker = [item for item in res_list if item['symbol'] == symbol]
-        filtered_ticker = remove_duplicates(filtered_ticker, 'publishedDate')
-        get_sentiment(symbol, filtered_ticker, is_crypto=True)
+        get_sentiment(symbol, news_by_symbol.get(symbol, []), score_cache, is_crypto=True)
 
     
     total_symbols = stocks_symbols+etf_symbols
@@ -190,11 +247,12 @@ async def run():
                 break
             else:
                 res_list+=data
+        news_by_symbol = group_by_symbol(res_list)
         for symbol in chunk:
-            filtered_ticker = [item for item in res_list if item['symbol'] == symbol]
-            filtered_ticker = remove_duplicates(filtered_ticker, 'publishedDate')
-            get_sentiment(symbol, filtered_ticker, is_crypto=False)
-            
+            get_sentiment(symbol, news_by_symbol.get(symbol, []), score_cache, is_crypto=False)
+
+    score_cache.prune()
+    score_cache.close()
     
 
 try:
@@ -1,66 +1,55 @@
 import ujson
-import asyncio
-import aiohttp
+import orjson
 import sqlite3
-from datetime import datetime
-from rating import rating_model
-import pandas as pd
 from tqdm import tqdm
 
-async def save_similar_stocks(symbol, data):
+
+def save_similar_stocks(symbol, data):
     with open(f"json/similar-stocks/{symbol}.json", 'w') as file:
         ujson.dump(data, file)
 
 
-query_template = """
-    SELECT 
-        quote, stock_peers
-    FROM 
-        stocks 
-    WHERE
-        symbol = ?
-"""
+def parse_quote(quote):
+    # Stored as the raw FMP quote list; only the fields shown on the similar stocks card are kept
+    try:
+        entry = orjson.loads(quote)[0]
+        return {
+            "symbol": entry["symbol"],
+            "name": entry["name"],
+            "marketCap": entry["marketCap"],
+            "avgVolume": entry["avgVolume"]
+        }
+    except:
+        return None
+
 
-async def run():
+def run():
     cursor = con.cursor()
     cursor.execute("PRAGMA journal_mode = wal")
-    cursor.execute("SELECT DISTINCT symbol FROM stocks")
-    stocks_symbols = [row[0] for row in cursor.fetchall()]
-    for ticker in tqdm(stocks_symbols):
-        filtered_df = []
-        df = pd.read_sql_query(query_template, con, params=(ticker,))
+    # One scan of the stocks table: every quote is parsed once, no matter how many peer lists it is in
+    cursor.execute("SELECT DISTINCT symbol, quote, stock_peers FROM stocks")
+    rows = cursor.fetchall()
+
+    quote_dict = {}
+    peers_dict = {}
+    for symbol, quote, stock_peers in rows:
+        quote_dict[symbol] = parse_quote(quote)
         try:
-            df = ujson.loads(df['stock_peers'].iloc[0])
+            peers_dict[symbol] = ujson.loads(stock_peers)
         except:
-            df = []
-        if len(df) > 0:
-            df = [stock for stock in df if stock in stocks_symbols]
-            for symbol in df:
-                try:
-                    df = pd.read_sql_query(query_template, con, params=(symbol,))
-                    df_dict = df.to_dict()
-                    quote_dict = eval(df_dict['quote'][0])[0]
-                    filtered_df.append(quote_dict)  # Add the modified result to the combined list
-                except:
-                    pass
-
-        filtered_df = [
-            {
-                "symbol": entry["symbol"],
-                "name": entry["name"],
-                "marketCap": entry["marketCap"],
-                "avgVolume": entry["avgVolume"]
-            }
-            for entry in filtered_df
-        ]
+            peers_dict[symbol] = []
 
-        sorted_df = sorted(filtered_df, key=lambda x: x['marketCap'], reverse=True)
+    results = {}
+    for ticker, peers in peers_dict.items():
+        filtered_df = [quote_dict[peer] for peer in peers if quote_dict.get(peer) is not None]
+        results[ticker] = sorted(filtered_df, key=lambda x: x['marketCap'], reverse=True)
 
-        await save_similar_stocks(ticker, sorted_df)
+    for ticker, data in tqdm(results.items()):
+        save_similar_stocks(ticker, data)
 
 try:
     con = sqlite3.connect('stocks.db')
-    asyncio.run(run())
+    run()
     con.close()
 except Exception as e:
-    print(e)
\ No newline at end of file
+    print(e)
@@ -1,101 +1,75 @@
 import ujson
-import asyncio
-import aiohttp
+import os
 import sqlite3
 from datetime import datetime
-from ml_models.classification import TrendPredictor
-import yfinance as yf
+from ml_models.classification import TrendPredictor, train_process
 import pandas as pd
 from tqdm import tqdm
 import concurrent.futures
-import re
-import subprocess
 
-async def save_json(symbol, data):
+best_features = ['close','williams','fi','emv','adi','cmf','bb_hband','bb_lband','vpt','stoch','stoch_rsi','rsi','nvi','macd','mfi','cci','obv','adx','adx_pos','adx_neg']
+horizons = {5: 'oneWeek', 20: 'oneMonth', 60: 'threeMonth'}
+test_size = 0.2
+
+def save_json(symbol, data):
     with open(f"json/trend-analysis/{symbol}.json", 'w') as file:
         ujson.dump(data, file)
 
-async def download_data(ticker, start_date, end_date):
-    try:
-        df = yf.download(ticker, start=start_date, end=end_date, interval="1d")
-        df = df.rename(columns={'Adj Close': 'close', 'Open': 'open', 'High': 'high', 'Low': 'low', 'Volume': 'volume', 'Date': 'date'})
-        return df
-    except Exception as e:
-        print(e)
-
-def convert_symbols(symbol_list):
+def load_data(ticker, db_path, start_date, end_date):
+    # Prices come from the local OHLC tables instead of yfinance
+    query = f"""
+        SELECT date, open, high, low, close, volume
+        FROM "{ticker}"
+        WHERE date BETWEEN ? AND ?
     """
-    Converts the symbols in the given list from 'BTCUSD' and 'USDTUSD' format to 'BTC-USD' and 'USDT-USD' format.
-    
-    Args:
-        symbol_list (list): A list of strings representing the symbols to be converted.
-    
-    Returns:
-        list: A new list with the symbols converted to the desired format.
-    """
-    converted_symbols = []
-    for symbol in symbol_list:
-        # Determine the base and quote currencies
-        base_currency = symbol[:-3]
-        quote_currency = symbol[-3:]
-        
-        # Construct the new symbol in the desired format
-        new_symbol = f"{base_currency}-{quote_currency}"
-        converted_symbols.append(new_symbol)
-    
-    return converted_symbols
-
-async def process_symbol(ticker, start_date, end_date, crypto_symbols):
+    with sqlite3.connect(db_path) as con:
+        df = pd.read_sql_query(query, con, params=(start_date, end_date))
+    return df.sort_values('date').reset_index(drop=True)
+
+def init_worker():
+    # Each worker loads the three horizon models once and reuses them for every symbol
+    global predictors
+    predictors = {}
+    for nth_day in horizons:
+        predictor = TrendPredictor(nth_day=nth_day, path="ml_models/weights")
+        predictor.load_model(n_jobs=1)
+        predictors[nth_day] = predictor
+
+def process_symbol(ticker, db_path, start_date, end_date):
     try:
-        best_features = ['close','williams','fi','emv','adi','cmf','bb_hband','bb_lband','vpt','stoch','stoch_rsi','rsi','nvi','macd','mfi','cci','obv','adx','adx_pos','adx_neg']
-        test_size = 0.2
-        df = await download_data(ticker, start_date, end_date)
-
-        async def process_nth_day(nth_day):
-            try:
-                predictor = TrendPredictor(nth_day=nth_day, path="ml_models/weights")
-                df_copy = df.copy()
-                df_copy["Target"] = ((df_copy["close"].shift(-nth_day) > df_copy["close"])).astype(int)
-                predictors = predictor.generate_features(df_copy)
-                df_copy = df_copy.dropna(subset=df_copy.columns[df_copy.columns != "nth_day"])
-                split_size = int(len(df_copy) * (1-test_size))
-                test_data = df_copy.iloc[split_size:]
-
-                res_dict = predictor.evaluate_model(test_data[best_features], test_data['Target'])
+        df = load_data(ticker, db_path, start_date, end_date)
 
-                if nth_day == 5:
-                    time_period = 'oneWeek'
-                elif nth_day == 20:
-                    time_period = 'oneMonth'
-                elif nth_day == 60:
-                    time_period = 'threeMonth'
+        # Indicators are computed once per symbol; every horizon only adds its target column
+        predictors[5].generate_features(df)
+        for nth_day in horizons:
+            df[f"Target_{nth_day}"] = ((df["close"].shift(-nth_day) > df["close"])).astype(int)
+        df = df.dropna()
 
-                return {'label': time_period, **res_dict}
+        split_size = int(len(df) * (1-test_size))
+        test_data = df.iloc[split_size:]
 
+        res_list = []
+        for nth_day, time_period in horizons.items():
+            try:
+                res_dict = predictors[nth_day].evaluate_model(test_data[best_features], test_data[f"Target_{nth_day}"])
+                res_list.append({'label': time_period, **res_dict})
             except Exception as e:
                 print(e)
-                return None
-
-        tasks = [process_nth_day(nth_day) for nth_day in [5, 20, 60]]
-        results = await asyncio.gather(*tasks)
-        res_list = [r for r in results if r is not None]
 
-        if ticker in crypto_symbols:
-            ticker = ticker.replace('-','') #convert back from BTC-USD to BTCUSD
-
-        await save_json(ticker, res_list)
+        save_json(ticker, res_list)
 
     except Exception as e:
         print(e)
 
-async def run():
+def run():
 
-    #Train first model
-    try:
-        print('training...')
-        subprocess.run(["python3", "ml_models/classification.py", "--train"], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running classification.py: {e}")
+    #Train first model, in-process so sklearn is imported once; unchanged inputs skip the fit
+    for nth_day in horizons:
+        try:
+            print(f'training {nth_day} day model...')
+            train_process(nth_day)
+        except Exception as e:
+            print(f"Error training trend model for {nth_day} days: {e}")
 
     con = sqlite3.connect('stocks.db')
     etf_con = sqlite3.connect('etf.db')
@@ -116,27 +90,26 @@ async def run():
     crypto_cursor.execute("PRAGMA journal_mode = wal")
     crypto_cursor.execute("SELECT DISTINCT symbol FROM cryptos")
     crypto_symbols = [row[0] for row in crypto_cursor.fetchall()]
-    crypto_symbols = convert_symbols(crypto_symbols)
 
     con.close()
     etf_con.close()
     crypto_con.close()
 
-    total_symbols = stock_symbols + etf_symbols + crypto_symbols
-    print(f"Total tickers: {len(total_symbols)}")
+    jobs = [(symbol, 'stocks.db') for symbol in stock_symbols] + \
+           [(symbol, 'etf.db') for symbol in etf_symbols] + \
+           [(symbol, 'crypto.db') for symbol in crypto_symbols]
+    print(f"Total tickers: {len(jobs)}")
     start_date = datetime(2000, 1, 1).strftime("%Y-%m-%d")
     end_date = datetime.today().strftime("%Y-%m-%d")
 
-    chunk_size = len(total_symbols) // 70  # Divide the list into N chunks
-    chunks = [total_symbols[i:i + chunk_size] for i in range(0, len(total_symbols), chunk_size)]
-    for chunk in chunks:
-        tasks = []
-        for ticker in tqdm(chunk):
-            tasks.append(process_symbol(ticker, start_date, end_date, crypto_symbols))
+    num_processes = os.cpu_count() or 4
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes, initializer=init_worker) as executor:
+        futures = [executor.submit(process_symbol, symbol, db_path, start_date, end_date) for symbol, db_path in jobs]
+        for _ in tqdm(concurrent.futures.as_completed(futures), total=len(futures)):
+            pass
 
-        await asyncio.gather(*tasks)
-
-try:
-    asyncio.run(run())
-except Exception as e:
-    print(e)
+if __name__ == "__main__":
+    try:
+        run()
+    except Exception as e:
+        print(e)
@@ -2,13 +2,16 @@ import pandas as pd
 from datetime import datetime
 import numpy as np
 import ujson
-import asyncio
 import sqlite3
 import os
 from tqdm import tqdm
 
-async def save_json(symbol, data):
-    os.makedirs("json/var", exist_ok=True)  # Ensure directory exists
+HISTORY_DIR = "json/var-history"
+HISTORY_PATH = f"{HISTORY_DIR}/history.pkl"
+META_PATH = f"{HISTORY_DIR}/meta.json"
+LATEST_PATH = f"{HISTORY_DIR}/latest.json"
+
+def save_json(symbol, data):
     with open(f"json/var/{symbol}.json", 'w') as file:
         ujson.dump(data, file)
 
@@ -35,23 +38,63 @@ def assign_risk_rating(var):
     else:
         return 10
 
-def compute_var(df):
-    # Calculate daily returns
-    df['Returns'] = df['close'].pct_change()
-    df = df.dropna()
-    # Calculate VaR at 95% confidence level
-    confidence_level = 0.95
-    var = np.percentile(df['Returns'], 100 * (1 - confidence_level))
-    var_N_days = round(var * np.sqrt(len(df)) * 100, 2)  # N days: the length of df represents the N days
-
-    if var_N_days <= -100:
-        var_N_days = -99
-
-    return var_N_days  # Positive value represents a loss
-
-async def run():
+def load_history():
+    # Persisted monthly VaR (symbol, date 'YYYY-MM', var) and the day it was last updated
+    try:
+        history = pd.read_pickle(HISTORY_PATH)
+        with open(META_PATH, 'r') as file:
+            updated = ujson.load(file)['updated']
+        return history, updated
+    except Exception:
+        return pd.DataFrame(columns=['symbol', 'date', 'var']), None
+
+def save_history(history, updated):
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    history.to_pickle(f"{HISTORY_PATH}.tmp")
+    os.replace(f"{HISTORY_PATH}.tmp", HISTORY_PATH)
+    with open(META_PATH, 'w') as file:
+        ujson.dump({'updated': updated}, file)
+
+def load_prices(jobs, end_date):
+    # Long (symbol, date, close) frame; each symbol is read from its own start date
+    frames = []
+    for symbol, con, start_date in tqdm(jobs):
+        try:
+            df = pd.read_sql_query(f'SELECT date, close FROM "{symbol}" WHERE date BETWEEN ? AND ?', con, params=(start_date, end_date))
+        except Exception as e:
+            print(f"Error loading {symbol}: {e}")
+            continue
+        if not df.empty:
+            df['symbol'] = symbol
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=['symbol', 'date', 'close'])
+    return pd.concat(frames, ignore_index=True)
+
+def compute_monthly_var(prices):
+    """
+    95% one-month VaR for every (symbol, month) with at least 19 trading days.
+    Returns are taken within the month, scaled by sqrt of the number of returns; positive is a loss.
+    """
+    prices = prices.dropna(subset=['close']).sort_values(['symbol', 'date'])
+    prices['month'] = prices['date'].str[:7]
+    keys = [prices['symbol'], prices['month']]
+
+    days = prices.groupby(keys)['close'].transform('size')
+    prices['returns'] = prices.groupby(keys)['close'].pct_change(fill_method=None).replace([np.inf, -np.inf], np.nan)
+    prices = prices[days >= 19].dropna(subset=['returns'])
+
+    grouped = prices.groupby(['symbol', 'month'])['returns']
+    # Same linear interpolation as np.percentile
+    var = grouped.quantile(0.05) * np.sqrt(grouped.size()) * 100
+    var = var.round(2).where(var.round(2) > -100, -99)
+
+    return var.rename('var').reset_index().rename(columns={'month': 'date'})
+
+def run():
     start_date = "2015-01-01"
-    end_date = datetime.today().strftime("%Y-%m-%d")
+    today = datetime.today()
+    end_date = today.strftime("%Y-%m-%d")
 
     con = sqlite3.connect('stocks.db')
     etf_con = sqlite3.connect('etf.db')
@@ -72,60 +115,56 @@ async def run():
     crypto_cursor.execute("SELECT DISTINCT symbol FROM cryptos")
     crypto_symbols = [row[0] for row in crypto_cursor.fetchall()]
 
-    total_symbols = stocks_symbols + etf_symbols + crypto_symbols
+    # Same precedence as before when a symbol is listed in several databases
+    symbol_con = {}
+    for symbols, query_con in ((stocks_symbols, con), (crypto_symbols, crypto_con), (etf_symbols, etf_con)):
+        for symbol in symbols:
+            symbol_con[symbol] = query_con
+
+    # Closed months are kept; only months since the last run (at least the current one) are recomputed
+    history, updated = load_history()
+    recompute_month = min(today.strftime("%Y-%m"), updated[:7]) if updated else today.strftime("%Y-%m")
+    history = history[history['date'] < recompute_month]
+    known_symbols = set(history['symbol'])
+
+    jobs = [(symbol, query_con, f"{recompute_month}-01" if symbol in known_symbols else start_date)
+            for symbol, query_con in symbol_con.items()]
+    prices = load_prices(jobs, end_date)
 
-    for symbol in tqdm(total_symbols):
+    con.close()
+    etf_con.close()
+    crypto_con.close()
+
+    history = pd.concat([history, compute_monthly_var(prices)], ignore_index=True)
+    history = history[history['symbol'].isin(symbol_con)].sort_values(['symbol', 'date']).reset_index(drop=True)
+    save_history(history, end_date)
+
+    os.makedirs("json/var", exist_ok=True)  # Ensure directory exists
+    latest = {}
+    for symbol, group in tqdm(history.groupby('symbol', sort=False)):
         try:
-            if symbol in etf_symbols:  
-                query_con = etf_con
-            elif symbol in crypto_symbols:  
-                query_con = crypto_con
-            elif symbol in stocks_symbols:  
-                query_con = con
-            else:
-                continue
-
-            query_template = """
-                    SELECT
-                        date, open, high, low, close, volume
-                    FROM
-                        "{symbol}"
-                    WHERE
-                        date BETWEEN ? AND ?
-                """
-            query = query_template.format(symbol=symbol)
-            df = pd.read_sql_query(query, query_con, params=(start_date, end_date))
-
-            # Convert date to datetime
-            df['date'] = pd.to_datetime(df['date'])
-
-            # Group by year and month
-            monthly_groups = df.groupby(df['date'].dt.to_period('M'))
-            history = []
-
-            for period, group in monthly_groups:
-                if len(group) >=19:  # Check if the month has at least 19 data points
-                    var_data = compute_var(group)
-                    history.append({'date': str(period), 'var': var_data})
-
-            risk_rating = assign_risk_rating(abs(history[-1]['var']))
+            records = [{'date': date, 'var': var} for date, var in zip(group['date'], group['var'].tolist())]
+            risk_rating = assign_risk_rating(abs(records[-1]['var']))
             outlook = 'Neutral'
             if risk_rating < 5:
                 outlook = 'Risky'
             elif risk_rating > 5:
                 outlook = 'Minimum Risk'
-            res = {'rating': risk_rating, 'history': history, 'outlook': outlook}
+            res = {'rating': risk_rating, 'history': records, 'outlook': outlook}
 
-            await save_json(symbol, res)
+            save_json(symbol, res)
+            latest[symbol] = {'rating': risk_rating, 'var': records[-1]['var'], 'outlook': outlook}
 
         except Exception as e:
             print(f"Error processing {symbol}: {e}")
 
-    con.close()
-    etf_con.close()
-    crypto_con.close()
+    # Bulk artifact for readers that only need the latest value of every symbol
+    with open(f"{LATEST_PATH}.tmp", 'w') as file:
+        ujson.dump(latest, file)
+    os.replace(f"{LATEST_PATH}.tmp", LATEST_PATH)
 
-try:
-    asyncio.run(run())
-except Exception as e:
-    print(e)
+if __name__ == "__main__":
+    try:
+        run()
+    except Exception as e:
+        print(e)
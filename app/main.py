@@ -5,6 +5,8 @@ import gzip
 import re
 import os
 import secrets
+import hashlib
+import asyncio
 from benzinga import financial_data
 from typing import List, Dict, Set
 # Third-party library imports
@@ -15,8 +17,8 @@ import aiohttp
 import redis
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-import requests
 from pathlib import Path
+from utils.quote_store import load_quote, get_quote_store
 
 # Database related imports
 import sqlite3
@@ -312,6 +314,7 @@ class InfoText(BaseModel):
 
 class HistoricalDate(BaseModel):
     date: str
+    ticker: str = ''
 
 class OptionsWatchList(BaseModel):
     optionsIdList: list
@@ -608,13 +611,17 @@ async def get_market_news(data: MarketNews, api_key: str = Security(get_api_key)
         headers={"Content-Encoding": "gzip"})
 
     try:
-        with open(f"json/market-news/{news_type}.json", 'rb') as file:
-            res = orjson.loads(file.read())
+        # cron_market_news writes a precompressed payload next to the json file
+        with open(f"json/market-news/{news_type}.json.gz", 'rb') as file:
+            compressed_data = file.read()
     except:
-        res = []
+        try:
+            with open(f"json/market-news/{news_type}.json", 'rb') as file:
+                res = orjson.loads(file.read())
+        except:
+            res = []
+        compressed_data = gzip.compress(orjson.dumps(res))
 
-    data = orjson.dumps(res)
-    compressed_data = gzip.compress(data)
     redis_client.set(cache_key, compressed_data)
     redis_client.expire(cache_key, 60*5)  # Set cache expiration time to 15 min
 
@@ -639,13 +646,17 @@ async def stock_news(data: TickerData, api_key: str = Security(get_api_key)):
 
 
     try:
-        with open(f"json/market-news/companies/{ticker}.json", 'rb') as file:
-            res = orjson.loads(file.read())
+        # cron_company_news writes a precompressed payload next to the json file
+        with open(f"json/market-news/companies/{ticker}.json.gz", 'rb') as file:
+            compressed_data = file.read()
     except:
-        res = []
+        try:
+            with open(f"json/market-news/companies/{ticker}.json", 'rb') as file:
+                res = orjson.loads(file.read())
+        except:
+            res = []
+        compressed_data = gzip.compress(orjson.dumps(res))
 
-    data = orjson.dumps(res)
-    compressed_data = gzip.compress(data)
     redis_client.set(cache_key, compressed_data)
     redis_client.expire(cache_key, 60*5)
 
@@ -697,11 +708,7 @@ async def stock_dividend(data: TickerData, api_key: str = Security(get_api_key))
     if cached_result:
         return orjson.loads(cached_result)
 
-    try:
-        with open(f"json/quote/{ticker}.json", 'rb') as file:
-            res = orjson.loads(file.read())
-    except:
-        res = {}
+    res = load_quote(ticker) or {}
 
     redis_client.set(cache_key, orjson.dumps(res))
     redis_client.expire(cache_key, 60)
@@ -737,6 +744,23 @@ async def history_employees(data: TickerData, api_key: str = Security(get_api_ke
     redis_client.expire(cache_key, 3600*3600) # Set cache expiration time to 1 hour
     return res
 
+def load_financial_statement(ticker, statement):
+    # One read of the consolidated store written by cron_financial_statements, per-period files as fallback
+    try:
+        with open(f"json/financial-statements/consolidated/{ticker}.json", 'rb') as file:
+            return orjson.loads(file.read())[statement]
+    except:
+        pass
+
+    res = {}
+    for period in ['quarter', 'annual']:
+        try:
+            with open(f"json/financial-statements/{statement}/{period}/{ticker}.json", 'rb') as file:
+                res[period] = orjson.loads(file.read())
+        except:
+            res[period] = []
+    return res
+
 @app.post("/stock-income")
 async def stock_income(data: TickerData, api_key: str = Security(get_api_key)):
     data = data.dict()
@@ -752,19 +776,7 @@ async def stock_income(data: TickerData, api_key: str = Security(get_api_key)):
             headers={"Content-Encoding": "gzip"}
         )
 
-    try:
-        with open(f"json/financial-statements/income-statement/quarter/{ticker}.json", 'rb') as file:
-            quarter_res = orjson.loads(file.read())
-    except:
-        quarter_res = []
-
-    try:
-        with open(f"json/financial-statements/income-statement/annual/{ticker}.json", 'rb') as file:
-            annual_res = orjson.loads(file.read())
-    except:
-        annual_res = []
-
-    res = {'quarter': quarter_res, 'annual': annual_res}
+    res = load_financial_statement(ticker, 'income-statement')
 
     res = orjson.dumps(res)
     compressed_data = gzip.compress(res)
@@ -793,19 +805,7 @@ async def stock_balance_sheet(data: TickerData, api_key: str = Security(get_api_
             headers={"Content-Encoding": "gzip"}
         )
 
-    try:
-        with open(f"json/financial-statements/balance-sheet-statement/quarter/{ticker}.json", 'rb') as file:
-            quarter_res = orjson.loads(file.read())
-    except:
-        quarter_res = []
-
-    try:
-        with open(f"json/financial-statements/balance-sheet-statement/annual/{ticker}.json", 'rb') as file:
-            annual_res = orjson.loads(file.read())
-    except:
-        annual_res = []
-
-    res = {'quarter': quarter_res, 'annual': annual_res}
+    res = load_financial_statement(ticker, 'balance-sheet-statement')
 
     res = orjson.dumps(res)
     compressed_data = gzip.compress(res)
@@ -834,19 +834,7 @@ async def stock_ratios(data: TickerData, api_key: str = Security(get_api_key)):
             headers={"Content-Encoding": "gzip"}
         )
 
-    try:
-        with open(f"json/financial-statements/ratios/quarter/{ticker}.json", 'rb') as file:
-            quarter_res = orjson.loads(file.read())
-    except:
-        quarter_res = []
-
-    try:
-        with open(f"json/financial-statements/ratios/annual/{ticker}.json", 'rb') as file:
-            annual_res = orjson.loads(file.read())
-    except:
-        annual_res = []
-
-    res = {'quarter': quarter_res, 'annual': annual_res}
+    res = load_financial_statement(ticker, 'ratios')
 
     res = orjson.dumps(res)
     compressed_data = gzip.compress(res)
@@ -876,19 +864,7 @@ async def stock_cash_flow(data: TickerData, api_key: str = Security(get_api_key)
             headers={"Content-Encoding": "gzip"}
         )
 
-    try:
-        with open(f"json/financial-statements/cash-flow-statement/quarter/{ticker}.json", 'rb') as file:
-            quarter_res = orjson.loads(file.read())
-    except:
-        quarter_res = []
-
-    try:
-        with open(f"json/financial-statements/cash-flow-statement/annual/{ticker}.json", 'rb') as file:
-            annual_res = orjson.loads(file.read())
-    except:
-        annual_res = []
-
-    res = {'quarter': quarter_res, 'annual': annual_res}
+    res = load_financial_statement(ticker, 'cash-flow-statement')
 
     res = orjson.dumps(res)
     compressed_data = gzip.compress(res)
@@ -1089,70 +1065,83 @@ async def get_analyst_ticke_history(data: TickerData, api_key: str = Security(ge
     )
 
 
-@app.post("/indicator-data")
-async def get_indicator_data(data: IndicatorListData, api_key: str = Security(get_api_key)):
-    rule_of_list = data.ruleOfList
-    ticker_list = data.tickerList
-    combined_results = []  # List to store the combined results
-
-    # Keys that should be read from the quote files if they are in rule_of_list
-    quote_keys_to_include = ['volume', 'marketCap', 'changesPercentage', 'price', 'symbol', 'name']
-
-    def load_json(file_path):
-        try:
-            with open(file_path, 'rb') as file:
-                return orjson.loads(file.read())
-        except FileNotFoundError:
-            return None
+# Keys that are read from the quote snapshot; everything else comes from the screener index
+QUOTE_KEYS = ['volume', 'marketCap', 'changesPercentage', 'price', 'symbol', 'name']
+etf_symbols_set = set(etf_symbols)
+crypto_symbols_set = set(crypto_symbols)
 
+def normalize_rule_of_list(rule_of_list):
     # Ensure rule_of_list contains valid keys (fall back to defaults if necessary)
     if not rule_of_list or not isinstance(rule_of_list, list):
-        rule_of_list = quote_keys_to_include  # Default keys
+        rule_of_list = list(QUOTE_KEYS)  # Default keys
 
     # Make sure 'symbol' and 'name' are always included in the rule_of_list
     if 'symbol' not in rule_of_list:
         rule_of_list.append('symbol')
     if 'name' not in rule_of_list:
         rule_of_list.append('name')
+    return rule_of_list
+
+def build_watchlist_rows(ticker_list, rule_of_list):
+    quotes = get_quote_store().get_many(ticker_list)
+    screener_keys = [key for key in rule_of_list if key not in QUOTE_KEYS]
+
+    combined_results = []
+    for ticker in ticker_list:
+        quote_dict = quotes.get(ticker) or load_quote(ticker)
+        if not quote_dict:
+            continue
+
+        filtered_quote = {key: quote_dict.get(key) for key in rule_of_list if key in quote_dict}
+        if ticker in etf_symbols_set:
+            filtered_quote['type'] = 'etf'
+        elif ticker in crypto_symbols_set:
+            filtered_quote['type'] = 'crypto'
+        else:
+            filtered_quote['type'] = 'stock'
 
-    # Categorize tickers and fetch data
-    for ticker in map(str.upper, ticker_list):
-        ticker_type = 'stock'
-        if ticker in etf_symbols:
-            ticker_type = 'etf'
-        elif ticker in crypto_symbols:
-            ticker_type = 'crypto'
+        # Merge the non-quote keys from the prebuilt symbol-keyed screener index
+        screener_item = stock_screener_data_dict.get(filtered_quote.get('symbol'))
+        if screener_item:
+            filtered_quote.update({key: screener_item.get(key) for key in screener_keys if key in screener_item})
 
-        # Load quote data and filter to include only selected keys from rule_of_list
-        quote_dict = load_json(f"json/quote/{ticker}.json")
-        if quote_dict:
-            filtered_quote = {key: quote_dict.get(key) for key in rule_of_list if key in quote_dict}
-            filtered_quote['type'] = ticker_type  # Include ticker type
-            combined_results.append(filtered_quote)
+        combined_results.append(filtered_quote)
 
+    return combined_results
 
-    try:
-        # Filter out the keys that need to be fetched from the screener
-        screener_keys = [key for key in rule_of_list if key not in quote_keys_to_include]
+def watchlist_cache_key(prefix, ticker_list, rule_of_list):
+    # The quote snapshot signature is part of the key, so entries are invalidated whenever quotes refresh
+    signature = get_quote_store().signature
+    raw = orjson.dumps([ticker_list, rule_of_list, signature])
+    return f"{prefix}-{hashlib.sha1(raw).hexdigest()}"
 
-        # Create a mapping of stock_screener_data based on symbol for fast lookup
-        screener_dict = {
-            item['symbol']: {key: item.get(key) for key in screener_keys if key in item}
-            for item in stock_screener_data
-        }
 
-        # Merge the filtered stock_screener_data into combined_results for non-quote keys
-        for result in combined_results:
-            symbol = result.get('symbol')
-            if symbol in screener_dict:
-                result.update(screener_dict[symbol])
+@app.post("/indicator-data")
+async def get_indicator_data(data: IndicatorListData, api_key: str = Security(get_api_key)):
+    rule_of_list = normalize_rule_of_list(data.ruleOfList)
+    ticker_list = [ticker.upper() for ticker in data.tickerList]
+
+    cache_key = watchlist_cache_key("indicator-data", ticker_list, rule_of_list)
+    cached_result = redis_client.get(cache_key)
+    if cached_result:
+        return StreamingResponse(
+            io.BytesIO(cached_result),
+            media_type="application/json",
+            headers={"Content-Encoding": "gzip"}
+        )
 
+    try:
+        combined_results = build_watchlist_rows(ticker_list, rule_of_list)
     except Exception as e:
         print(f"An error occurred while merging data: {e}")
+        combined_results = []
 
     res = orjson.dumps(combined_results)
     compressed_data = gzip.compress(res)
-    
+
+    redis_client.set(cache_key, compressed_data)
+    redis_client.expire(cache_key, 60)
+
     return StreamingResponse(
         io.BytesIO(compressed_data),
         media_type="application/json",
@@ -1164,75 +1153,43 @@ async def get_indicator_data(data: IndicatorListData, api_key: str = Security(ge
 async def get_watchlist(data: GetWatchList, api_key: str = Security(get_api_key)):
     data = data.dict()
     watchlist_id = data['watchListId']
-    rule_of_list = data['ruleOfList']  # Ensure this is passed as part of the request
-    result = pb.collection("watchlist").get_one(watchlist_id)
-    ticker_list = result.ticker
-    combined_results = []  # List to store the combined results
-    combined_news = []
-
-    # Keys that should be read from the quote files if they are in rule_of_list
-    quote_keys_to_include = ['volume', 'marketCap', 'changesPercentage', 'price', 'symbol', 'name']
-
-    def load_json(file_path):
-        try:
-            with open(file_path, 'rb') as file:
-                return orjson.loads(file.read())
-        except FileNotFoundError:
-            return None
-
-    # Ensure rule_of_list contains valid keys (fall back to defaults if necessary)
-    if not rule_of_list or not isinstance(rule_of_list, list):
-        rule_of_list = quote_keys_to_include  # Default keys
-
-    # Make sure 'symbol' and 'name' are always included in the rule_of_list
-    if 'symbol' not in rule_of_list:
-        rule_of_list.append('symbol')
-    if 'name' not in rule_of_list:
-        rule_of_list.append('name')
-
-    # Categorize tickers and fetch data
-    for ticker in map(str.upper, ticker_list):
-        ticker_type = 'stock'
-        if ticker in etf_symbols:
-            ticker_type = 'etf'
-        elif ticker in crypto_symbols:
-            ticker_type = 'crypto'
-
-        # Load quote data and filter to include only selected keys from rule_of_list
-        quote_dict = load_json(f"json/quote/{ticker}.json")
-        if quote_dict:
-            filtered_quote = {key: quote_dict.get(key) for key in rule_of_list if key in quote_dict}
-            filtered_quote['type'] = ticker_type  # Include ticker type
-            combined_results.append(filtered_quote)
-
-        # Load news data
-        news_dict = load_json(f"json/market-news/companies/{ticker}.json")
-        if news_dict:
-            combined_news.append(news_dict[0])
-
-    try:
-        # Filter out the keys that need to be fetched from the screener
-        screener_keys = [key for key in rule_of_list if key not in quote_keys_to_include]
-
-        # Create a mapping of stock_screener_data based on symbol for fast lookup
-        screener_dict = {
-            item['symbol']: {key: item.get(key) for key in screener_keys if key in item}
-            for item in stock_screener_data
-        }
+    rule_of_list = normalize_rule_of_list(data['ruleOfList'])  # Ensure this is passed as part of the request
+    # PocketBase client is synchronous, keep it off the event loop
+    result = await asyncio.to_thread(pb.collection("watchlist").get_one, watchlist_id)
+    ticker_list = [ticker.upper() for ticker in result.ticker]
 
-        # Merge the filtered stock_screener_data into combined_results for non-quote keys
-        for result in combined_results:
-            symbol = result.get('symbol')
-            if symbol in screener_dict:
-                result.update(screener_dict[symbol])
+    cache_key = watchlist_cache_key("get-watchlist", ticker_list, rule_of_list)
+    cached_result = redis_client.get(cache_key)
+    if cached_result:
+        return StreamingResponse(
+            io.BytesIO(cached_result),
+            media_type="application/json",
+            headers={"Content-Encoding": "gzip"}
+        )
 
+    try:
+        combined_results = build_watchlist_rows(ticker_list, rule_of_list)
     except Exception as e:
         print(f"An error occurred while merging data: {e}")
+        combined_results = []
+
+    combined_news = []
+    for ticker in ticker_list:
+        try:
+            with open(f"json/market-news/companies/{ticker}.json", 'rb') as file:
+                news_dict = orjson.loads(file.read())
+            if news_dict:
+                combined_news.append(news_dict[0])
+        except FileNotFoundError:
+            pass
 
     res = {'data': combined_results, 'news': combined_news}
     res = orjson.dumps(res)
     compressed_data = gzip.compress(res)
-    
+
+    redis_client.set(cache_key, compressed_data)
+    redis_client.expire(cache_key, 60)
+
     return StreamingResponse(
         io.BytesIO(compressed_data),
         media_type="application/json",
@@ -1253,15 +1210,21 @@ def process_option_activity(item):
     item['tradeCount'] = item.get('trade_count', 0)
     return item
 
-async def fetch_option_data(option_id: str):
+OPTIONS_FETCH_CONCURRENCY = 8
+OPTIONS_MISS_TTL = 3600*6 # Ids without activity are not refetched for 6 hours
+options_fetch_semaphore = asyncio.Semaphore(OPTIONS_FETCH_CONCURRENCY)
+options_in_flight = {}
+
+async def fetch_option_data(session, option_id: str):
     url = "https://api.benzinga.com/api/v1/signal/option_activity"
     headers = {"accept": "application/json"}
     querystring = {"token": Benzinga_API_KEY, "parameters[id]": option_id}
     
     try:
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        data = orjson.loads(response.text)
+        async with options_fetch_semaphore:
+            async with session.get(url, headers=headers, params=querystring) as response:
+                response.raise_for_status()
+                data = orjson.loads(await response.read())
         option_activity = data.get('option_activity', [])
         
         if isinstance(option_activity, list):
@@ -1271,8 +1234,48 @@ async def fetch_option_data(option_id: str):
             return []
     except Exception as e:
         print(f"Error fetching data for {option_id}: {e}")
+        return None
+
+def write_option_file(file_path, option_activity):
+    # Write-then-rename so concurrent readers never see a partial file
+    tmp_path = file_path.with_suffix(f".{secrets.token_hex(4)}.tmp")
+    with open(tmp_path, 'wb') as file:
+        file.write(orjson.dumps(option_activity))
+    os.replace(tmp_path, file_path)
+
+async def resolve_option_id(session, option_id: str):
+    miss_key = f"options-watchlist-miss-{option_id}"
+    if redis_client.exists(miss_key):
         return []
 
+    option_activity = await fetch_option_data(session, option_id)
+    if option_activity:
+        write_option_file(OPTIONS_WATCHLIST_DIR / f"{option_id}.json", option_activity)
+        return option_activity
+
+    # Only cache a miss when Benzinga answered with no activity, not on request errors
+    if option_activity is not None:
+        redis_client.set(miss_key, 1)
+        redis_client.expire(miss_key, OPTIONS_MISS_TTL)
+    return []
+
+async def resolve_option_ids(option_ids):
+    """
+    Fetch the missing option ids concurrently, sharing one in-flight task per id across requests.
+    """
+    async with aiohttp.ClientSession() as session:
+        tasks = []
+        for option_id in option_ids:
+            task = options_in_flight.get(option_id)
+            if task is None:
+                task = asyncio.ensure_future(resolve_option_id(session, option_id))
+                options_in_flight[option_id] = task
+                task.add_done_callback(lambda _, option_id=option_id: options_in_flight.pop(option_id, None))
+            tasks.append(task)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {option_id: (res if isinstance(res, list) else []) for option_id, res in zip(option_ids, results)}
+
 @app.post("/get-options-watchlist")
 async def get_options_watchlist(data: OptionsWatchList, api_key: str = Security(get_api_key)):
     options_list_id = sorted(data.optionsIdList)
@@ -1285,21 +1288,24 @@ async def get_options_watchlist(data: OptionsWatchList, api_key: str = Security(
             headers={"Content-Encoding": "gzip"}
         )
 
-    result = []
+    option_data = {}
+    missing_ids = []
 
     for option_id in options_list_id:
         file_path = OPTIONS_WATCHLIST_DIR / f"{option_id}.json"
         
         if file_path.exists():
             with open(file_path, 'rb') as json_file:
-                option_data = orjson.loads(json_file.read())
-                result.extend(option_data)
+                option_data[option_id] = orjson.loads(json_file.read())
         else:
-            option_activity = await fetch_option_data(option_id)
-            if option_activity:
-                with open(file_path, 'wb') as file:
-                    file.write(orjson.dumps(option_activity))
-                result.extend(option_activity)
+            missing_ids.append(option_id)
+
+    if missing_ids:
+        option_data.update(await resolve_option_ids(missing_ids))
+
+    result = []
+    for option_id in options_list_id:
+        result.extend(option_data.get(option_id, []))
 
     compressed_data = gzip.compress(orjson.dumps(result))
     redis_client.set(cache_key, compressed_data)
@@ -2603,13 +2609,17 @@ async def get_trending(data: HeatMapData, api_key: str = Security(get_api_key)):
         headers={"Content-Encoding": "gzip"})
 
     try:
-        with open(f"json/heatmaps/{index}.json", 'rb') as file:
-            res = orjson.loads(file.read())
+        # cron_heatmap writes a precompressed payload next to the json file
+        with open(f"json/heatmaps/{index}.json.gz", 'rb') as file:
+            compressed_data = file.read()
     except:
-        res = []
+        try:
+            with open(f"json/heatmaps/{index}.json", 'rb') as file:
+                res = orjson.loads(file.read())
+        except:
+            res = []
+        compressed_data = gzip.compress(orjson.dumps(res))
 
-    data = orjson.dumps(res)
-    compressed_data = gzip.compress(data)
     redis_client.set(cache_key, compressed_data)
     redis_client.expire(cache_key, 60*5)  # Set cache expiration time to 5 min
 
@@ -2886,8 +2896,9 @@ async def get_options_chain(data:TransactionId, api_key: str = Security(get_api_
 @app.post("/options-historical-flow")
 async def get_options_chain(data:HistoricalDate, api_key: str = Security(get_api_key)):
     selected_date = data.date
+    ticker = data.ticker.upper()
     print(selected_date)
-    cache_key = f"options-historical-flow-{selected_date}"
+    cache_key = f"options-historical-flow-{selected_date}-{ticker}"
     cached_result = redis_client.get(cache_key)
     if cached_result:
         return StreamingResponse(
@@ -2895,7 +2906,9 @@ async def get_options_chain(data:HistoricalDate, api_key: str = Security(get_api
         media_type="application/json",
         headers={"Content-Encoding": "gzip"})
     try:
-        with open(f"json/options-historical-data/flow-data/{selected_date}.json", 'rb') as file:
+        # Per-ticker partition of the day when a ticker is given, the whole day otherwise
+        path = f"json/options-historical-data/flow-data/{selected_date}/{ticker}.json" if ticker else f"json/options-historical-data/flow-data/{selected_date}.json"
+        with open(path, 'rb') as file:
             res_list = orjson.loads(file.read())
     except:
         res_list = []
@@ -2964,9 +2977,11 @@ async def get_options_flow_feed(api_key: str = Security(get_api_key)):
 
 
 @app.get("/options-zero-dte")
-async def get_options_flow_feed(api_key: str = Security(get_api_key)):
+async def get_options_flow_feed(ticker: str = '', api_key: str = Security(get_api_key)):
+    ticker = ticker.upper()
     try:
-        with open(f"json/options-flow/zero-dte/data.json", 'rb') as file:
+        path = f"json/options-flow/zero-dte/companies/{ticker}.json" if ticker else f"json/options-flow/zero-dte/data.json"
+        with open(path, 'rb') as file:
             res_list = orjson.loads(file.read())
     except:
         res_list = []
@@ -3664,7 +3679,7 @@ async def get_reddit_tracker(api_key: str = Security(get_api_key)):
         )
 
     try:
-        with open(f"json/reddit-tracker/wallstreetbets/data.json", 'rb') as file:
+        with open(f"json/reddit-tracker/wallstreetbets/latest.json", 'rb') as file:
             latest_post = orjson.loads(file.read())[0:25]
     except:
         latest_post = []
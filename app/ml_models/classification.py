@@ -1,4 +1,4 @@
-import yfinance as yf
+import sqlite3
 import pandas as pd
 from datetime import datetime, timedelta
 from sklearn.ensemble import RandomForestClassifier
@@ -15,25 +15,27 @@ from ta.trend import *
 from ta.volume import *
 from tqdm import tqdm
 from sklearn.feature_selection import SelectKBest, f_classif
-import asyncio
-import aiohttp
 import pickle
 import time
 
 import argparse
 
-# Set up argument parser
-parser = argparse.ArgumentParser(description="Train and test process script.")
-parser.add_argument('--train', action='store_true', help="Set to True to run training")
+from ml_models.registry import ModelRegistry, frame_fingerprint
 
-# Parse the arguments
-args = parser.parse_args()
+db_paths = ['stocks.db', 'etf.db', 'crypto.db']
 
 
-async def download_data(ticker, start_date, end_date, nth_day):
+def download_data(ticker, start_date, end_date, nth_day):
+    # Training prices come from the same local OHLC tables the trend cron job scores on
     try:
-        df = yf.download(ticker, start=start_date, end=end_date, interval="1d")
-        df = df.rename(columns={'Adj Close': 'close', 'Open': 'open', 'High': 'high', 'Low': 'low', 'Volume': 'volume', 'Date': 'date'})
+        df = pd.DataFrame()
+        for db_path in db_paths:
+            with sqlite3.connect(db_path) as con:
+                exists = con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (ticker,)).fetchone()
+                if exists:
+                    df = pd.read_sql_query(f'SELECT date, open, high, low, close, volume FROM "{ticker}" WHERE date BETWEEN ? AND ?', con, params=(start_date, end_date))
+                    break
+        df = df.sort_values('date').reset_index(drop=True)
         df["Target"] = ((df["close"].shift(-nth_day) > df["close"])).astype(int)
         df_copy = df.copy()
         if len(df_copy) > 252*2: #At least 2 years of history is necessary
@@ -48,6 +50,8 @@ class TrendPredictor:
         self.scaler = MinMaxScaler()
         self.nth_day = nth_day
         self.path = path
+        self.registry = ModelRegistry(f"trend-{nth_day}", directory=f"{path}/registry")
+        self.is_loaded = False
 
     def generate_features(self, df):
         new_predictors = []
@@ -101,13 +105,33 @@ class TrendPredictor:
 
         return selected_features
 
-    def train_model(self, X_train, y_train):
+    def is_current(self, fingerprint, features):
+        # True when the registered model was trained on exactly these inputs
+        return self.registry.find(fingerprint, features) is not None
+
+    def train_model(self, X_train, y_train, fingerprint=None):
+        features = list(X_train.columns)
         X_train = np.where(np.isinf(X_train), np.nan, X_train)
         X_train = np.nan_to_num(X_train)
 
         X_train = self.scaler.fit_transform(X_train)
         self.model.fit(X_train, y_train)
-        pickle.dump(self.model, open(f'{self.path}/model_weights_{self.nth_day}.pkl', 'wb'))
+
+        def save(path):
+            with open(path, 'wb') as f:
+                pickle.dump(self.model, f)
+        self.registry.register(fingerprint, features, save)
+        self.is_loaded = True
+
+    def load_model(self, n_jobs=None):
+        # Weights are read once per predictor and reused for every evaluation
+        if not self.is_loaded:
+            path = self.registry.resolve() or f'{self.path}/model_weights_{self.nth_day}.pkl'
+            with open(path, 'rb') as f:
+                self.model = pickle.load(f)
+            self.is_loaded = True
+        if n_jobs is not None:
+            self.model.n_jobs = n_jobs
 
     def evaluate_model(self, X_test, y_test):
         X_test = np.where(np.isinf(X_test), np.nan, X_test)
@@ -115,8 +139,7 @@ class TrendPredictor:
 
         X_test = self.scaler.fit_transform(X_test)
 
-        with open(f'{self.path}/model_weights_{self.nth_day}.pkl', 'rb') as f:
-            self.model = pickle.load(f)
+        self.load_model()
 
         test_predictions = self.model.predict(X_test)
         #test_predictions[test_predictions >=.55] = 1
@@ -145,7 +168,7 @@ class TrendPredictor:
 
 #Train mode
 
-async def train_process(nth_day):
+def train_process(nth_day):
     tickers =['KO','WMT','BA','PLD','AZN','LLY','INFN','GRMN','VVX','EPD','PII','WY','BLMN','AAP','ON','TGT','SMG','EL','EOG','ULTA','DV','PLNT','GLOB','LKQ','CWH','PSX','SO','TGT','GD','MU','NKE','AMGN','BX','CAT','PEP','LIN','ABBV','COST','MRK','HD','JNJ','PG','SPCB','CVX','SHEL','MS','GS','MA','V','JPM','XLF','DPZ','CMG','MCD','ALTM','PDD','MNST','SBUX','AMAT','ZS','IBM','SMCI','ORCL','XLK','VUG','VTI','VOO','IWM','IEFA','PEP','WMT','XOM','V','AVGO','BIDU','GOOGL','SNAP','DASH','SPOT','NVO','META','MSFT','ADBE','DIA','PFE','BAC','RIVN','NIO','CISS','INTC','AAPL','BYND','MSFT','HOOD','MARA','SHOP','CRM','PYPL','UBER','SAVE','QQQ','IVV','SPY','EVOK','GME','F','NVDA','AMD','AMZN','TSM','TSLA']
     tickers = list(set(tickers))
     #print(len(tickers))
@@ -155,11 +178,11 @@ async def train_process(nth_day):
     best_features = ['close','williams','fi','emv','adi','cmf','bb_hband','bb_lband','vpt','stoch','stoch_rsi','rsi','nvi','macd','mfi','cci','obv','adx','adx_pos','adx_neg']
     test_size = 0.2
     start_date = datetime(2000, 1, 1).strftime("%Y-%m-%d")
-    end_date = datetime.today().strftime("%Y-%m-%d")
+    # Train on complete months only so the inputs (and the model) stay fixed until the next month starts
+    end_date = (datetime.today().replace(day=1) - timedelta(days=1)).strftime("%Y-%m-%d")
     predictor = TrendPredictor(nth_day=nth_day)
-    
-    tasks = [download_data(ticker, start_date, end_date, nth_day) for ticker in tickers]
-    dfs = await asyncio.gather(*tasks)
+
+    dfs = [download_data(ticker, start_date, end_date, nth_day) for ticker in sorted(tickers)]
 
     for df in dfs:
         try:
@@ -175,20 +198,25 @@ async def train_process(nth_day):
             pass
 
 
+    fingerprint = frame_fingerprint(df_train[best_features + ['Target']], nth_day=nth_day, params=predictor.model.get_params())
+    if predictor.is_current(fingerprint, best_features):
+        print(f"Trend model for {nth_day} days is up to date, skipping training")
+        return
+
     df_train = df_train.sample(frac=1).reset_index(drop=True)
     #df_train.to_csv('train_set.csv')
     #df_test.to_csv('test_set.csv')
-    predictor.train_model(df_train[best_features], df_train['Target'])
+    predictor.train_model(df_train[best_features], df_train['Target'], fingerprint=fingerprint)
     predictor.evaluate_model(df_test[best_features], df_test['Target'])
 
-async def test_process(nth_day):
+def test_process(nth_day):
     best_features = ['close','williams','fi','emv','adi','cmf','bb_hband','bb_lband','vpt','stoch','stoch_rsi','rsi','nvi','macd','mfi','cci','obv','adx','adx_pos','adx_neg']
     test_size = 0.2
     start_date = datetime(2000, 1, 1).strftime("%Y-%m-%d")
     end_date = datetime.today().strftime("%Y-%m-%d")
     predictor = TrendPredictor(nth_day=nth_day)
 
-    df = await download_data('BTC-USD', start_date, end_date, nth_day)
+    df = download_data('BTCUSD', start_date, end_date, nth_day)
     predictors = predictor.generate_features(df)
     df = df.dropna(subset=df.columns[df.columns != "nth_day"])
     split_size = int(len(df) * (1-test_size))
@@ -197,15 +225,21 @@ async def test_process(nth_day):
     predictor.evaluate_model(test_data[best_features], test_data['Target'])
 
 
-async def main():
+def main():
     for nth_day in [5, 20, 60]:
-        await train_process(nth_day)
-    await test_process(nth_day=5)
+        train_process(nth_day)
+    test_process(nth_day=5)
 
 if __name__ == "__main__":
-    
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Train and test process script.")
+    parser.add_argument('--train', action='store_true', help="Set to True to run training")
+
+    # Parse the arguments
+    args = parser.parse_args()
+
     # Run main if --train is set to True
     if args.train:
-        asyncio.run(main())
+        main()
     else:
         print("Training not initiated. Pass --train True to start training.")
\ No newline at end of file
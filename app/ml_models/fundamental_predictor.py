@@ -25,6 +25,7 @@ import aiohttp
 import aiofiles
 import pickle
 import time
+from ml_models.registry import ModelRegistry
 
 # Based on the paper: https://arxiv.org/pdf/1603.00751
 
@@ -32,7 +33,10 @@ import time
 class FundamentalPredictor:
     def __init__(self):
         self.scaler = MinMaxScaler()
-        self.model = self.build_model()
+        self.registry = ModelRegistry('fundamental')
+        # The network is only built for training; inference loads the registered weights once
+        self.model = None
+        self.is_loaded = False
 
     def build_model(self):
         clear_session()
@@ -88,7 +92,18 @@ class FundamentalPredictor:
     def reshape_for_lstm(self, X):
         return X.reshape((X.shape[0], X.shape[1], 1))
 
-    def train_model(self, X_train, y_train):
+    def is_current(self, fingerprint, features):
+        return self.registry.find(fingerprint, features) is not None
+
+    def load_model(self):
+        if not self.is_loaded:
+            path = self.registry.resolve() or 'ml_models/weights/fundamental_weights/weights.keras'
+            self.model = load_model(path)
+            self.is_loaded = True
+
+    def train_model(self, X_train, y_train, fingerprint=None):
+        features = list(X_train.columns)
+        self.model = self.build_model()
         X_train = self.preprocess_data(X_train)
         #X_train = self.reshape_for_lstm(X_train)
         
@@ -101,12 +116,14 @@ class FundamentalPredictor:
         self.model.fit(X_train, y_train, epochs=100_000, batch_size=32, 
                        validation_split=0.1, callbacks=[checkpoint, early_stopping, reduce_lr])
         self.model.save('ml_models/weights/fundamental_weights/weights.keras')
+        self.registry.register(fingerprint, features, self.model.save, suffix='.keras')
+        self.is_loaded = True
 
     def evaluate_model(self, X_test, y_test):
         X_test = self.preprocess_data(X_test)
         X_test = self.reshape_for_lstm(X_test)
         
-        self.model = load_model('ml_models/weights/fundamental_weights/weights.keras')
+        self.load_model()
         
         test_predictions = self.model.predict(X_test).flatten()
         
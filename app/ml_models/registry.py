@@ -0,0 +1,100 @@
+import os
+import hashlib
+import orjson
+import pandas as pd
+from datetime import datetime
+
+
+REGISTRY_DIR = "ml_models/weights/registry"
+
+
+def schema_hash(features):
+    return hashlib.sha1('\x1f'.join(features).encode('utf-8')).hexdigest()[:16]
+
+
+def frame_fingerprint(*frames, **params):
+    """
+    Content hash of the training frames plus any hyperparameters that shape the model.
+    """
+    digest = hashlib.sha1()
+    for df in frames:
+        digest.update('\x1f'.join(map(str, df.columns)).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    digest.update(orjson.dumps(params, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY))
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """
+    Versioned model artifacts with the feature schema and input fingerprint they were trained on.
+    """
+
+    def __init__(self, name, directory=REGISTRY_DIR, keep=3):
+        self.name = name
+        self.directory = f"{directory}/{name}"
+        self.manifest_path = f"{self.directory}/manifest.json"
+        self.keep = keep
+
+    def versions(self):
+        try:
+            with open(self.manifest_path, 'rb') as file:
+                return orjson.loads(file.read())
+        except (OSError, ValueError):
+            return []
+
+    def latest(self):
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def find(self, fingerprint, features):
+        # Only the newest artifact counts; an older version with the same inputs was superseded
+        entry = self.latest()
+        if entry and entry['fingerprint'] == fingerprint and entry['schema'] == schema_hash(features) and os.path.exists(entry['path']):
+            return entry
+        return None
+
+    def register(self, fingerprint, features, save, suffix='.pkl', metrics=None):
+        """
+        save(path) writes the artifact; the manifest is swapped in only after it succeeded.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        versions = self.versions()
+        version = versions[-1]['version'] + 1 if versions else 1
+        path = f"{self.directory}/v{version}{suffix}"
+        save(path)
+
+        entry = {
+            'version': version,
+            'path': path,
+            'fingerprint': fingerprint,
+            'schema': schema_hash(features),
+            'features': list(features),
+            'metrics': metrics or {},
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        versions.append(entry)
+
+        # Prune artifacts beyond the retention window
+        for old in versions[:-self.keep]:
+            try:
+                os.remove(old['path'])
+            except OSError:
+                pass
+        versions = versions[-self.keep:]
+
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(orjson.dumps(versions, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, self.manifest_path)
+        return entry
+
+    def resolve(self, features=None):
+        """
+        Path of the newest artifact, checked against the caller's feature schema.
+        """
+        entry = self.latest()
+        if entry is None:
+            return None
+        if features is not None and entry['schema'] != schema_hash(features):
+            raise ValueError(f"{self.name} v{entry['version']} was trained on a different feature set")
+        return entry['path']
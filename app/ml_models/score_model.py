@@ -12,8 +12,87 @@ import asyncio
 import aiohttp
 import aiofiles
 import pickle
+import orjson
 import time
 import os
+from contextlib import contextmanager
+
+
+SHARD_DIR = 'ml_models/training_data/ai-score'
+
+
+@contextmanager
+def stage_timer(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round(time.perf_counter() - start, 3)
+
+
+def save_shard(ticker, df, feature_columns, shard_dir=SHARD_DIR):
+    # One columnar shard per ticker: float32 feature matrix, int8 target and a small meta file
+    path = os.path.join(shard_dir, ticker)
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'features.npy'), df[feature_columns].to_numpy(dtype=np.float32))
+    np.save(os.path.join(path, 'target.npy'), df['Target'].to_numpy(dtype=np.int8))
+    # meta.json is written last and marks the shard as complete
+    with open(os.path.join(path, 'meta.json'), 'wb') as file:
+        file.write(orjson.dumps({'columns': feature_columns, 'dates': df['date'].tolist()}))
+
+
+def shard_mtime(ticker, shard_dir=SHARD_DIR):
+    try:
+        return os.path.getmtime(os.path.join(shard_dir, ticker, 'meta.json'))
+    except OSError:
+        return None
+
+
+def load_shard(ticker, shard_dir=SHARD_DIR):
+    path = os.path.join(shard_dir, ticker)
+    with open(os.path.join(path, 'meta.json'), 'rb') as file:
+        meta = orjson.loads(file.read())
+    features = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+    target = np.load(os.path.join(path, 'target.npy'), mmap_mode='r')
+    return meta['columns'], features, target
+
+
+class ShardSequence(lgb.Sequence):
+    """
+    Row range of a memory-mapped shard, aligned to the global feature order and scaled
+    batch by batch, so LightGBM can build its Dataset without materializing the full matrix.
+    """
+
+    def __init__(self, features, columns, feature_order, scaler, start, stop, batch_size=4096):
+        self.features = features
+        self.start = start
+        self.stop = stop
+        self.scaler = scaler
+        self.batch_size = batch_size
+        self.n_features = len(feature_order)
+        position = {col: i for i, col in enumerate(columns)}
+        self.target_index = np.array([i for i, col in enumerate(feature_order) if col in position], dtype=np.int64)
+        self.source_index = np.array([position[col] for col in feature_order if col in position], dtype=np.int64)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def align(self, rows):
+        # Shards are stored as float32; batches are widened to float64 as LightGBM expects
+        out = np.zeros((len(rows), self.n_features), dtype=np.float64)
+        out[:, self.target_index] = rows[:, self.source_index]
+        out = np.nan_to_num(out, nan=0, posinf=0, neginf=0)
+        if self.scaler is not None:
+            out = self.scaler.transform(out)
+        return out
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            return self.align(np.asarray(self.features[self.start + start:self.start + stop:step]))
+        if idx < 0:
+            idx += len(self)
+        return self.align(np.asarray(self.features[self.start + idx:self.start + idx + 1]))[0]
 
 
 class ScorePredictor:
@@ -28,6 +107,10 @@ class ScorePredictor:
             random_state=42
         )
         self.warm_start_model_path = 'ml_models/weights/ai-score/stacking_weights.pkl'
+        self.scaler_path = 'ml_models/weights/ai-score/scaler.pkl'
+        self.features = None
+        self.is_loaded = False
+        self.timings = {}
         #self.pca = PCA(n_components=3)
     
     def preprocess_train_data(self, X):
@@ -39,16 +122,112 @@ class ScorePredictor:
     def preprocess_test_data(self, X):
         X = np.where(np.isinf(X), np.nan, X)
         X = np.nan_to_num(X)
-        X = self.scaler.fit_transform(X)
+        # Reuse the scaler fitted on the training set
+        X = self.scaler.transform(X)
         return X #self.pca.fit_transform(X)
 
+    def load_model(self):
+        # Model, fitted scaler and feature order are loaded once per process
+        if self.is_loaded:
+            return
+        with stage_timer(self.timings, 'load_model'):
+            with open(self.warm_start_model_path, 'rb') as f:
+                self.model = pickle.load(f)
+            with open(self.scaler_path, 'rb') as f:
+                artifacts = pickle.load(f)
+            self.scaler = artifacts['scaler']
+            self.features = artifacts['features']
+        self.is_loaded = True
+
     def warm_start_training(self, X_train, y_train):
+        self.features = list(X_train.columns)
         X_train = self.preprocess_train_data(X_train)
         
         self.model.fit(X_train, y_train)
         pickle.dump(self.model, open(self.warm_start_model_path, 'wb'))
+        pickle.dump({'scaler': self.scaler, 'features': self.features}, open(self.scaler_path, 'wb'))
+        self.is_loaded = True
         print("Warm start model saved.")
 
+    def warm_start_training_from_shards(self, tickers, test_size=0.2, shard_dir=SHARD_DIR):
+        """
+        Train on the per-ticker shards without concatenating them in memory.
+        The first (1 - test_size) rows of every shard are used for training.
+        """
+        shards = {}
+        self.features = []
+        seen = set()
+        for ticker in tickers:
+            try:
+                columns, features, target = load_shard(ticker, shard_dir)
+            except Exception as e:
+                print(f"Skipping shard {ticker}: {e}")
+                continue
+            shards[ticker] = (columns, features, target)
+            for col in columns:
+                if col not in seen:
+                    seen.add(col)
+                    self.features.append(col)
+
+        splits = {ticker: int(len(target) * (1 - test_size)) for ticker, (_, _, target) in shards.items()}
+
+        # Fit the scaler incrementally over the training rows
+        with stage_timer(self.timings, 'fit_scaler'):
+            self.scaler = MinMaxScaler()
+            for ticker, (columns, features, _) in shards.items():
+                sequence = ShardSequence(features, columns, self.features, None, 0, splits[ticker])
+                for start in range(0, len(sequence), sequence.batch_size):
+                    self.scaler.partial_fit(sequence[start:start + sequence.batch_size])
+
+        train_sequences = []
+        labels = []
+        for ticker, (columns, features, target) in shards.items():
+            if splits[ticker] == 0:
+                continue
+            train_sequences.append(ShardSequence(features, columns, self.features, self.scaler, 0, splits[ticker]))
+            labels.append(np.asarray(target[:splits[ticker]]))
+        labels = np.concatenate(labels)
+
+        print('======Warm Start Train Set Datapoints======')
+        print(len(labels))
+
+        params = self.model.get_params()
+        train_params = {
+            'objective': 'binary',
+            'learning_rate': params['learning_rate'],
+            'max_depth': params['max_depth'],
+            'num_leaves': params['num_leaves'],
+            'num_threads': params['n_jobs'],
+            'seed': params['random_state'],
+            'verbose': -1,
+        }
+        with stage_timer(self.timings, 'train'):
+            dataset = lgb.Dataset(train_sequences, label=labels, free_raw_data=True)
+            self.model = lgb.train(train_params, dataset, num_boost_round=params['n_estimators'])
+
+        pickle.dump(self.model, open(self.warm_start_model_path, 'wb'))
+        pickle.dump({'scaler': self.scaler, 'features': self.features}, open(self.scaler_path, 'wb'))
+        self.is_loaded = True
+        print(f"Warm start model saved. {self.timings}")
+
+        # Evaluate on the held-out tail of every shard, one shard at a time
+        probabilities = []
+        y_test = []
+        for ticker, (columns, features, target) in shards.items():
+            if splits[ticker] == len(target):
+                continue
+            sequence = ShardSequence(features, columns, self.features, self.scaler, splits[ticker], len(target))
+            probabilities.append(self.predict_proba(sequence[0:len(sequence)]))
+            y_test.append(np.asarray(target[splits[ticker]:]))
+        if probabilities:
+            self.compute_metrics(np.concatenate(y_test), np.concatenate(probabilities), verbose=True)
+
+    def predict_proba(self, X):
+        # Class-1 probabilities for both the sklearn wrapper and a raw Booster trained from shards
+        if isinstance(self.model, lgb.Booster):
+            return self.model.predict(X)
+        return self.model.predict_proba(X)[:, 1]
+
     def fine_tune_model(self, X_train, y_train):
         X_train = self.preprocess_train_data(X_train)
         
@@ -62,13 +241,49 @@ class ScorePredictor:
         print("Model fine-tuned (not saved).")
 
     def evaluate_model(self, X_test, y_test):
+        self.load_model()
         X_test = self.preprocess_test_data(X_test)
-        
-        with open(self.warm_start_model_path, 'rb') as f:
-            self.model = pickle.load(f)
 
-        test_predictions = self.model.predict_proba(X_test)
-        class_1_probabilities = test_predictions[:, 1]
+        class_1_probabilities = self.predict_proba(X_test)
+        return self.compute_metrics(y_test, class_1_probabilities, verbose=True)
+
+    def batch_evaluate(self, test_sets):
+        """
+        Score every ticker with a single predict_proba call.
+
+        test_sets maps ticker -> (X_test DataFrame, y_test). Rows are aligned to the
+        training feature order, stacked into one matrix and the per-ticker metrics are
+        derived from slices of the batched probabilities.
+        """
+        self.load_model()
+        if not test_sets:
+            return {}
+
+        with stage_timer(self.timings, 'stack'):
+            tickers = list(test_sets.keys())
+            blocks = [test_sets[ticker][0].reindex(columns=self.features).to_numpy(dtype=np.float64) for ticker in tickers]
+            offsets = np.cumsum([0] + [len(block) for block in blocks])
+            X = np.vstack(blocks)
+
+        with stage_timer(self.timings, 'preprocess'):
+            X = self.preprocess_test_data(X)
+
+        with stage_timer(self.timings, 'predict'):
+            class_1_probabilities = self.predict_proba(X)
+
+        results = {}
+        with stage_timer(self.timings, 'metrics'):
+            for i, ticker in enumerate(tickers):
+                y_test = np.asarray(test_sets[ticker][1])
+                try:
+                    results[ticker] = self.compute_metrics(y_test, class_1_probabilities[offsets[i]:offsets[i+1]])
+                except Exception as e:
+                    print(f"Error scoring {ticker}: {e}")
+
+        print(f"Batch scoring of {len(tickers)} tickers ({len(X)} rows): {self.timings}")
+        return results
+
+    def compute_metrics(self, y_test, class_1_probabilities, verbose=False):
         binary_predictions = (class_1_probabilities >= 0.5).astype(int)
 
         # Calculate and print metrics
@@ -78,15 +293,16 @@ class ScorePredictor:
         test_recall_score = recall_score(y_test, binary_predictions)
         test_roc_auc_score = roc_auc_score(y_test, binary_predictions)
 
-        print(f"Test Precision: {round(test_precision * 100)}%")
-        print(f"Test Accuracy: {round(test_accuracy * 100)}%")
-        print(f"F1 Score: {round(test_f1_score * 100)}%")
-        print(f"Recall: {round(test_recall_score * 100)}%")
-        print(f"ROC AUC: {round(test_roc_auc_score * 100)}%")
-
         last_prediction_prob = class_1_probabilities[-1]
-        print(pd.DataFrame({'y_test': y_test, 'y_pred': binary_predictions}))
-        print(f"Last prediction probability: {last_prediction_prob}")
+
+        if verbose:
+            print(f"Test Precision: {round(test_precision * 100)}%")
+            print(f"Test Accuracy: {round(test_accuracy * 100)}%")
+            print(f"F1 Score: {round(test_f1_score * 100)}%")
+            print(f"Recall: {round(test_recall_score * 100)}%")
+            print(f"ROC AUC: {round(test_roc_auc_score * 100)}%")
+            print(pd.DataFrame({'y_test': y_test, 'y_pred': binary_predictions}))
+            print(f"Last prediction probability: {last_prediction_prob}")
 
         thresholds = [0.8, 0.75, 0.7, 0.6, 0.5, 0.45, 0.4, 0.35, 0.3, 0]
         scores = [10, 9, 8, 7, 6, 5, 4, 3, 2, 1]
@@ -16,6 +16,7 @@ import hashlib
 import glob
 from tqdm import tqdm
 from utils.country_list import country_list
+from utils.quote_store import QuoteStore, load_quote
 
 from dotenv import load_dotenv
 import os
@@ -433,19 +434,28 @@ async def get_stock_screener(con):
 
     # Iterate through stock_screener_data and update 'price' and 'changesPercentage' if symbols match
     # Add VaR value to stock screener
+    # One sequential read of the quote snapshot instead of one file per symbol
+    quote_dict = QuoteStore().all()
+
+    # Latest VaR of every symbol from the bulk artifact written by cron_var
+    try:
+        with open("json/var-history/latest.json", 'rb') as file:
+            var_dict = orjson.loads(file.read())
+    except:
+        var_dict = {}
+
     for item in tqdm(stock_screener_data):
         symbol = item['symbol']
 
         try:
-            with open(f"json/quote/{symbol}.json", 'r') as file:
-                res = orjson.loads(file.read())
-                item['price'] = round(float(res['price']),2)
-                item['changesPercentage'] = round(float(res['changesPercentage']),2)
-                item['avgVolume'] = int(res['avgVolume'])
-                item['volume'] = int(res['volume'])
-                item['relativeVolume'] = round(( item['volume'] / item['avgVolume'] )*100,2)
-                item['pe'] = round(float(res['pe']),2)
-                item['marketCap'] = int(res['marketCap'])
+            res = quote_dict.get(symbol) or load_quote(symbol)
+            item['price'] = round(float(res['price']),2)
+            item['changesPercentage'] = round(float(res['changesPercentage']),2)
+            item['avgVolume'] = int(res['avgVolume'])
+            item['volume'] = int(res['volume'])
+            item['relativeVolume'] = round(( item['volume'] / item['avgVolume'] )*100,2)
+            item['pe'] = round(float(res['pe']),2)
+            item['marketCap'] = int(res['marketCap'])
         except:
             item['price'] = None
             item['changesPercentage'] = None
@@ -503,11 +513,7 @@ async def get_stock_screener(con):
             item['cagr3YearEPS'] = None
             item['cagr5YearEPS'] = None
 
-        try:
-            with open(f"json/var/{symbol}.json", 'r') as file:
-                item['var'] = orjson.loads(file.read())['history'][-1]['var']
-        except:
-            item['var'] = None
+        item['var'] = var_dict.get(symbol, {}).get('var')
 
         try:
             with open(f"json/enterprise-values/{symbol}.json", 'r') as file:
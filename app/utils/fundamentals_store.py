@@ -0,0 +1,129 @@
+import os
+import orjson
+import pandas as pd
+
+
+STATEMENT_DIR = "json/financial-statements"
+PANEL_DIR = "json/fundamentals-panel"
+
+# Column precedence when the same key appears in several statements: first statement wins
+STATEMENTS = [
+    'income-statement',
+    'income-statement-growth',
+    'balance-sheet-statement',
+    'balance-sheet-statement-growth',
+    'cash-flow-statement',
+    'cash-flow-statement-growth',
+    'ratios',
+    'key-metrics',
+]
+
+IGNORE_KEYS = ["symbol", "reportedCurrency", "calendarYear", "fillingDate", "acceptedDate", "period", "cik", "link", "finalLink"]
+
+
+def statement_path(statement, symbol, period='quarter'):
+    return f"{STATEMENT_DIR}/{statement}/{period}/{symbol}.json"
+
+
+def panel_path(symbol):
+    return f"{PANEL_DIR}/{symbol}.pkl"
+
+
+def is_panel_fresh(symbol):
+    # The panel is only rebuilt when one of the statement files was rewritten after it
+    try:
+        built_at = os.path.getmtime(panel_path(symbol))
+    except OSError:
+        return False
+    for statement in STATEMENTS:
+        try:
+            if os.path.getmtime(statement_path(statement, symbol)) > built_at:
+                return False
+        except OSError:
+            continue
+    return True
+
+
+def build_panel(symbol, year_threshold=2000):
+    """
+    Merge every quarterly statement of a symbol into one frame keyed by fiscal date.
+    panel.attrs['sources'] maps each column to the statements that contain it.
+    """
+    panel = None
+    sources = {}
+    for statement in STATEMENTS:
+        try:
+            with open(statement_path(statement, symbol), 'rb') as file:
+                data = orjson.loads(file.read())
+        except (OSError, ValueError):
+            continue
+        if not data:
+            continue
+
+        df = pd.DataFrame(data).drop(columns=IGNORE_KEYS, errors='ignore')
+        df = df[df['date'].str[:4].astype(int) >= year_threshold].drop_duplicates(subset='date')
+        for col in df.columns:
+            if col != 'date':
+                sources.setdefault(col, []).append(statement)
+
+        if panel is None:
+            panel = df
+        else:
+            new_columns = ['date'] + [col for col in df.columns if col not in panel.columns]
+            panel = panel.merge(df[new_columns], on='date', how='outer')
+
+    if panel is None:
+        return None
+
+    panel = panel.sort_values('date').reset_index(drop=True)
+    panel.attrs['sources'] = sources
+    return panel
+
+
+def load_panel(symbol):
+    """
+    Return the materialized quarterly panel, rebuilding it only when a statement file changed.
+    """
+    if is_panel_fresh(symbol):
+        try:
+            return pd.read_pickle(panel_path(symbol))
+        except Exception:
+            pass
+
+    panel = build_panel(symbol)
+    if panel is not None:
+        os.makedirs(PANEL_DIR, exist_ok=True)
+        tmp_path = f"{panel_path(symbol)}.tmp"
+        panel.to_pickle(tmp_path)
+        os.replace(tmp_path, panel_path(symbol))
+    return panel
+
+
+def select_statements(panel, statements, ignore_keys=()):
+    # Keep the columns that come from the given statements
+    sources = panel.attrs.get('sources', {})
+    columns = ['date'] + [col for col in panel.columns
+                          if col != 'date' and col not in ignore_keys
+                          and any(statement in statements for statement in sources.get(col, []))]
+    return panel[columns]
+
+
+def asof_join(panel, prices, tolerance_days=10):
+    """
+    Attach the latest price row on or before each fiscal date (within tolerance_days).
+    Both frames use 'YYYY-MM-DD' strings in their 'date' column.
+    """
+    left = panel.copy()
+    left['_date'] = pd.to_datetime(left['date'])
+    right = prices.drop(columns=[col for col in prices.columns if col in left.columns and col != 'date'])
+    right = right.rename(columns={'date': '_price_date'})
+    right['_date'] = pd.to_datetime(right['_price_date'])
+
+    merged = pd.merge_asof(
+        left.sort_values('_date'),
+        right.sort_values('_date'),
+        on='_date',
+        direction='backward',
+        tolerance=pd.Timedelta(days=tolerance_days),
+    )
+    return merged.drop(columns=['_date', '_price_date']).reset_index(drop=True)
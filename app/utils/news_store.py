@@ -0,0 +1,114 @@
+import os
+import gzip
+import sqlite3
+import hashlib
+import orjson
+from datetime import datetime, timedelta
+
+
+NEWS_DIR = "json/market-news"
+SEEN_INDEX_PATH = f"{NEWS_DIR}/seen.db"
+EXCLUDED_DOMAINS = ['prnewswire.com', 'globenewswire.com', 'accesswire.com']
+
+
+def filter_and_deduplicate(data, excluded_domains=None, deduplicate_key='title'):
+    """
+    Filter out items with specified domains in their URL and remove duplicates based on a specified key.
+    """
+    if excluded_domains is None:
+        excluded_domains = EXCLUDED_DOMAINS
+    seen_keys = set()
+    filtered_data = []
+    for item in data:
+        if not any(domain in item['url'] for domain in excluded_domains):
+            key = item.get(deduplicate_key)
+            if key and key not in seen_keys:
+                filtered_data.append(item)
+                seen_keys.add(key)
+    return filtered_data
+
+
+class SeenIndex:
+    """
+    Persistent hashes of the (scope, url) and (scope, title) pairs that were already ingested.
+    """
+
+    def __init__(self, path=SEEN_INDEX_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.con = sqlite3.connect(path)
+        self.con.execute("PRAGMA journal_mode = wal")
+        self.con.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, seen_date TEXT)")
+        self.today = datetime.now().strftime('%Y-%m-%d')
+
+    @staticmethod
+    def _keys(scope, item):
+        return [hashlib.sha1(f"{scope}\x1f{field}\x1f{item.get(field)}".encode('utf-8')).hexdigest() for field in ('url', 'title')]
+
+    def new_items(self, scope, items):
+        """
+        Drop the items whose url or title was seen before for this scope.
+        Nothing is recorded; call mark_seen() once the returned items have been stored.
+        """
+        item_keys = [self._keys(scope, item) for item in items]
+        flat = list({key for keys in item_keys for key in keys})
+        known = set()
+        for i in range(0, len(flat), 500):
+            batch = flat[i:i + 500]
+            known.update(row[0] for row in self.con.execute(f"SELECT key FROM seen WHERE key IN ({','.join('?' * len(batch))})", batch))
+
+        res = []
+        for item, keys in zip(items, item_keys):
+            if not any(key in known for key in keys):
+                res.append(item)
+                known.update(keys)
+        return res
+
+    def mark_seen(self, scope, items):
+        self.con.executemany("INSERT OR IGNORE INTO seen VALUES (?, ?)", [(key, self.today) for item in items for key in self._keys(scope, item)])
+
+    def commit(self):
+        self.con.commit()
+
+    def prune(self, max_age_days=30):
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime('%Y-%m-%d')
+        self.con.execute("DELETE FROM seen WHERE seen_date < ?", (cutoff,))
+        self.con.commit()
+
+    def close(self):
+        self.con.close()
+
+
+def merge_news(existing, new_items, maxlen):
+    """
+    Bounded ring buffer: newest items first, duplicates by title dropped, at most maxlen entries.
+    """
+    combined = sorted(new_items + existing, key=lambda item: item.get('publishedDate') or '', reverse=True)
+    return filter_and_deduplicate(combined, excluded_domains=[])[:maxlen]
+
+
+def load_news(path):
+    try:
+        with open(path, 'rb') as file:
+            return orjson.loads(file.read())
+    except (OSError, ValueError):
+        return []
+
+
+def write_payload(path, data):
+    """
+    Write the json file and the precompressed copy the API serves, only if the content changed.
+    Returns True when the files were rewritten.
+    """
+    content = orjson.dumps(data)
+    try:
+        with open(path, 'rb') as file:
+            if file.read() == content and os.path.exists(f"{path}.gz"):
+                return False
+    except OSError:
+        pass
+
+    for target, payload in ((path, content), (f"{path}.gz", gzip.compress(content))):
+        with open(f"{target}.tmp", 'wb') as file:
+            file.write(payload)
+        os.replace(f"{target}.tmp", target)
+    return True
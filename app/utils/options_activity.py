@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import orjson
+import concurrent.futures
+from collections import defaultdict
+
+
+EXCLUDED_KEYS = {'description_extended', 'updated'}
+TICKER_ALIASES = {'BRK.A': 'BRK-A', 'BRK.B': 'BRK-B'}
+PRICE_KEYS = ('price', 'strike_price', 'cost_basis', 'underlying_price')
+
+
+def load_symbol_sets():
+    # Sets instead of lists: every record is classified with two O(1) lookups
+    symbol_sets = []
+    for db_path, table in (('stocks.db', 'stocks'), ('etf.db', 'etfs')):
+        con = sqlite3.connect(db_path)
+        symbol_sets.append({row[0] for row in con.execute(f"SELECT DISTINCT symbol FROM {table}")})
+        con.close()
+    return tuple(symbol_sets)
+
+
+def classify(ticker, stock_symbols, etf_symbols):
+    return 'stock' if ticker in stock_symbols else ('etf' if ticker in etf_symbols else '')
+
+
+def fetch_page(fin, page, date_from, date_to, pagesize):
+    try:
+        data = fin.options_activity(date_from=date_from, date_to=date_to, page=page, pagesize=pagesize)
+        return orjson.loads(fin.output(data))['option_activity']
+    except Exception as e:
+        print(f"Exception on page {page}: {e}")
+        return None
+
+
+def fetch_pages(fin, date_from, date_to, pagesize=1000, max_workers=6, max_pages=100):
+    """
+    Fetch options activity in waves of max_workers pages and stop after the first short page.
+    Returns (records, complete); complete is False when a page failed and the result may be partial.
+    """
+    records = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for start in range(0, max_pages, max_workers):
+            pages = range(start, min(start + max_workers, max_pages))
+            results = list(executor.map(lambda page: fetch_page(fin, page, date_from, date_to, pagesize), pages))
+            for data in results:
+                if data is None:
+                    return records, False
+                records += data
+                if len(data) < pagesize:
+                    return records, True
+    return records, True
+
+
+def normalize(item):
+    """
+    Cleanup shared by every flow builder. Returns None for records without an underlying price.
+    """
+    if item.get('underlying_price', '') == '':
+        return None
+    item = {key: value for key, value in item.items() if key not in EXCLUDED_KEYS}
+    item['put_call'] = 'Calls' if item['put_call'] == 'CALL' else 'Puts'
+    item['ticker'] = TICKER_ALIASES.get(item['ticker'], item['ticker'])
+    for key in PRICE_KEYS:
+        item[key] = round(float(item[key]), 2)
+    item['sentiment'] = item['sentiment'].capitalize()
+    item['tradeCount'] = item['trade_count']
+    return item
+
+
+def sort_by_time(records):
+    return sorted(records, key=lambda item: item['time'], reverse=True)
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(orjson.dumps(data))
+    os.replace(tmp_path, path)
+
+
+def load_json(path):
+    try:
+        with open(path, 'rb') as file:
+            return orjson.loads(file.read())
+    except (OSError, ValueError):
+        return []
+
+
+def group_by_ticker(records):
+    groups = defaultdict(list)
+    for item in records:
+        groups[item['ticker']].append(item)
+    return groups
+
+
+def append_records(path, records):
+    """
+    Merge records into the file at path by id. Returns the records that were not stored yet.
+    """
+    existing = load_json(path)
+    seen = {item['id'] for item in existing}
+    new_records = [item for item in records if item['id'] not in seen]
+    if new_records or not os.path.exists(path):
+        write_json(path, sort_by_time(existing + new_records))
+    return new_records
+
+
+def write_partitions(directory, records, prune=False):
+    """
+    One file per ticker under directory. With prune, files of tickers absent from records are removed.
+    """
+    groups = group_by_ticker(records)
+    for ticker, items in groups.items():
+        write_json(f"{directory}/{ticker}.json", sort_by_time(items))
+    if prune and os.path.isdir(directory):
+        for file_name in os.listdir(directory):
+            if file_name.endswith('.json') and file_name[:-5] not in groups:
+                os.remove(f"{directory}/{file_name}")
+    return len(groups)
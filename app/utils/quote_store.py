@@ -0,0 +1,194 @@
+import os
+import numpy as np
+import orjson
+
+
+QUOTE_DIR = "json/quote"
+QUOTE_STORE_PATH = "json/quote-snapshot/data.npy"
+
+# Fixed-width text columns (utf-8 bytes) followed by the numeric columns of the FMP quote endpoint
+TEXT_FIELDS = [
+    ('symbol', 16),
+    ('name', 128),
+    ('exchange', 16),
+    ('earningsAnnouncement', 32),
+]
+
+NUMERIC_FIELDS = [
+    'price', 'changesPercentage', 'change', 'dayLow', 'dayHigh', 'yearHigh', 'yearLow',
+    'marketCap', 'priceAvg50', 'priceAvg200', 'volume', 'avgVolume', 'open',
+    'previousClose', 'eps', 'pe', 'sharesOutstanding', 'timestamp', 'ask', 'bid',
+]
+
+# Numeric columns that FMP returns as integers; restored as int on read
+INTEGER_FIELDS = {'marketCap', 'volume', 'avgVolume', 'sharesOutstanding', 'timestamp'}
+
+QUOTE_DTYPE = np.dtype(
+    [(name, f'S{width}') for name, width in TEXT_FIELDS] +
+    [(name, '<f8') for name in NUMERIC_FIELDS]
+)
+
+
+def _to_row(quote):
+    row = []
+    for name, width in TEXT_FIELDS:
+        value = quote.get(name)
+        row.append(str(value).encode('utf-8')[:width] if value is not None else b'')
+    for name in NUMERIC_FIELDS:
+        try:
+            row.append(float(quote[name]))
+        except (KeyError, TypeError, ValueError):
+            row.append(np.nan)
+    return tuple(row)
+
+
+def _from_row(row):
+    quote = {}
+    for name, _ in TEXT_FIELDS:
+        value = row[name].decode('utf-8', errors='ignore')
+        quote[name] = value if value else None
+    for name in NUMERIC_FIELDS:
+        value = float(row[name])
+        if np.isnan(value):
+            # ask/bid only exist once the bid-ask job has run, keep the JSON shape the same
+            if name not in ('ask', 'bid'):
+                quote[name] = None
+            continue
+        quote[name] = int(value) if name in INTEGER_FIELDS else value
+    return quote
+
+
+def write_quotes(quotes, path=QUOTE_STORE_PATH):
+    """
+    Write the full quote table and atomically swap it in place of the previous snapshot.
+    """
+    quotes = [item for item in quotes if item.get('symbol')]
+    table = np.array([_to_row(item) for item in quotes], dtype=QUOTE_DTYPE)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as file:
+        np.save(file, table)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def export_json_files(quotes, directory=QUOTE_DIR):
+    """
+    Adapter for consumers that still read json/quote/{symbol}.json.
+    """
+    for item in quotes:
+        symbol = item.get('symbol')
+        if not symbol:
+            continue
+        with open(f"{directory}/{symbol}.json", 'wb') as file:
+            file.write(orjson.dumps(item))
+
+
+def read_json_file(symbol, directory=QUOTE_DIR):
+    try:
+        with open(f"{directory}/{symbol}.json", 'rb') as file:
+            return orjson.loads(file.read())
+    except Exception:
+        return None
+
+
+def load_json_files(directory=QUOTE_DIR):
+    """
+    Bootstrap the snapshot from the per-symbol JSON files.
+    """
+    quotes = {}
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(f"{directory}/{filename}", 'rb') as file:
+                item = orjson.loads(file.read())
+            quotes[item['symbol']] = item
+        except Exception:
+            pass
+    return quotes
+
+
+class QuoteStore:
+    """
+    Read-only, memory-mapped view over the quote snapshot with a symbol -> row index.
+    """
+
+    def __init__(self, path=QUOTE_STORE_PATH):
+        self.path = path
+        self.signature = None
+        self.table = np.empty(0, dtype=QUOTE_DTYPE)
+        self.index = {}
+        self.reload()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except OSError:
+            return None
+
+    def reload(self):
+        # Cheap when the snapshot has not been replaced since the last call
+        signature = self._file_signature()
+        if signature == self.signature:
+            return False
+        if signature is None:
+            self.table = np.empty(0, dtype=QUOTE_DTYPE)
+            self.index = {}
+        else:
+            self.table = np.load(self.path, mmap_mode='r')
+            self.index = {symbol.decode('utf-8'): i for i, symbol in enumerate(self.table['symbol'])}
+        self.signature = signature
+        return True
+
+    def __contains__(self, symbol):
+        return symbol in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, symbol):
+        i = self.index.get(symbol)
+        if i is None:
+            return None
+        return _from_row(self.table[i])
+
+    def get_many(self, symbols):
+        res = {}
+        for symbol in symbols:
+            i = self.index.get(symbol)
+            if i is not None:
+                res[symbol] = _from_row(self.table[i])
+        return res
+
+    def column(self, name):
+        return np.asarray(self.table[name])
+
+    def all(self):
+        # One sequential pass over the mapped file
+        table = np.asarray(self.table)
+        return {row['symbol'].decode('utf-8'): _from_row(row) for row in table}
+
+
+_store = None
+
+def get_quote_store(path=QUOTE_STORE_PATH):
+    global _store
+    if _store is None or _store.path != path:
+        _store = QuoteStore(path)
+    else:
+        _store.reload()
+    return _store
+
+
+def load_quote(symbol, path=QUOTE_STORE_PATH):
+    """
+    Single-symbol lookup that falls back to the per-symbol JSON file when the snapshot has no row.
+    """
+    quote = get_quote_store(path).get(symbol)
+    if quote is not None:
+        return quote
+    return read_json_file(symbol)
@@ -0,0 +1,32 @@
+import time
+import asyncio
+
+
+class TokenBucket:
+    """
+    Async token bucket shared by every task of a job: refills `rate` tokens per second, bursts up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    def per_minute(cls, requests, burst=None):
+        # Burst plus one minute of refill never exceeds `requests`, so any 60s window stays within the limit
+        capacity = burst or max(1, requests // 10)
+        return cls((requests - capacity) / 60, capacity)
+
+    async def acquire(self, tokens=1):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import hashlib
+import orjson
+from datetime import datetime
+
+
+POST_LOG_PATH = "json/reddit-tracker/wallstreetbets/posts.db"
+LATEST_POSTS_PATH = "json/reddit-tracker/wallstreetbets/latest.json"
+
+POST_FIELDS = ['id', 'permalink', 'title', 'selftext', 'created_utc', 'upvote_ratio', 'num_comments', 'link_flair_text', 'author']
+
+
+def connect(path=POST_LOG_PATH):
+    """
+    Post log plus the cached per-post features and the materialized daily aggregates.
+    Rows marked dirty have been inserted or changed since the last statistics run.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA journal_mode = wal")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS posts (
+            id TEXT PRIMARY KEY,
+            permalink TEXT,
+            title TEXT,
+            selftext TEXT,
+            created_utc INTEGER,
+            upvote_ratio REAL,
+            num_comments INTEGER,
+            link_flair_text TEXT,
+            author TEXT,
+            day TEXT,
+            content_hash TEXT,
+            feature_hash TEXT,
+            tickers TEXT,
+            put INTEGER,
+            call INTEGER,
+            sentiment REAL,
+            dirty INTEGER DEFAULT 1
+        )
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS posts_day ON posts (day)")
+    con.execute("CREATE INDEX IF NOT EXISTS posts_created_utc ON posts (created_utc)")
+    con.execute("CREATE INDEX IF NOT EXISTS posts_dirty ON posts (dirty)")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT PRIMARY KEY,
+            post_count INTEGER,
+            total_comments INTEGER,
+            mentions TEXT
+        )
+    """)
+    return con
+
+
+def content_hash(post):
+    return hashlib.sha1(f"{post['title']}\x1f{post['selftext']}".encode('utf-8')).hexdigest()
+
+
+def upsert_posts(con, posts):
+    """
+    Append new posts and update the ones whose text, upvote ratio or comment count changed.
+    Returns the number of rows written.
+    """
+    existing = {}
+    ids = [post['id'] for post in posts]
+    for i in range(0, len(ids), 500):
+        batch = ids[i:i + 500]
+        rows = con.execute(f"SELECT id, content_hash, upvote_ratio, num_comments FROM posts WHERE id IN ({','.join('?' * len(batch))})", batch)
+        existing.update({row[0]: row[1:] for row in rows})
+
+    inserts = []
+    updates = []
+    for post in posts:
+        digest = content_hash(post)
+        if post['id'] not in existing:
+            day = datetime.utcfromtimestamp(post['created_utc']).date().isoformat()
+            inserts.append(tuple(post[key] for key in POST_FIELDS) + (day, digest))
+        elif existing[post['id']] != (digest, post['upvote_ratio'], post['num_comments']):
+            updates.append((post['title'], post['selftext'], post['upvote_ratio'], post['num_comments'], digest, post['id']))
+
+    con.executemany(f"INSERT INTO posts ({', '.join(POST_FIELDS)}, day, content_hash, dirty) VALUES ({', '.join('?' * (len(POST_FIELDS) + 2))}, 1)", inserts)
+    con.executemany("UPDATE posts SET title = ?, selftext = ?, upvote_ratio = ?, num_comments = ?, content_hash = ?, dirty = 1 WHERE id = ?", updates)
+    con.commit()
+    return len(inserts) + len(updates)
+
+
+def import_json(con, path):
+    # One-off bootstrap from the old full-history data.json
+    try:
+        with open(path, 'rb') as file:
+            posts = orjson.loads(file.read())
+    except (OSError, ValueError):
+        return 0
+    return upsert_posts(con, posts)
+
+
+def latest_posts(con, limit=25):
+    rows = con.execute(f"SELECT {', '.join(POST_FIELDS)} FROM posts ORDER BY created_utc DESC LIMIT ?", (limit,))
+    return [dict(zip(POST_FIELDS, row)) for row in rows]